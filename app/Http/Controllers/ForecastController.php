@@ -38,7 +38,13 @@ public function createForecast(Request $request)
 
         $mlService = new MLForecastService();
 
-        $forecasts = $categories->map(function ($category) use ($income, $currentMonthStart, $currentMonthEnd, $user, $date, $mlService) {
+        //  Forecast every eligible category in one Python process
+        $mlEligible = $categories->filter(function ($category) use ($user, $mlService) {
+            return $mlService->hasEnoughData($user, $category);
+        });
+        $mlForecasts = $mlService->getBatchForecasts($user, $mlEligible, $date);
+
+        $forecasts = $categories->map(function ($category) use ($income, $currentMonthStart, $currentMonthEnd, $user, $date, $mlForecasts) {
             $budgetPercentage = $category->pivot->budget_percentage ?? 0;
             $budgetedAmount = ($budgetPercentage / 100) * $income;
 
@@ -97,8 +103,8 @@ public function createForecast(Request $request)
             $totalsArray = $monthlyTotals->toArray();
             $cleanedTotals = $totalsArray;
 
-            //  Try ML forecasting first (pass target date)
-            $mlForecast = $mlService->getForecast($user, $category, $date);
+            //  Try ML forecasting first (batched above for the target date)
+            $mlForecast = $mlForecasts[$category->id] ?? null;
             $estimatedExpense = null;
             $forecastMethod = 'Statistical';
 
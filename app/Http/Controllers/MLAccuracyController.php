@@ -47,19 +47,16 @@ public function dashboard(Request $request)
             }
         }
         
-        // Check if ML service is available
+        // One cached backtest covers every category (computed by the scheduled ml:backtest command;
+        // until its first run for this user the ML service counts as unavailable)
         $mlServiceAvailable = false;
-        try {
-            if ($categories->count() > 0) {
-                $testPerformance = $this->mlService->getModelPerformance($user, $categories->first());
-                $mlServiceAvailable = true;
-                Log::info("ML service is available");
-            } else {
-                Log::warning("No categories found for user");
-            }
-        } catch (\Exception $e) {
-            $mlServiceAvailable = false;
-            Log::warning("ML service not available: " . $e->getMessage());
+        $backtestPerformance = [];
+        if ($categories->count() > 0) {
+            $backtestPerformance = $this->mlService->getBacktestPerformance($user);
+            $mlServiceAvailable = $backtestPerformance !== null;
+            Log::info($mlServiceAvailable ? "ML service is available" : "ML backtest metrics not computed yet");
+        } else {
+            Log::warning("No categories found for user");
         }
         
         $mlPerformance = [];
@@ -73,8 +70,14 @@ public function dashboard(Request $request)
                     $userCategoryExpensesCount = $user->expenses()->where('category_id', $category->id)->count();
                     Log::info("Category {$category->name} - user expense rows: {$userCategoryExpensesCount}");
 
-                    $performance = $this->mlService->getModelPerformance($user, $category);
-                    $hasEnoughData = $this->mlService->hasEnoughData($user, $category);
+                    $performance = $backtestPerformance[$category->id]['performance'] ?? [
+                        'mae' => 0,
+                        'mape' => 0,
+                        'rmse' => 0,
+                        'r2_score' => 0
+                    ];
+                    $hasEnoughData = $this->mlService->hasEnoughData($user, $category)
+                        && isset($backtestPerformance[$category->id]);
                     
                     Log::info("Category {$category->name} - Performance: " . json_encode($performance) . ", Has enough data: " . ($hasEnoughData ? 'Yes' : 'No'));
                     
@@ -216,14 +219,16 @@ private function getMLForecastsForDate(User $user, Carbon $date): array
         $categories = $user->categories()->withTrashed()->get();
         $forecasts = [];
         
-        foreach ($categories as $category) {
-            $forecast = $this->mlService->getForecast($user, $category);
-            if ($forecast && isset($forecast['prediction'])) {
-                $forecasts[$category->id] = [
-                    'estimated_expense' => $forecast['prediction'],
-                    'method' => 'ML'
-                ];
-            }
+        // One Python process for all categories instead of one per category
+        $eligible = $categories->filter(function ($category) use ($user) {
+            return $this->mlService->hasEnoughData($user, $category);
+        });
+        
+        foreach ($this->mlService->getBatchForecasts($user, $eligible) as $categoryId => $forecast) {
+            $forecasts[$categoryId] = [
+                'estimated_expense' => $forecast['prediction'],
+                'method' => 'ML'
+            ];
         }
         
         return $forecasts;
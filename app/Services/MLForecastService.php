@@ -11,6 +11,9 @@
 
 class MLForecastService
 {
+    // Backtests refit the forest and boosting models every this many cutoffs (the linear model walks every month)
+    private const BACKTEST_REFIT_EVERY = 3;
+    
     public $pythonPath;
     public $scriptPath;
     
@@ -36,25 +39,12 @@ public function getForecast(User $user, Category $category, $targetDate = null)
             $targetMonth = $targetDate->format('n'); // 1-12
             $targetYear = $targetDate->format('Y');
             
-            // Try to get prediction from saved model first (no cache)
+            // Try to get prediction from saved model first (no cache); it already rejects invalid models
             $savedModelResult = $this->getPredictionFromSavedModel($user, $category, $targetDate);
             if ($savedModelResult && isset($savedModelResult['prediction']) && $savedModelResult['prediction'] > 0) {
-                // Verify data_points to ensure we're using monthly aggregated model
                 $dataPoints = $savedModelResult['data_points'] ?? 0;
-                // CRITICAL: Reject models trained on individual transactions (data_points > 10)
-                // Monthly aggregated models should have <= 10 data points (one per month)
-                if ($dataPoints > 10) {
-                    Log::warning("Rejecting saved model trained on individual transactions: data_points={$dataPoints} (should be <=10 for monthly data). Forcing retrain for user {$user->id}, category {$category->name}");
-                    // Delete the invalid model file to force fresh training
-                    $modelPath = storage_path("app/ml_models/forecast_user_{$user->id}_cat_{$category->id}.pkl");
-                    if (file_exists($modelPath)) {
-                        unlink($modelPath);
-                        Log::info("Deleted invalid model file: {$modelPath}");
-                    }
-                } else {
-                    Log::info("Using saved ML model for user {$user->id}, category {$category->name}, target: {$targetDate->format('Y-m')}, data_points: {$dataPoints}");
-                    return $savedModelResult;
-                }
+                Log::info("Using saved ML model for user {$user->id}, category {$category->name}, target: {$targetDate->format('Y-m')}, data_points: {$dataPoints}");
+                return $savedModelResult;
             }
             
             // Fall back to fresh training (no cache to force fresh predictions)
@@ -71,6 +61,123 @@ public function getForecast(User $user, Category $category, $targetDate = null)
         }
     }
     
+    /**
+     * Get ML forecasts for several categories of a user with a single Python process
+     * (or a single request to the resident forecast server when one is configured)
+     *
+     * Returns an array keyed by category id. Categories without a usable forecast (including results
+     * rejected by the same data_points check as getForecast()) are omitted, so callers can fall back
+     * to statistical methods exactly as with getForecast().
+     * With $horizon > 1 each result also carries 'forecasts': one entry (month, year, prediction)
+     * per month starting at the target month, computed from a single data fetch per category.
+     */
+    public function getBatchForecasts(User $user, $categories, $targetDate = null, int $horizon = 1): array
+    {
+        $forecasts = [];
+        
+        try {
+            $targetDate = $targetDate ?: now();
+            $targetMonth = $targetDate->format('n'); // 1-12
+            $targetYear = $targetDate->format('Y');
+            
+            $categoriesById = collect($categories)->keyBy('id');
+            $pairs = collect($categories)->map(function ($category) use ($user) {
+                return $user->id . ':' . $category->id;
+            })->implode(',');
+            
+            if ($pairs === '') {
+                return $forecasts;
+            }
+            
+            $results = $this->callForecastServer('batch', [
+                'pairs' => collect($categories)->map(function ($category) use ($user) {
+                    return [$user->id, $category->id];
+                })->values()->all(),
+                'target_month' => (int) $targetMonth,
+                'target_year' => (int) $targetYear,
+                'horizon' => max(1, $horizon),
+            ]);
+            
+            if ($results === null || isset($results['error'])) {
+                $results = $this->runBatchScript($pairs, $targetMonth, $targetYear, $horizon);
+            }
+            
+            foreach ($results as $result) {
+                if (!is_array($result) || !isset($result['category_id'])) {
+                    continue;
+                }
+                
+                if (isset($result['error'])) {
+                    Log::info("Batch ML forecast unavailable for category {$result['category_id']}: {$result['error']}");
+                    continue;
+                }
+                
+                if (!isset($result['prediction']) || $result['prediction'] <= 0) {
+                    continue;
+                }
+                
+                $category = $categoriesById->get((int) $result['category_id']);
+                if ($category === null || $this->rejectsTransactionModel($user, $category, $result)) {
+                    continue;
+                }
+                
+                // No usable saved model: queue background training for future use, as getForecast() does
+                if (($result['method'] ?? null) === 'Machine Learning (Fresh)') {
+                    TrainMLModelJob::dispatch($user, $category, 'forecast');
+                }
+                
+                $forecasts[(int) $result['category_id']] = $result;
+            }
+        } catch (\Exception $e) {
+            Log::error("Batch ML forecast failed for user {$user->id}: " . $e->getMessage());
+        }
+        
+        return $forecasts;
+    }
+    
+    /**
+     * Run forecast.py in batch mode and decode its JSON-lines output
+     */
+    private function runBatchScript(string $pairs, $targetMonth, $targetYear, int $horizon = 1): array
+    {
+        $dbConfig = $this->getMySQLDatabaseConfig();
+        
+        $command = sprintf(
+            '%s %s --batch --pairs %s --model-storage-path %s --db-type mysql --db-host %s --db-port %s --db-name %s --db-user %s --db-password %s --target-month %d --target-year %d --horizon %d',
+            escapeshellarg($this->pythonPath),
+            escapeshellarg($this->scriptPath),
+            escapeshellarg($pairs),
+            escapeshellarg(storage_path('app/ml_models')),
+            escapeshellarg($dbConfig['host']),
+            escapeshellarg($dbConfig['port']),
+            escapeshellarg($dbConfig['database']),
+            escapeshellarg($dbConfig['username']),
+            escapeshellarg($dbConfig['password']),
+            $targetMonth,
+            $targetYear,
+            max(1, $horizon)
+        ) . $this->metricsOption() . $this->pooledOption();
+        
+        Log::info("Executing batch ML forecast, pairs: {$pairs}");
+        $output = shell_exec($command);
+        
+        if ($output === null) {
+            Log::error("Batch ML script execution failed");
+            return [];
+        }
+        
+        // One JSON object per line; anything else (warnings etc.) is skipped
+        $results = [];
+        foreach (preg_split('/\r?\n/', trim($output)) as $line) {
+            $result = json_decode($line, true);
+            if (is_array($result)) {
+                $results[] = $result;
+            }
+        }
+        
+        return $results;
+    }
+    
     /**
      * Check if there's enough data for ML forecasting
      */
@@ -82,7 +189,8 @@ public function hasEnoughData(User $user, Category $category): bool
             
         Log::info("ML Data Check - User: {$user->id}, Category: {$category->name}, Expense Count: {$expenseCount}");
         
-        return $expenseCount >= 6; // Need at least 6 months of data
+        // A pooled model forecasts from any history; a model of the pair's own needs at least 6 months of data
+        return $expenseCount >= ($this->pooledScope() ? 1 : 6);
     }
     
     /**
@@ -91,10 +199,10 @@ public function hasEnoughData(User $user, Category $category): bool
     private function getPredictionFromSavedModel(User $user, Category $category, $targetDate = null)
     {
         // Check if model file exists directly (bypass database to avoid sync issues)
-        $modelPath = storage_path("app/ml_models/forecast_user_{$user->id}_cat_{$category->id}.pkl");
+        $modelPath = $this->savedModelPath($user, $category);
         
-        if (!file_exists($modelPath)) {
-            Log::info("Model file not found at: {$modelPath}");
+        if ($modelPath === null) {
+            Log::info("Model file not found for user {$user->id}, category {$category->id}");
             return null;
         }
         
@@ -129,28 +237,35 @@ private function getPredictionFromSavedModel(User $user, Category $category, $ta
                 escapeshellarg($dbConfig['password']),
                 $user->id,
                 $category->id
-            );
+            ) . $this->metricsOption() . $this->timeBudgetOption() . $this->pooledOption();
             
             // Add target month/year if provided
             if ($targetMonth && $targetYear) {
                 $command .= sprintf(' --target-month %d --target-year %d', $targetMonth, $targetYear);
             }
             
-            Log::info("Calling Python script for prediction: user_id={$user->id}, category_id={$category->id}, target={$targetMonth}/{$targetYear}");
-            $output = shell_exec($command . ' 2>&1');
-            Log::info("Python script output: " . substr($output, 0, 500));
+            $result = $this->callForecastServer('forecast', [
+                'user_id' => $user->id,
+                'category_id' => $category->id,
+                'target_month' => $targetMonth ? (int) $targetMonth : null,
+                'target_year' => $targetYear ? (int) $targetYear : null,
+                'time_budget_ms' => $this->timeBudgetMs(),
+            ]);
             
-            $result = json_decode($output, true);
+            if ($result === null) {
+                Log::info("Calling Python script for prediction: user_id={$user->id}, category_id={$category->id}, target={$targetMonth}/{$targetYear}");
+                $output = shell_exec($command);
+                Log::info("Python script output: " . substr($output, 0, 500));
+                
+                $result = json_decode($output, true);
+            }
             
             if ($result && !isset($result['error']) && isset($result['prediction'])) {
                 // Verify the result has correct data_points before returning
                 $dataPoints = $result['data_points'] ?? 0;
                 $prediction = $result['prediction'] ?? 0;
                 
-                // CRITICAL: Reject models trained on individual transactions (data_points > 10)
-                // Monthly aggregated models should have <= 10 data points (one per month)
-                if ($dataPoints > 10) {
-                    Log::warning("Rejecting saved model trained on individual transactions: data_points={$dataPoints} (should be <=10 for monthly data). Forcing retrain.");
+                if ($this->rejectsTransactionModel($user, $category, $result)) {
                     return null;
                 }
                 
@@ -195,22 +310,32 @@ private function trainAndForecast(User $user, Category $category, $targetDate =
             $category->id,
             $targetMonth,
             $targetYear
-        );
-        
-        Log::info("Executing ML command: " . $command);
+        ) . $this->metricsOption() . $this->timeBudgetOption() . $this->pooledOption();
         
-        $output = shell_exec($command);
-        Log::info("ML forecast output: " . $output);
+        $result = $this->callForecastServer('forecast', [
+            'user_id' => $user->id,
+            'category_id' => $category->id,
+            'target_month' => (int) $targetMonth,
+            'target_year' => (int) $targetYear,
+            'time_budget_ms' => $this->timeBudgetMs(),
+        ]);
         
-        if ($output === null) {
-            Log::error("ML script execution failed");
-            return null;
-        }
-        
-        $result = json_decode($output, true);
-        if (json_last_error() !== JSON_ERROR_NONE) {
-            Log::error("Failed to parse ML output JSON: " . json_last_error_msg());
-            return null;
+        if ($result === null) {
+            Log::info("Executing ML command: " . $command);
+            
+            $output = shell_exec($command);
+            Log::info("ML forecast output: " . $output);
+            
+            if ($output === null) {
+                Log::error("ML script execution failed");
+                return null;
+            }
+            
+            $result = json_decode($output, true);
+            if (json_last_error() !== JSON_ERROR_NONE) {
+                Log::error("Failed to parse ML output JSON: " . json_last_error_msg());
+                return null;
+            }
         }
         
         if (isset($result['error'])) {
@@ -219,21 +344,36 @@ private function trainAndForecast(User $user, Category $category, $targetDate =
         }
         
         // CRITICAL: Validate data_points for ALL results (Cached or Fresh)
-        $dataPoints = $result['data_points'] ?? 0;
-        if ($dataPoints > 10) {
-            Log::warning("Rejecting ML result trained on individual transactions: data_points={$dataPoints} (should be <=10 for monthly data). User: {$user->id}, Category: {$category->name}");
-            // Delete the invalid model file if it exists
-            $modelPath = storage_path("app/ml_models/forecast_user_{$user->id}_cat_{$category->id}.pkl");
-            if (file_exists($modelPath)) {
-                unlink($modelPath);
-                Log::info("Deleted invalid model file: {$modelPath}");
-            }
+        if ($this->rejectsTransactionModel($user, $category, $result)) {
             return null; // Force fallback to statistical method
         }
         
         return $result;
     }
     
+    /**
+     * Reject results of models trained on individual transactions (data_points > 10)
+     *
+     * Monthly aggregated models should have <= 10 data points (one per month). The invalid model
+     * file is deleted so the next forecast trains a fresh one. Shared by getForecast() and
+     * getBatchForecasts() so both paths accept the same results.
+     */
+    private function rejectsTransactionModel(User $user, Category $category, array $result): bool
+    {
+        $dataPoints = $result['data_points'] ?? 0;
+        if ($dataPoints <= 10) {
+            return false;
+        }
+        
+        Log::warning("Rejecting ML result trained on individual transactions: data_points={$dataPoints} (should be <=10 for monthly data). User: {$user->id}, Category: {$category->name}");
+        $modelPath = $this->savedModelPath($user, $category);
+        if ($modelPath !== null) {
+            unlink($modelPath);
+            Log::info("Deleted invalid model file: {$modelPath}");
+        }
+        return true;
+    }
+    
     /**
      * Get ML model performance metrics with caching
      */
@@ -285,7 +425,26 @@ private function calculateModelPerformance(User $user, Category $category)
             escapeshellarg($dbConfig['password']),
             $user->id,
             $category->id
-        );
+        ) . $this->metricsOption();
+        
+        $result = $this->callForecastServer('performance', [
+            'user_id' => $user->id,
+            'category_id' => $category->id,
+            'aggregate_monthly' => true,
+        ]);
+        
+        if ($result !== null) {
+            if (isset($result['error'])) {
+                Log::error("ML performance server returned error: " . $result['error']);
+                return [
+                    'mae' => 0,
+                    'mape' => 0,
+                    'rmse' => 0,
+                    'r2_score' => 0
+                ];
+            }
+            return $result;
+        }
         
         Log::info("Executing ML performance command: " . $command);
         
@@ -326,6 +485,285 @@ private function calculateModelPerformance(User $user, Category $category)
         return $result;
     }
     
+    /**
+     * Rolling-origin backtest metrics for every category of a user, as last computed by refreshBacktestPerformance()
+     *
+     * Returns an array keyed by category id with 'performance' (mae, mape, rmse, r2_score of the
+     * best model), 'best_model' and 'cutoffs', or null when no backtest has been cached yet.
+     * Only reads the cache: backtests run from the scheduled `ml:backtest` command, never while a page waits.
+     */
+    public function getBacktestPerformance(User $user): ?array
+    {
+        $cached = Cache::get($this->backtestCacheKey($user));
+        return is_array($cached) ? $cached : null;
+    }
+    
+    /**
+     * Run one backtest over every category of a user and cache its metrics for getBacktestPerformance()
+     *
+     * Categories without enough history are omitted. Returns the cached metrics, or null when the
+     * backtest could not be run.
+     */
+    public function refreshBacktestPerformance(User $user): ?array
+    {
+        try {
+            $result = $this->callForecastServer('backtest', [
+                'user_id' => $user->id,
+                'refit_every' => self::BACKTEST_REFIT_EVERY,
+            ]);
+            if ($result === null) {
+                $result = $this->runBacktestScript($user);
+            }
+            
+            if ($result === null || isset($result['error'])) {
+                Log::error("ML backtest failed for user {$user->id}: " . ($result['error'] ?? 'no output'));
+                return null;
+            }
+            
+            $performance = [];
+            foreach ($result['categories'] ?? [] as $entry) {
+                if (!isset($entry['category_id']) || isset($entry['error'])) {
+                    continue;
+                }
+                
+                $performance[(int) $entry['category_id']] = [
+                    'performance' => $entry['performance'],
+                    'best_model' => $entry['best_model'],
+                    'cutoffs' => $entry['cutoffs'],
+                ];
+            }
+            
+            // Kept until the next refresh (or clearCache()); two days covers a missed daily run
+            Cache::put($this->backtestCacheKey($user), $performance, 172800);
+            return $performance;
+        } catch (\Exception $e) {
+            Log::error("ML backtest failed for user {$user->id}: " . $e->getMessage());
+            return null;
+        }
+    }
+    
+    /**
+     * Cache key of a user's backtest metrics
+     */
+    private function backtestCacheKey(User $user): string
+    {
+        return "ml_backtest_{$user->id}";
+    }
+    
+    /**
+     * Run forecast.py --backtest for all categories of a user and decode its JSON output
+     */
+    private function runBacktestScript(User $user): ?array
+    {
+        $dbConfig = $this->getMySQLDatabaseConfig();
+        
+        $command = sprintf(
+            '%s %s --backtest --user-id %d --refit-every %d --model-storage-path %s --db-type mysql --db-host %s --db-port %s --db-name %s --db-user %s --db-password %s',
+            escapeshellarg($this->pythonPath),
+            escapeshellarg($this->scriptPath),
+            $user->id,
+            self::BACKTEST_REFIT_EVERY,
+            escapeshellarg(storage_path('app/ml_models')),
+            escapeshellarg($dbConfig['host']),
+            escapeshellarg($dbConfig['port']),
+            escapeshellarg($dbConfig['database']),
+            escapeshellarg($dbConfig['username']),
+            escapeshellarg($dbConfig['password'])
+        ) . $this->metricsOption();
+        
+        Log::info("Executing ML backtest for user {$user->id}");
+        $output = shell_exec($command);
+        
+        if ($output === null) {
+            Log::error("ML backtest script execution failed");
+            return null;
+        }
+        
+        $result = json_decode($output, true);
+        if (json_last_error() !== JSON_ERROR_NONE) {
+            Log::error("Failed to parse ML backtest output JSON: " . json_last_error_msg());
+            return null;
+        }
+        
+        return $result;
+    }
+    
+    /**
+     * Fold expenses changed since the last run into the monthly_category_totals table
+     *
+     * Returns forecast.py's refresh stats (scanned, changed and deleted rows, buckets updated and
+     * the new watermark), or null when the refresh failed.
+     */
+    public function refreshMonthlyTotals(): ?array
+    {
+        $dbConfig = $this->getMySQLDatabaseConfig();
+        
+        $command = sprintf(
+            '%s %s --refresh-monthly-totals --db-type mysql --db-host %s --db-port %s --db-name %s --db-user %s --db-password %s',
+            escapeshellarg($this->pythonPath),
+            escapeshellarg($this->scriptPath),
+            escapeshellarg($dbConfig['host']),
+            escapeshellarg($dbConfig['port']),
+            escapeshellarg($dbConfig['database']),
+            escapeshellarg($dbConfig['username']),
+            escapeshellarg($dbConfig['password'])
+        ) . $this->metricsOption();
+        
+        $output = shell_exec($command);
+        $result = $output === null ? null : json_decode($output, true);
+        
+        if (!is_array($result) || isset($result['error'])) {
+            Log::error("Monthly totals refresh failed: " . ($result['error'] ?? 'no output'));
+            return null;
+        }
+        
+        return $result;
+    }
+    
+    /**
+     * Train the pooled cross-user models of the configured scope in one batch run
+     *
+     * Per-pair models are kept (or trained) only for pairs where they beat the pooled model on
+     * backtest, and removed elsewhere. Returns forecast.py's report (per pooled model: rows,
+     * chosen model type, backtest metrics and pair counts), or null when pooled mode is off or
+     * the run failed.
+     */
+    public function trainPooledModels(): ?array
+    {
+        $scope = $this->pooledScope();
+        if ($scope === null) {
+            return null;
+        }
+        
+        $dbConfig = $this->getMySQLDatabaseConfig();
+        
+        $command = sprintf(
+            '%s %s --train-pooled --pooled %s --model-storage-path %s --db-type mysql --db-host %s --db-port %s --db-name %s --db-user %s --db-password %s',
+            escapeshellarg($this->pythonPath),
+            escapeshellarg($this->scriptPath),
+            escapeshellarg($scope),
+            escapeshellarg(storage_path('app/ml_models')),
+            escapeshellarg($dbConfig['host']),
+            escapeshellarg($dbConfig['port']),
+            escapeshellarg($dbConfig['database']),
+            escapeshellarg($dbConfig['username']),
+            escapeshellarg($dbConfig['password'])
+        ) . $this->metricsOption();
+        
+        $output = shell_exec($command);
+        $result = $output === null ? null : json_decode($output, true);
+        
+        if (!is_array($result) || isset($result['error'])) {
+            Log::error("Pooled model training failed: " . ($result['error'] ?? 'no output'));
+            return null;
+        }
+        
+        return $result;
+    }
+    
+    /**
+     * Saved model file of a pair, or a pickle from before the model file format (read until
+     * `forecast.py --migrate-models` converts it); null when there is neither
+     */
+    private function savedModelPath(User $user, Category $category): ?string
+    {
+        foreach (['model', 'pkl'] as $extension) {
+            $modelPath = storage_path("app/ml_models/forecast_user_{$user->id}_cat_{$category->id}.{$extension}");
+            if (file_exists($modelPath)) {
+                return $modelPath;
+            }
+        }
+        
+        return null;
+    }
+    
+    /**
+     * Extra forecast.py option appending per-run spans and counters to the configured metrics file
+     */
+    private function metricsOption(): string
+    {
+        $metricsFile = config('services.ml_forecast.metrics_file');
+        return $metricsFile ? ' --metrics-file ' . escapeshellarg($metricsFile) : '';
+    }
+    
+    /**
+     * Model-selection budget for interactive forecasts in milliseconds, or null for no limit
+     */
+    private function timeBudgetMs(): ?int
+    {
+        $budget = config('services.ml_forecast.time_budget_ms');
+        return $budget ? (int) $budget : null;
+    }
+    
+    /**
+     * forecast.py option bounding model selection by the configured time budget
+     */
+    private function timeBudgetOption(): string
+    {
+        $budget = $this->timeBudgetMs();
+        return $budget ? sprintf(' --time-budget-ms %d', $budget) : '';
+    }
+    
+    /**
+     * Configured pooled model scope ('category' or 'global'), or null when every pair trains its own model
+     */
+    public function pooledScope(): ?string
+    {
+        $scope = config('services.ml_forecast.pooled');
+        return in_array($scope, ['category', 'global'], true) ? $scope : null;
+    }
+    
+    /**
+     * forecast.py option serving pairs without a model of their own from the pooled model
+     */
+    private function pooledOption(): string
+    {
+        $scope = $this->pooledScope();
+        return $scope ? ' --pooled ' . escapeshellarg($scope) : '';
+    }
+    
+    /**
+     * Send a request to the resident forecast server, if one is configured
+     *
+     * Returns the decoded result, or null when no server is configured or it cannot be reached,
+     * in which case callers fall back to spawning forecast.py.
+     */
+    private function callForecastServer(string $method, array $params): ?array
+    {
+        $socketPath = config('services.ml_forecast.socket');
+        if (!$socketPath || !file_exists($socketPath)) {
+            return null;
+        }
+        
+        $timeout = (int) config('services.ml_forecast.timeout', 30);
+        $socket = @stream_socket_client('unix://' . $socketPath, $errno, $errstr, $timeout);
+        if (!$socket) {
+            Log::warning("Forecast server unavailable at {$socketPath}: {$errstr}");
+            return null;
+        }
+        
+        try {
+            stream_set_timeout($socket, $timeout);
+            $requestId = uniqid('', true);
+            fwrite($socket, json_encode(['id' => $requestId, 'method' => $method, 'params' => $params]) . "\n");
+            
+            $line = fgets($socket);
+            $response = $line === false ? null : json_decode($line, true);
+            if (!is_array($response) || ($response['id'] ?? null) !== $requestId) {
+                Log::warning("Invalid response from forecast server for method {$method}");
+                return null;
+            }
+            
+            if (isset($response['error'])) {
+                return ['error' => $response['error']];
+            }
+            
+            return is_array($response['result'] ?? null) ? $response['result'] : null;
+        } finally {
+            fclose($socket);
+        }
+    }
+    
     /**
      * Clear cache for a specific user and category
      */
@@ -344,6 +782,9 @@ public function clearCache(User $user, Category $category)
         $performanceCacheKey = "ml_performance_{$user->id}_{$category->id}_" . now()->format('Y-m-d');
         Cache::forget($performanceCacheKey);
         
+        // Backtest metrics cover all of the user's categories; the next `ml:backtest --missing` run recomputes them
+        Cache::forget($this->backtestCacheKey($user));
+        
         Log::info("Cleared ML cache for user {$user->id}, category {$category->name}");
     }
     
@@ -47,4 +47,17 @@
         'enable_learning' => env('PAYMENT_NOTIFICATIONS_ENABLE_LEARNING', true),
     ],
 
+    'ml_forecast' => [
+        // Unix socket of a resident `forecast.py --serve --socket ...` process; unset to spawn per request
+        'socket' => env('ML_FORECAST_SOCKET'),
+        'timeout' => env('ML_FORECAST_TIMEOUT', 30), // seconds
+        // JSON-lines file receiving forecast.py timing spans and counters (one line per run/request); unset to disable
+        'metrics_file' => env('ML_FORECAST_METRICS_FILE'),
+        // Approximate wall-clock budget (ms) for model selection in interactive forecasts; the linear model always finishes
+        'time_budget_ms' => env('ML_FORECAST_TIME_BUDGET_MS'),
+        // Pooled cross-user model scope ('category' or 'global'): pairs without a model of their own, including
+        // new users, are forecast from it; unset to train a model for every pair
+        'pooled' => env('ML_FORECAST_POOLED'),
+    ],
+
 ];
\ No newline at end of file
@@ -0,0 +1,62 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Run the migrations.
+     *
+     * Maintained by `ml_scripts/forecast.py --refresh-monthly-totals`, which folds in expenses
+     * changed since the stored watermark; forecasts read the totals plus the expenses changed since.
+     */
+    public function up(): void
+    {
+        Schema::create('monthly_category_totals', function (Blueprint $table) {
+            $table->foreignId('user_id')->constrained()->onDelete('cascade');
+            $table->foreignId('category_id')->constrained()->onDelete('cascade');
+            $table->unsignedInteger('month_key'); // YYYYMM
+            $table->decimal('total_amount', 14, 2)->default(0);
+            $table->unsignedInteger('expense_count')->default(0);
+            $table->timestamp('updated_at')->nullable();
+            $table->primary(['user_id', 'category_id', 'month_key']);
+        });
+
+        // What each expense last contributed, so edits and deletes can be applied as deltas
+        Schema::create('monthly_category_total_entries', function (Blueprint $table) {
+            $table->unsignedBigInteger('expense_id')->primary();
+            $table->unsignedBigInteger('user_id');
+            $table->unsignedBigInteger('category_id');
+            $table->unsignedInteger('month_key');
+            $table->decimal('amount', 10, 2);
+        });
+
+        // Single row: the highest expense id and updated_at folded into the totals
+        Schema::create('monthly_category_totals_watermark', function (Blueprint $table) {
+            $table->unsignedTinyInteger('id')->primary();
+            $table->unsignedBigInteger('max_expense_id')->default(0);
+            $table->timestamp('max_updated_at')->nullable();
+            $table->timestamp('refreshed_at')->nullable();
+        });
+
+        Schema::table('expenses', function (Blueprint $table) {
+            // Finds expenses edited since the watermark
+            $table->index('updated_at');
+        });
+    }
+
+    /**
+     * Reverse the migrations.
+     */
+    public function down(): void
+    {
+        Schema::table('expenses', function (Blueprint $table) {
+            $table->dropIndex(['updated_at']);
+        });
+        Schema::dropIfExists('monthly_category_totals_watermark');
+        Schema::dropIfExists('monthly_category_total_entries');
+        Schema::dropIfExists('monthly_category_totals');
+    }
+};
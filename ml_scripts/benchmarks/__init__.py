@@ -0,0 +1,7 @@
+"""
+Benchmarks for forecast.py
+
+synthetic_db builds a SQLite database with the application's expenses schema and configurable
+size; run measures CLI latency, model/feature timings and peak memory against it and writes a
+JSON report that can be compared with an earlier one.
+"""
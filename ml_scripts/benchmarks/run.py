@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmark runner for forecast.py
+
+Generates a synthetic database (see synthetic_db.py), then measures:
+  - end-to-end CLI latency: cold (empty model storage, trains), warm (saved model) and
+    result-cache hits, each a fresh process
+  - in-process timings: prepare_features, DecisionTreeRegressor split search and fit,
+    RandomForestRegressor and HistGradientBoostingRegressor fit/predict, and cross_val_score
+  - saved forest model: file size and load-and-predict time
+  - forest vs gradient boosting: cross-validation time and out-of-fold error over all pairs
+  - peak memory: child-process RSS for the CLI runs, tracemalloc peak for tree (float64 and float32
+    features) and forest training and for a batch forecast of user 1
+
+Every metric is lower-is-better and written to one flat JSON object, so two result files can be
+diffed directly. With --baseline, metrics that got slower by more than the allowed ratio are
+listed and the exit status is 1.
+
+    python3 ml_scripts/benchmarks/run.py --output bench.json
+    python3 ml_scripts/benchmarks/run.py --output new.json --baseline bench.json --max-regression 0.2 \\
+        --threshold forest.fit.median_ms=0.5
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import numpy as np
+
+import forecast
+from benchmarks.synthetic_db import generate
+
+FORECAST_SCRIPT = os.path.join(os.path.dirname(HERE), 'forecast.py')
+
+
+def _summarize(samples_ms):
+    return {'median_ms': round(statistics.median(samples_ms), 3), 'min_ms': round(min(samples_ms), 3)}
+
+
+def time_call(func, repeat):
+    """Wall-clock milliseconds of repeat calls of func (after one untimed warm-up call)"""
+    func()
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started_at) * 1000)
+    return _summarize(samples)
+
+
+def peak_mb(func):
+    """tracemalloc peak (MB) of one call of func"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 3)
+
+
+def _run_cli(db_path, storage_path, user_id, category_id, target_month, target_year, extra_args=()):
+    command = [sys.executable, FORECAST_SCRIPT, '--db-path', db_path, '--model-storage-path', storage_path,
+               '--user-id', str(user_id), '--category-id', str(category_id),
+               '--target-month', str(target_month), '--target-year', str(target_year), *extra_args]
+    started_at = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True, check=False)
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    result = json.loads(completed.stdout.strip().splitlines()[-1]) if completed.stdout.strip() else {}
+    if completed.returncode != 0 or 'error' in result:
+        raise RuntimeError(f"forecast.py failed: {result.get('error') or completed.stderr.strip()}")
+    return elapsed_ms
+
+
+def bench_cli(db_path, work_dir, target_month, target_year, repeat):
+    """Cold, warm and result-cache CLI latency for pair (1, 1), plus peak child RSS"""
+    metrics = {}
+    cold = []
+    for i in range(repeat):
+        # A new storage directory each time: no saved model, nothing cached
+        cold.append(_run_cli(db_path, os.path.join(work_dir, f'cold_{i}'), 1, 1, target_month, target_year))
+    metrics.update({f'cli.cold.{key}': value for key, value in _summarize(cold).items()})
+
+    warm_storage = os.path.join(work_dir, 'cold_0')
+    warm = [_run_cli(db_path, warm_storage, 1, 1, target_month, target_year, ['--result-cache-mb', '0'])
+            for _ in range(repeat)]
+    metrics.update({f'cli.warm.{key}': value for key, value in _summarize(warm).items()})
+
+    cached_storage = os.path.join(work_dir, 'result_cache')
+    _run_cli(db_path, cached_storage, 1, 1, target_month, target_year)
+    cached = [_run_cli(db_path, cached_storage, 1, 1, target_month, target_year) for _ in range(repeat)]
+    metrics.update({f'cli.result_cache.{key}': value for key, value in _summarize(cached).items()})
+
+    try:
+        import resource
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        metrics['memory.cli_peak_rss_mb'] = round(max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+    except ImportError:
+        pass
+    return metrics
+
+
+def bench_models(db_path, storage_path, repeat):
+    """In-process timings on pair (1, 1) (forest, CV) and on all pairs stacked (features, split search)"""
+    forecaster = forecast.ExpenseForecaster(db_path=db_path, model_storage_path=storage_path)
+    try:
+        all_series = forecaster.get_monthly_series_batch()
+    finally:
+        forecaster.close()
+
+    metrics = {}
+
+    def featurize_all():
+        return [forecaster.prepare_features(series) for series in all_series.values()]
+
+    metrics.update({f'prepare_features.{key}': value for key, value in time_call(featurize_all, repeat).items()})
+
+    prepared = [pair for pair in featurize_all() if pair[0] is not None]
+    X_all = forecast.StandardScaler().fit_transform(np.vstack([features for features, _ in prepared]))
+    y_all = np.concatenate([targets for _, targets in prepared])
+    features, targets = forecaster.prepare_features(all_series[(1, 1)])
+    X = forecast.StandardScaler().fit_transform(features)
+    y = targets
+
+    all_features = np.arange(X_all.shape[1])
+    split_tree = forecast.DecisionTreeRegressor()
+    metrics.update({f'tree.split_search.{key}': value for key, value in
+                    time_call(lambda: split_tree._find_best_split(X_all, y_all, all_features), repeat).items()})
+    metrics.update({f'tree.fit.{key}': value for key, value in
+                    time_call(lambda: forecast.DecisionTreeRegressor().fit(X_all, y_all), repeat).items()})
+
+    def new_forest():
+        return forecast.RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42)
+
+    metrics.update({f'forest.fit.{key}': value for key, value in time_call(lambda: new_forest().fit(X, y), repeat).items()})
+    forest = new_forest().fit(X, y)
+    metrics.update({f'forest.predict.{key}': value for key, value in time_call(lambda: forest.predict(X), repeat).items()})
+    metrics.update(bench_model_file(forecaster.model_store, forest, forecast.StandardScaler().fit(features)))
+
+    def new_boosting():
+        return forecast.HistGradientBoostingRegressor(max_iter=100, learning_rate=0.1, max_depth=3)
+
+    metrics.update({f'boosting.fit.{key}': value for key, value in time_call(lambda: new_boosting().fit(X, y), repeat).items()})
+    boosting = new_boosting().fit(X, y)
+    metrics.update({f'boosting.predict.{key}': value for key, value in time_call(lambda: boosting.predict(X), repeat).items()})
+    metrics.update({f'cross_val_score.{key}': value for key, value in
+                    time_call(lambda: forecast.cross_val_score(new_forest(), X, y, cv=3), repeat).items()})
+
+    metrics['memory.tree_fit_peak_mb'] = peak_mb(lambda: forecast.DecisionTreeRegressor().fit(X_all, y_all))
+    X_all_32 = X_all.astype(np.float32)
+    metrics['memory.tree_fit_float32_peak_mb'] = peak_mb(lambda: forecast.DecisionTreeRegressor().fit(X_all_32, y_all))
+    metrics['memory.forest_fit_peak_mb'] = peak_mb(lambda: new_forest().fit(X, y))
+
+    metrics.update(bench_candidates(prepared, {'forest': new_forest, 'boosting': new_boosting}))
+    metrics['memory.batch_peak_mb'] = bench_batch_memory(db_path, storage_path)
+    return metrics
+
+
+def bench_batch_memory(db_path, storage_path):
+    """Peak memory (MB) of retraining and forecasting every pair of user 1 in batch mode"""
+    forecaster = forecast.ExpenseForecaster(db_path=db_path, model_storage_path=os.path.join(storage_path, 'batch'))
+    try:
+        return peak_mb(lambda: list(forecaster.forecast_batch(user_id=1, force_retrain=True)))
+    finally:
+        forecaster.close()
+
+
+def bench_model_file(model_store, model, scaler):
+    """Saved size and load time (load plus one prediction) of a fitted forest in the model file format"""
+    model_path = model_store.put(1, 1, {
+        'model': model, 'scaler': scaler, 'model_name': 'random_forest', 'feature_names': [],
+        'trained_at': datetime.now().isoformat(), 'data_points': 0, 'performance': {}
+    })
+    row = np.zeros((1, len(scaler.mean_)))
+    metrics = {'model_file.forest_kb': round(os.path.getsize(model_path) / 1024, 3)}
+    metrics.update({f'model_file.forest_load.{key}': value for key, value in
+                    time_call(lambda: forecast.ModelStore._load_file(model_path)['model'].predict(row), 20).items()})
+    return metrics
+
+
+def bench_candidates(prepared, candidates):
+    """
+    Cross-validation time and pooled out-of-fold MAE/RMSE/MAPE per candidate model over all pairs,
+    using the same expanding-window folds as model selection
+    """
+    metrics = {}
+    for name, new_model in candidates.items():
+        elapsed_ms = 0.0
+        y_true, y_pred = [], []
+        for features, targets in prepared:
+            if len(features) < 4:
+                continue
+            X = forecast.StandardScaler().fit_transform(features)
+            started_at = time.perf_counter()
+            splits, predictions = forecast.cross_val_fold_predictions(new_model(), X, targets,
+                                                                      cv=min(3, max(2, len(X) - 1)))
+            elapsed_ms += (time.perf_counter() - started_at) * 1000
+            y_true.extend(targets[test_idx] for _, test_idx in splits)
+            y_pred.extend(predictions)
+        errors = forecast.regression_metrics(np.concatenate(y_true), np.concatenate(y_pred))
+        metrics[f'candidates.{name}.cv_ms'] = round(elapsed_ms, 3)
+        metrics.update({f'candidates.{name}.{key}': round(errors[key], 4) for key in ('mae', 'rmse', 'mape')})
+    return metrics
+
+
+def compare(results, baseline, max_regression, thresholds):
+    """Metrics more than their allowed ratio above the baseline, as (name, old, new, change) tuples"""
+    regressions = []
+    for name, new_value in sorted(results.items()):
+        old_value = baseline.get(name)
+        if not isinstance(old_value, (int, float)) or old_value <= 0:
+            continue
+        change = new_value / old_value - 1
+        if change > thresholds.get(name, max_regression):
+            regressions.append((name, old_value, new_value, change))
+    return regressions
+
+
+def _git_revision():
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                                   text=True, check=False)
+        return completed.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _parse_thresholds(values):
+    thresholds = {}
+    for value in values:
+        name, _, ratio = value.partition('=')
+        thresholds[name] = float(ratio)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark forecast.py against a synthetic database')
+    parser.add_argument('--output', required=True, help='JSON results file to write')
+    parser.add_argument('--baseline', help='Earlier results file to check for regressions')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Allowed slowdown as a ratio of the baseline (0.25 = 25%% slower)')
+    parser.add_argument('--threshold', action='append', default=[], metavar='METRIC=RATIO',
+                        help='Per-metric allowed slowdown, overriding --max-regression (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per measurement')
+    parser.add_argument('--skip-cli', action='store_true', help='Only run the in-process benchmarks')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--categories', type=int, default=4)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--transactions-per-month', type=float, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    dataset = {'users': args.users, 'categories': args.categories, 'months': args.months,
+               'transactions_per_month': args.transactions_per_month, 'seed': args.seed}
+
+    work_dir = tempfile.mkdtemp(prefix='forecast_bench_')
+    try:
+        db_path = os.path.join(work_dir, 'expenses.db')
+        rows = generate(db_path, users=args.users, categories=args.categories, months=args.months,
+                        transactions_per_month=args.transactions_per_month, start_year=2023, start_month=1,
+                        seed=args.seed)
+        # Forecast the month right after the generated data
+        target_year, target_month = 2023 + args.months // 12, args.months % 12 + 1
+
+        metrics = {}
+        if not args.skip_cli:
+            metrics.update(bench_cli(db_path, work_dir, target_month, target_year, args.repeat))
+        metrics.update(bench_models(db_path, os.path.join(work_dir, 'in_process'), args.repeat))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'dataset': dict(dataset, rows=rows)
+        },
+        'metrics': metrics
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {len(metrics)} metrics to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('dataset') != report['meta']['dataset']:
+            print("Warning: baseline was measured on a different dataset", file=sys.stderr)
+        regressions = compare(metrics, baseline.get('metrics', {}), args.max_regression,
+                              _parse_thresholds(args.threshold))
+        for name, old_value, new_value, change in regressions:
+            print(f"REGRESSION {name}: {old_value} -> {new_value} (+{change * 100:.1f}%)")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
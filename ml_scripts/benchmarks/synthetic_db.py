@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Synthetic expense database generator
+
+Creates a SQLite database with the same expenses table as the Laravel migrations (including the
+auto-creation columns and indexes) and fills it with users x categories x months of transactions.
+Each category has its own base amount, trend and seasonal phase, with a December bump and a
+small share of outlier transactions. The same arguments and seed always produce the same data.
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+
+import numpy as np
+
+
+EXPENSES_SCHEMA = """
+CREATE TABLE expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    description TEXT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    date DATE NOT NULL,
+    is_auto_created TINYINT(1) NOT NULL DEFAULT 0,
+    source VARCHAR(255) NULL,
+    notification_type VARCHAR(255) NULL,
+    transaction_id VARCHAR(255) NULL,
+    merchant VARCHAR(255) NULL,
+    requires_approval TINYINT(1) NOT NULL DEFAULT 0,
+    auto_created_at TIMESTAMP NULL,
+    approved_at TIMESTAMP NULL,
+    rejected_at TIMESTAMP NULL,
+    rejection_reason TEXT NULL,
+    created_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NULL
+)
+"""
+
+EXPENSES_INDEXES = [
+    "CREATE INDEX expenses_is_auto_created_requires_approval_index ON expenses (is_auto_created, requires_approval)",
+    "CREATE INDEX expenses_source_notification_type_index ON expenses (source, notification_type)",
+    "CREATE INDEX expenses_transaction_id_index ON expenses (transaction_id)",
+    "CREATE INDEX expenses_merchant_index ON expenses (merchant)",
+    "CREATE INDEX expenses_user_id_category_id_date_index ON expenses (user_id, category_id, date)",
+]
+
+
+def _month_amounts(rng, n_months, start_month, seasonality):
+    """Expected monthly spend for one (user, category): base level, linear trend and yearly seasonality"""
+    base = rng.lognormal(mean=math.log(5000), sigma=0.6)
+    trend = rng.normal(0, 0.01)
+    phase = rng.uniform(0, 2 * math.pi)
+    steps = np.arange(n_months)
+    calendar_months = (start_month - 1 + steps) % 12 + 1
+    level = base * (1 + trend * steps) * (1 + seasonality * np.sin(2 * math.pi * steps / 12 + phase))
+    level = np.where(calendar_months == 12, level * (1 + seasonality), level)
+    return np.maximum(level, base * 0.1), calendar_months
+
+
+def generate(path, users=10, categories=5, months=24, transactions_per_month=8, start_year=2023,
+             start_month=1, seasonality=0.3, outlier_rate=0.02, seed=42):
+    """
+    Write a fresh synthetic database to path (replacing any existing file).
+
+    Transactions per month are Poisson distributed around transactions_per_month (at least one),
+    and outlier_rate of them are 4-10x their usual size. Returns the number of expense rows.
+    """
+    rng = np.random.default_rng(seed)
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(EXPENSES_SCHEMA)
+        total_rows = 0
+        for user_id in range(1, users + 1):
+            for category_id in range(1, categories + 1):
+                level, calendar_months = _month_amounts(rng, months, start_month, seasonality)
+                rows = []
+                for step in range(months):
+                    year = start_year + (start_month - 1 + step) // 12
+                    month = int(calendar_months[step])
+                    n_transactions = max(1, int(rng.poisson(transactions_per_month)))
+                    shares = rng.dirichlet(np.ones(n_transactions))
+                    amounts = level[step] * shares
+                    outliers = rng.random(n_transactions) < outlier_rate
+                    amounts[outliers] *= rng.uniform(4, 10, size=int(outliers.sum()))
+                    days = rng.integers(1, 29, size=n_transactions)
+                    for amount, day in zip(amounts, days):
+                        date = f"{year}-{month:02d}-{int(day):02d}"
+                        timestamp = f"{date} 12:00:00"
+                        rows.append((user_id, category_id, f"Synthetic expense {category_id}",
+                                     round(float(amount), 2), date, timestamp, timestamp))
+                conn.executemany(
+                    "INSERT INTO expenses (user_id, category_id, description, amount, date, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                total_rows += len(rows)
+        for statement in EXPENSES_INDEXES:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+    return total_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic expenses database for benchmarks')
+    parser.add_argument('path', help='SQLite database file to create (replaced if it exists)')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--transactions-per-month', type=float, default=8)
+    parser.add_argument('--start-year', type=int, default=2023)
+    parser.add_argument('--start-month', type=int, default=1)
+    parser.add_argument('--seasonality', type=float, default=0.3, help='Relative amplitude of the yearly cycle')
+    parser.add_argument('--outlier-rate', type=float, default=0.02, help='Share of transactions that are outliers')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rows = generate(args.path, users=args.users, categories=args.categories, months=args.months,
+                    transactions_per_month=args.transactions_per_month, start_year=args.start_year,
+                    start_month=args.start_month, seasonality=args.seasonality,
+                    outlier_rate=args.outlier_rate, seed=args.seed)
+    print(f"Wrote {rows} expenses to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
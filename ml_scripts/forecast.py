@@ -5,40 +5,229 @@ Uses multiple ML algorithms to predict future expenses
 All algorithms implemented from scratch (no sklearn dependencies for core algorithms)
 """
 
-import pandas as pd
-import numpy as np
+import time
+_MODULE_STARTED_AT = time.perf_counter()
+
 import sqlite3
 import json
 import sys
 import argparse
 import os
-import joblib
+import copy
+import pickle
+import re
+import struct
+import importlib
+import tempfile
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import random
 import warnings
 warnings.filterwarnings('ignore')
 
+# Milliseconds spent importing heavy modules, reported by --timing
+IMPORT_TIMINGS = {}
+
+_import_started_at = time.perf_counter()
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+IMPORT_TIMINGS['numpy'] = (time.perf_counter() - _import_started_at) * 1000
+
+
+def _timed_import(name):
+    """
+    Import a module on first use, recording how long the import took.
+    
+    joblib and mysql.connector are only needed on some paths, so they are not imported at
+    startup; the cached-model prediction path needs only numpy and a database driver.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        started_at = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMINGS[name] = (time.perf_counter() - started_at) * 1000
+    return module
+
+
+def _mysql_connector():
+    """mysql.connector, or None (with a warning on stderr) when it is not installed"""
+    try:
+        return _timed_import('mysql.connector')
+    except ImportError:
+        logger.warning("mysql-connector-python not installed. Install with: pip3 install mysql-connector-python")
+        return None
+
+
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+# Diagnostics go through logging (stderr, WARNING and up by default; see --log-level)
+logger = logging.getLogger('forecast')
+
+
+class Profiler:
+    """
+    Per-stage wall-clock spans and named counters.
+    
+    span() accumulates calls and total milliseconds per stage (spans nest, so totals are inclusive);
+    count() adds to a counter. Both are cheap and always on; the report is only written out when
+    --profile or --metrics-file asks for it. Trees fitted inside worker processes (parallel CV
+    folds, deadline-bounded model selection) are not counted. Safe to use from several threads.
+    """
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def span(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started_at) * 1000)
+    
+    def add(self, name, elapsed_ms):
+        """Record one call of a span timed elsewhere"""
+        with self._lock:
+            entry = self.spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+    
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def snapshot(self):
+        """Independent copy of the current totals"""
+        copied = Profiler()
+        with self._lock:
+            copied.spans = {name: list(entry) for name, entry in self.spans.items()}
+            copied.counters = dict(self.counters)
+        return copied
+    
+    def since(self, snapshot):
+        """Profiler holding only what was recorded after snapshot was taken"""
+        delta = Profiler()
+        current = self.snapshot()
+        for name, (calls, total_ms) in current.spans.items():
+            old_calls, old_ms = snapshot.spans.get(name, (0, 0.0))
+            if calls > old_calls:
+                delta.spans[name] = [calls - old_calls, total_ms - old_ms]
+        for name, n in current.counters.items():
+            if n != snapshot.counters.get(name, 0):
+                delta.counters[name] = n - snapshot.counters.get(name, 0)
+        return delta
+    
+    def report(self):
+        report = {
+            'spans': {name: {'calls': calls, 'total_ms': round(total_ms, 3)}
+                      for name, (calls, total_ms) in self.spans.items()},
+            'counters': dict(self.counters)
+        }
+        query_ms = self.spans.get('query', (0, 0.0))[1]
+        if query_ms > 0 and 'rows_fetched' in self.counters:
+            report['rows_per_sec'] = round(self.counters['rows_fetched'] / (query_ms / 1000), 1)
+        return report
+
+
+# Spans and counters for the whole run (the server reports per-request deltas)
+PROFILER = Profiler()
+
+
+def append_metrics(path, record):
+    """Append one JSON line to a metrics file; failures are logged, never raised"""
+    try:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        logger.warning("Could not write metrics to %s: %s", path, e)
+
+
+def profiled(name):
+    """Decorator recording each call of the function as a PROFILER span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # ============================================================================
 # CUSTOM IMPLEMENTATIONS FROM SCRATCH
 # ============================================================================
 
+def as_float_array(X):
+    """X as a NumPy array without copying if it already has a float dtype (float32 stays float32)"""
+    X = np.asarray(X)
+    return X if X.dtype.kind == 'f' else X.astype(np.float64)
+
+
 class StandardScaler:
-    """Custom StandardScaler implementation from scratch"""
-    def __init__(self):
+    """
+    Custom StandardScaler implementation from scratch.
+    
+    The mean and variance are always accumulated in float64; transform() returns arrays of dtype
+    (float32 halves the memory of every scaled matrix the models train on).
+    """
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
         self.mean_ = None
         self.scale_ = None
+        self.var_ = None
+        self.n_samples_seen_ = 0
+    
+    def __setstate__(self, state):
+        """Unpickle; scalers pickled before running moments and dtype were kept get their defaults"""
+        self.__dict__.update({'dtype': np.dtype(np.float64), 'var_': None, 'n_samples_seen_': 0})
+        self.__dict__.update(state)
     
     def fit(self, X):
         """Compute mean and standard deviation for scaling"""
-        X = np.array(X, dtype=np.float64)
+        X = np.asarray(X)
         # Handle 1D arrays
         if X.ndim == 1:
             X = X.reshape(-1, 1)
         
-        self.mean_ = np.mean(X, axis=0).astype(np.float64)
-        # Calculate std manually to avoid numpy issues
-        variance = np.mean((X - self.mean_) ** 2, axis=0)
-        self.scale_ = np.sqrt(variance).astype(np.float64)
+        self.mean_ = np.mean(X, axis=0, dtype=np.float64)
+        # Calculate std manually to avoid numpy issues, squaring the one centred temporary in place
+        centred = X - self.mean_
+        self.var_ = np.mean(np.square(centred, out=centred), axis=0)
+        self.n_samples_seen_ = len(X)
+        self._set_scale()
+        
+        return self
+    
+    def partial_fit(self, X):
+        """Fold new rows into the running mean and variance (Chan et al. pairwise update)"""
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(-1, 1)
+        if self.mean_ is None or not self.n_samples_seen_:
+            return self.fit(X)
+        
+        n_old, n_new = self.n_samples_seen_, len(X)
+        n_total = n_old + n_new
+        new_mean = np.mean(X, axis=0, dtype=np.float64)
+        centred = X - new_mean
+        new_var = np.mean(np.square(centred, out=centred), axis=0)
+        delta = new_mean - self.mean_
+        
+        self.mean_ = self.mean_ + delta * (n_new / n_total)
+        self.var_ = (self.var_ * n_old + new_var * n_new + delta ** 2 * (n_old * n_new / n_total)) / n_total
+        self.n_samples_seen_ = n_total
+        self._set_scale()
+        
+        return self
+    
+    def _set_scale(self):
+        self.scale_ = np.sqrt(self.var_).astype(np.float64)
         
         # Avoid division by zero - handle both scalar and array cases
         if np.isscalar(self.scale_):
@@ -46,41 +235,77 @@ class StandardScaler:
                 self.scale_ = 1.0
         else:
             self.scale_ = np.where(self.scale_ == 0, 1.0, self.scale_)
-        
-        return self
     
-    def transform(self, X):
-        """Scale features using mean and standard deviation"""
-        X = np.array(X, dtype=np.float64)
+    def transform(self, X, copy=True):
+        """
+        Scale features using mean and standard deviation.
+        
+        With copy=False a writable array already of the scaler's dtype is scaled in place and returned.
+        """
+        X = np.asarray(X)
+        # Scalers unpickled from older versions have no dtype and were always float64
+        dtype = getattr(self, 'dtype', np.float64)
+        if copy or X.dtype != dtype or not X.flags.writeable:
+            X = X.astype(dtype)
         # Handle 1D arrays
         if X.ndim == 1:
             X = X.reshape(-1, 1)
         
-        # Ensure broadcast works correctly
-        result = (X - self.mean_) / self.scale_
+        # X is a fresh copy here unless the caller asked for in-place scaling
+        X -= self.mean_
+        X /= self.scale_
         
         # Return in same shape as input
-        if result.shape[0] == 1 and result.ndim == 2:
-            return result.flatten()
-        return result
+        if X.shape[0] == 1 and X.ndim == 2:
+            return X.ravel()
+        return X
     
-    def fit_transform(self, X):
+    def fit_transform(self, X, copy=True):
         """Fit and transform in one step"""
-        return self.fit(X).transform(X)
+        return self.fit(X).transform(X, copy=copy)
+    
+    def _to_arrays(self, float_dtype):
+        """
+        Fitted state as (params, arrays) for a model file. Always float64: tree thresholds are
+        scaled training values, so a narrowed mean or scale would move rows across them.
+        """
+        return ({'n_samples_seen_': int(self.n_samples_seen_), 'dtype': getattr(self, 'dtype', np.dtype(np.float64)).name},
+                {'mean_': self.mean_, 'scale_': self.scale_, 'var_': self.var_})
+    
+    @classmethod
+    def _from_arrays(cls, params, arrays):
+        scaler = cls(dtype=params.get('dtype', 'float64'))
+        scaler.mean_, scaler.scale_, scaler.var_ = arrays['mean_'], arrays['scale_'], arrays.get('var_')
+        scaler.n_samples_seen_ = params['n_samples_seen_']
+        return scaler
 
 
 class LinearRegression:
-    """Custom Linear Regression implementation from scratch using Normal Equation"""
+    """
+    Custom Linear Regression implementation from scratch using Normal Equation.
+    
+    The sufficient statistics X^T X, X^T y (with the bias column) and the sample count are kept
+    after fitting, so partial_fit can fold in new rows without revisiting the training data.
+    """
     def __init__(self):
         self.coefficients_ = None  # Weights (theta)
         self.intercept_ = None     # Bias term
+        self.xtx_ = None
+        self.xty_ = None
+        self.n_samples_ = 0
+    
+    def __setstate__(self, state):
+        """Unpickle; models pickled before the normal-equation statistics were kept cannot partial_fit"""
+        self.__dict__.update({'xtx_': None, 'xty_': None, 'n_samples_': 0})
+        self.__dict__.update(state)
     
     def fit(self, X, y):
         """
         Train Linear Regression using Normal Equation: θ = (X^T * X)^(-1) * X^T * y
         """
-        X = np.array(X)
-        y = np.array(y).reshape(-1, 1)
+        # The normal equation is solved in float64 whatever the input dtype
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64).reshape(-1, 1)
         
         # Add bias term (column of ones) to X
         X_with_bias = np.column_stack([np.ones(len(X)), X])
@@ -93,17 +318,10 @@ class LinearRegression:
             # Calculate (X^T * y)
             XTy = np.dot(X_with_bias.T, y)
             
-            # Calculate inverse and solve for theta
-            # Use pseudo-inverse if matrix is singular
-            try:
-                theta = np.linalg.solve(XTX, XTy)
-            except np.linalg.LinAlgError:
-                # If singular, use pseudo-inverse
-                theta = np.dot(np.linalg.pinv(XTX), XTy)
-            
-            # Extract intercept and coefficients
-            self.intercept_ = theta[0][0]
-            self.coefficients_ = theta[1:].flatten()
+            self.xtx_ = XTX
+            self.xty_ = XTy
+            self.n_samples_ = len(X)
+            self._solve()
             
         except Exception as e:
             # Fallback: simple linear fit for 1D case
@@ -128,9 +346,72 @@ class LinearRegression:
         
         return self
     
+    def _solve(self):
+        """Solve the normal equation from the stored X^T X and X^T y"""
+        # Calculate inverse and solve for theta
+        # Use pseudo-inverse if matrix is singular
+        try:
+            theta = np.linalg.solve(self.xtx_, self.xty_)
+        except np.linalg.LinAlgError:
+            # If singular, use pseudo-inverse
+            theta = np.dot(np.linalg.pinv(self.xtx_), self.xty_)
+        
+        # Extract intercept and coefficients
+        self.intercept_ = theta[0][0]
+        self.coefficients_ = theta[1:].flatten()
+    
+    def partial_fit(self, X, y):
+        """Add rows to the stored statistics and re-solve; same result as fit() on all rows seen so far"""
+        if self.xtx_ is None:
+            return self.fit(X, y)
+        
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        y = np.asarray(y, dtype=np.float64).reshape(-1, 1)
+        X_with_bias = np.column_stack([np.ones(len(X)), X])
+        
+        self.xtx_ = self.xtx_ + np.dot(X_with_bias.T, X_with_bias)
+        self.xty_ = self.xty_ + np.dot(X_with_bias.T, y)
+        self.n_samples_ += len(X)
+        self._solve()
+        return self
+    
+    def rescale_inputs(self, old_mean, old_scale, new_mean, new_scale):
+        """
+        Re-express the stored statistics for inputs standardized with a new mean/scale.
+        
+        z_new = (old_scale / new_scale) * z_old + (old_mean - new_mean) / new_scale, so the
+        bias-augmented rows map through one affine matrix A and X^T X becomes A X^T X A^T.
+        """
+        if self.xtx_ is None:
+            return self
+        A = np.zeros_like(self.xtx_)
+        A[0, 0] = 1.0
+        A[1:, 0] = (old_mean - new_mean) / new_scale
+        A[1:, 1:] = np.diag(old_scale / new_scale)
+        
+        self.xtx_ = A @ self.xtx_ @ A.T
+        self.xty_ = A @ self.xty_
+        self._solve()
+        return self
+    
+    def _to_arrays(self, float_dtype):
+        """Fitted state as (params, arrays) for a model file; the normal-equation statistics stay float64"""
+        return ({'intercept_': float(self.intercept_), 'n_samples_': int(self.n_samples_)},
+                {'coefficients_': np.asarray(self.coefficients_, dtype=float_dtype), 'xtx_': self.xtx_, 'xty_': self.xty_})
+    
+    @classmethod
+    def _from_arrays(cls, params, arrays):
+        model = cls()
+        model.coefficients_, model.xtx_, model.xty_ = arrays['coefficients_'], arrays.get('xtx_'), arrays.get('xty_')
+        model.intercept_ = params['intercept_']
+        model.n_samples_ = params['n_samples_']
+        return model
+    
     def predict(self, X):
         """Make predictions: y = X * θ + intercept"""
-        X = np.array(X)
+        X = np.asarray(X)
         if self.coefficients_ is None:
             return np.zeros(len(X))
         
@@ -139,13 +420,34 @@ class LinearRegression:
         return predictions
 
 
+# Record layout used when pickling a fitted DecisionTreeRegressor
+TREE_NODE_DTYPE = np.dtype([
+    ('feature', np.int32),
+    ('threshold', np.float64),
+    ('left', np.int32),
+    ('right', np.int32),
+    ('value', np.float64),
+])
+
+
 class DecisionTreeRegressor:
-    """Custom Decision Tree Regressor implementation from scratch"""
+    """
+    Custom Decision Tree Regressor implementation from scratch.
+    
+    The fitted tree is stored as parallel arrays indexed by node id (root is node 0):
+    feature_, threshold_, children_left_, children_right_ and value_. Leaves have
+    children_left_ == -1. Samples with X[:, feature_] <= threshold_ go left.
+    """
     def __init__(self, max_depth=10, min_samples_split=2, random_state=42):
         self.max_depth = max_depth
         self.min_samples_split = min_samples_split
         self.random_state = random_state
-        self.tree = None
+        self.feature_ = None
+        self.threshold_ = None
+        self.children_left_ = None
+        self.children_right_ = None
+        self.value_ = None
+        self.depth_ = None
     
     def _calculate_mse(self, y):
         """Calculate Mean Squared Error"""
@@ -154,195 +456,711 @@ class DecisionTreeRegressor:
         mean = np.mean(y)
         return np.mean((y - mean) ** 2)
     
-    def _find_best_split(self, X, y, feature_indices):
-        """Find the best split for a node"""
+    def _find_best_split(self, X, y, feature_indices, rows=None):
+        """
+        Find the best split for a node: the rows of X listed in rows (all rows if None), with targets y.
+        
+        Each feature is sorted once and every candidate threshold is scored from a running sum of
+        the centred targets. With c = y - mean(y) and s = sum of c on the left, the weighted MSE
+        reduction of a split is s^2 * n / (n_left * n_right) / n^2, so one cumulative sum per
+        feature replaces recomputing both partitions' MSE for every threshold.
+        Thresholds and tie-breaking (first feature, then smallest threshold) match an exhaustive
+        scan over the unique values.
+        """
         best_feature = None
         best_threshold = None
-        best_mse_reduction = -np.inf
+        best_score = -np.inf
+        
+        n_samples = len(y)
+        if n_samples < 2:
+            return best_feature, best_threshold
+        
+        centred = y - np.mean(y)
+        # Scores closer than this are rounding noise, not a better split
+        tolerance = 1e-10 * float(np.dot(centred, centred))
         
         for feature_idx in feature_indices:
-            # Get unique values for this feature
-            feature_values = np.unique(X[:, feature_idx])
+            column = X[:, feature_idx] if rows is None else X[:, feature_idx][rows]
+            order = np.argsort(column, kind='mergesort')
+            sorted_values = column[order]
+            left_sums = np.cumsum(centred[order])[:-1]
             
-            for threshold in feature_values:
-                # Split data
-                left_mask = X[:, feature_idx] <= threshold
-                right_mask = ~left_mask
-                
-                if np.sum(left_mask) < self.min_samples_split or np.sum(right_mask) < self.min_samples_split:
-                    continue
-                
-                # Calculate MSE reduction
-                parent_mse = self._calculate_mse(y)
-                left_mse = self._calculate_mse(y[left_mask])
-                right_mse = self._calculate_mse(y[right_mask])
-                
-                # Weighted MSE
-                left_weight = np.sum(left_mask) / len(y)
-                right_weight = np.sum(right_mask) / len(y)
-                weighted_mse = left_weight * left_mse + right_weight * right_mse
-                
-                mse_reduction = parent_mse - weighted_mse
-                
-                if mse_reduction > best_mse_reduction:
-                    best_mse_reduction = mse_reduction
-                    best_feature = feature_idx
-                    best_threshold = threshold
+            # Candidate thresholds sit at the last position of each run of equal values
+            split_positions = np.nonzero(sorted_values[:-1] < sorted_values[1:])[0]
+            left_counts = split_positions + 1
+            right_counts = n_samples - left_counts
+            allowed = (left_counts >= self.min_samples_split) & (right_counts >= self.min_samples_split)
+            if not np.any(allowed):
+                continue
+            
+            split_positions = split_positions[allowed]
+            left_counts = left_counts[allowed]
+            right_counts = right_counts[allowed]
+            scores = left_sums[split_positions] ** 2 * (n_samples / (left_counts * right_counts))
+            
+            best_idx = int(np.argmax(scores))
+            if best_feature is None or scores[best_idx] > best_score + tolerance:
+                best_score = scores[best_idx]
+                best_feature = feature_idx
+                best_threshold = sorted_values[split_positions[best_idx]]
         
         return best_feature, best_threshold
     
-    def _build_tree(self, X, y, depth=0, feature_indices=None):
-        """Recursively build decision tree"""
-        # Base cases
-        if depth >= self.max_depth or len(y) < self.min_samples_split:
-            return {'value': np.mean(y), 'is_leaf': True}
+    def _add_node(self, nodes, value, feature=-1, threshold=0.0):
+        """Append a node to the node lists being built and return its id"""
+        nodes['feature'].append(feature)
+        nodes['threshold'].append(threshold)
+        nodes['left'].append(-1)
+        nodes['right'].append(-1)
+        nodes['value'].append(value)
+        return len(nodes['value']) - 1
+    
+    def _build_tree(self, X, y, rows, nodes, depth, feature_indices):
+        """
+        Recursively build decision tree into the node lists, returning the subtree's root id.
         
-        if feature_indices is None:
-            feature_indices = list(range(X.shape[1]))
+        A node is the array of its row indices into X and y, so splitting never copies X itself.
+        """
+        y_node = y[rows]
+        # Base cases
+        if depth >= self.max_depth or len(rows) < self.min_samples_split:
+            return self._add_node(nodes, np.mean(y_node))
         
         # Check if all values are same
-        if len(np.unique(y)) == 1:
-            return {'value': y[0], 'is_leaf': True}
+        if len(np.unique(y_node)) == 1:
+            return self._add_node(nodes, y_node[0])
         
         # Find best split
-        best_feature, best_threshold = self._find_best_split(X, y, feature_indices)
+        best_feature, best_threshold = self._find_best_split(X, y_node, feature_indices, rows)
         
         if best_feature is None:
-            return {'value': np.mean(y), 'is_leaf': True}
+            return self._add_node(nodes, np.mean(y_node))
         
         # Split data
-        left_mask = X[:, best_feature] <= best_threshold
-        right_mask = ~left_mask
+        left_mask = X[:, best_feature][rows] <= best_threshold
         
-        # Build left and right subtrees
-        left_tree = self._build_tree(X[left_mask], y[left_mask], depth + 1, feature_indices)
-        right_tree = self._build_tree(X[right_mask], y[right_mask], depth + 1, feature_indices)
+        # Reserve the split node before its children so node ids stay in pre-order
+        node_id = self._add_node(nodes, np.mean(y_node), best_feature, best_threshold)
+        nodes['left'][node_id] = self._build_tree(X, y, rows[left_mask], nodes, depth + 1, feature_indices)
+        nodes['right'][node_id] = self._build_tree(X, y, rows[~left_mask], nodes, depth + 1, feature_indices)
+        return node_id
+    
+    def _set_nodes(self, nodes):
+        """Freeze the node lists into the flat array representation"""
+        self.feature_ = np.array(nodes['feature'], dtype=np.int32)
+        self.threshold_ = np.array(nodes['threshold'], dtype=np.float64)
+        self.children_left_ = np.array(nodes['left'], dtype=np.int32)
+        self.children_right_ = np.array(nodes['right'], dtype=np.int32)
+        self.value_ = np.array(nodes['value'], dtype=np.float64)
+        self._prepare_walk()
+    
+    def _prepare_walk(self):
+        """Derive the lookup tables used by apply(): leaves point to themselves, plus the tree depth"""
+        node_ids = np.arange(len(self.value_))
+        is_leaf = self.children_left_ == -1
+        self._walk_feature = np.where(is_leaf, 0, self.feature_).astype(np.intp)
+        self._walk_left = np.where(is_leaf, node_ids, self.children_left_).astype(np.intp)
+        self._walk_right = np.where(is_leaf, node_ids, self.children_right_).astype(np.intp)
         
-        return {
-            'feature': best_feature,
-            'threshold': best_threshold,
-            'left': left_tree,
-            'right': right_tree,
-            'is_leaf': False
-        }
+        if getattr(self, 'depth_', None) is None:
+            # Children always have larger ids than their parent (pre-order), so one forward pass suffices
+            depth = np.zeros(len(self.value_), dtype=np.intp)
+            for node_id in np.nonzero(~is_leaf)[0]:
+                depth[self.children_left_[node_id]] = depth[node_id] + 1
+                depth[self.children_right_[node_id]] = depth[node_id] + 1
+            self.depth_ = int(depth.max()) if len(depth) else 0
     
-    def _predict_sample(self, tree, sample):
-        """Predict for a single sample"""
-        if tree['is_leaf']:
-            return tree['value']
+    def _nodes_from_dict_tree(self, tree):
+        """Convert a nested-dict tree (models saved by older versions) to node lists"""
+        nodes = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': []}
         
-        if sample[tree['feature']] <= tree['threshold']:
-            return self._predict_sample(tree['left'], sample)
-        else:
-            return self._predict_sample(tree['right'], sample)
+        def visit(subtree):
+            if subtree['is_leaf']:
+                return self._add_node(nodes, subtree['value'])
+            node_id = self._add_node(nodes, 0.0, subtree['feature'], subtree['threshold'])
+            nodes['left'][node_id] = visit(subtree['left'])
+            nodes['right'][node_id] = visit(subtree['right'])
+            return node_id
+        
+        visit(tree)
+        return nodes
     
-    def fit(self, X, y):
-        """Train decision tree"""
-        X = np.array(X)
-        y = np.array(y).flatten()
+    def __getstate__(self):
+        """Pickle the node arrays as one packed record array instead of five separate arrays"""
+        state = {key: value for key, value in self.__dict__.items() if not key.startswith('_')}
+        if self.value_ is not None:
+            packed = np.empty(len(self.value_), dtype=TREE_NODE_DTYPE)
+            packed['feature'] = self.feature_
+            packed['threshold'] = self.threshold_
+            packed['left'] = self.children_left_
+            packed['right'] = self.children_right_
+            packed['value'] = self.value_
+            for key in ('feature_', 'threshold_', 'children_left_', 'children_right_', 'value_'):
+                del state[key]
+            state['nodes'] = packed
+        return state
+    
+    def __setstate__(self, state):
+        """Unpickle, upgrading models saved with the old nested-dict 'tree' attribute"""
+        packed = state.pop('nodes', None)
+        dict_tree = state.pop('tree', None)
+        self.__dict__.update(state)
+        
+        if packed is not None:
+            self.feature_ = np.ascontiguousarray(packed['feature'])
+            self.threshold_ = np.ascontiguousarray(packed['threshold'])
+            self.children_left_ = np.ascontiguousarray(packed['left'])
+            self.children_right_ = np.ascontiguousarray(packed['right'])
+            self.value_ = np.ascontiguousarray(packed['value'])
+            self._prepare_walk()
+        elif dict_tree is not None:
+            self._set_nodes(self._nodes_from_dict_tree(dict_tree))
+        elif 'value_' not in state:
+            self.feature_ = self.threshold_ = self.children_left_ = self.children_right_ = self.value_ = None
+    
+    @property
+    def node_count(self):
+        """Number of nodes in the fitted tree"""
+        return 0 if self.value_ is None else len(self.value_)
+    
+    def split_count(self):
+        """Number of internal (split) nodes in the fitted tree"""
+        return 0 if self.value_ is None else int(np.count_nonzero(self.children_left_ != -1))
+    
+    def fit(self, X, y, rows=None, features=None):
+        """
+        Train decision tree.
+        
+        rows (indices, repeats allowed) and features (column indices) restrict training to a
+        sample of X without copying it, as if fitted on X[np.ix_(rows, features)] and y[rows]:
+        the fitted tree's feature ids are positions in features.
+        """
+        X = np.asarray(X)
+        y = np.asarray(y).ravel()
         
         if self.random_state is not None:
             random.seed(self.random_state)
             np.random.seed(self.random_state)
         
-        self.tree = self._build_tree(X, y)
+        rows = np.arange(len(X)) if rows is None else np.asarray(rows)
+        feature_indices = list(range(X.shape[1])) if features is None else [int(column) for column in features]
+        nodes = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': []}
+        self._build_tree(X, y, rows, nodes, 0, feature_indices)
+        if features is not None:
+            position = {column: i for i, column in enumerate(feature_indices)}
+            nodes['feature'] = [position.get(column, -1) for column in nodes['feature']]
+        self.depth_ = None
+        self._set_nodes(nodes)
+        PROFILER.count('trees_built')
+        PROFILER.count('nodes_split', self.split_count())
         return self
     
+    def apply(self, X):
+        """Leaf node id reached by each row of X, walking all rows down the tree one level at a time"""
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if getattr(self, '_walk_feature', None) is None:
+            # Trees loaded from a model file derive their lookup tables on first use
+            self._prepare_walk()
+        
+        rows = np.arange(len(X))
+        node_ids = np.zeros(len(X), dtype=np.intp)
+        # Leaves point to themselves, so rows that reach a leaf early simply stay put
+        for _ in range(self.depth_):
+            go_left = X[rows, self._walk_feature[node_ids]] <= self.threshold_[node_ids]
+            node_ids = np.where(go_left, self._walk_left[node_ids], self._walk_right[node_ids])
+        
+        return node_ids
+    
     def predict(self, X):
         """Make predictions"""
-        X = np.array(X)
-        predictions = []
-        for sample in X:
-            pred = self._predict_sample(self.tree, sample)
-            predictions.append(pred)
-        return np.array(predictions)
+        return self.value_[self.apply(X)]
+
+
+# Process pools for parallel forest training, created on first use and reused across fits
+_PROCESS_POOLS = {}
+_PROCESS_POOLS_LOCK = threading.Lock()
+
+
+def _get_process_pool(n_workers):
+    """Shared ProcessPoolExecutor with n_workers processes"""
+    with _PROCESS_POOLS_LOCK:
+        pool = _PROCESS_POOLS.get(n_workers)
+        if pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=n_workers)
+            _PROCESS_POOLS[n_workers] = pool
+    return pool
+
+
+def _reset_locks_after_fork():
+    """A forked child has only the forking thread, so locks held by other server threads must be recreated"""
+    global _PROCESS_POOLS_LOCK
+    _PROCESS_POOLS_LOCK = threading.Lock()
+    PROFILER._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+
+def _send_candidate_result(connection, model, X, y, cv):
+    """Deadline worker process: send evaluate_candidate's result, or its exception, back through connection"""
+    try:
+        connection.send((True, evaluate_candidate(model, X, y, cv)))
+    except Exception as e:
+        connection.send((False, e))
+    finally:
+        connection.close()
+
+
+# Measured cost in ms of starting ('start') and of stopping ('stop') one deadline worker process,
+# averaged over budgeted selections; None until the first measurement
+_WORKER_COST_MS = {'start': None, 'stop': None}
+
+
+def _worker_cost_ms(name):
+    """Estimated start or stop cost of one deadline worker process in ms"""
+    cost = _WORKER_COST_MS[name]
+    if cost is None:
+        # Not measured yet: forking takes a few ms, spawning re-imports numpy and this module
+        import multiprocessing
+        fork = multiprocessing.get_start_method() == 'fork'
+        cost = {'start': 5.0, 'stop': 1.0}[name] if fork else {'start': 150.0, 'stop': 5.0}[name]
+    return cost
+
+
+def _record_worker_cost(name, elapsed_ms, n_processes):
+    """Fold the measured cost of starting or stopping n_processes workers into the estimate"""
+    if n_processes:
+        measured = elapsed_ms / n_processes
+        previous = _WORKER_COST_MS[name]
+        _WORKER_COST_MS[name] = measured if previous is None else (previous + measured) / 2
+
+
+def _resolve_n_jobs(n_jobs):
+    """Number of worker processes for an n_jobs setting (None/1 = serial, -1 = all cores)"""
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def stack_trees(trees, feature_maps=None):
+    """
+    Several fitted trees as one node table: (roots, feature, threshold, left, right, value, depth).
+    
+    feature_maps, if given, maps each tree's feature ids back to columns of the full feature
+    matrix. Child ids are offset into the shared arrays, and leaves point to themselves.
+    """
+    sizes = np.array([tree.node_count for tree in trees], dtype=np.intp)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    # Every node's tree root, i.e. the offset of its tree's ids in the shared arrays
+    node_roots = np.repeat(roots, sizes)
+    node_ids = np.arange(int(sizes.sum()), dtype=np.intp)
+    
+    left = np.concatenate([tree.children_left_ for tree in trees]).astype(np.intp)
+    is_leaf = left == -1
+    feature = np.where(is_leaf, 0, np.concatenate([tree.feature_ for tree in trees]).astype(np.intp))
+    if feature_maps is not None:
+        map_sizes = np.array([len(feature_map) for feature_map in feature_maps], dtype=np.intp)
+        map_starts = np.concatenate([[0], np.cumsum(map_sizes)[:-1]]).astype(np.intp)
+        feature = np.concatenate(feature_maps).astype(np.intp)[np.repeat(map_starts, sizes) + feature]
+    right = np.concatenate([tree.children_right_ for tree in trees]).astype(np.intp)
+    return (
+        roots,
+        np.where(is_leaf, 0, feature),
+        np.concatenate([tree.threshold_ for tree in trees]),
+        np.where(is_leaf, node_ids, left + node_roots),
+        np.where(is_leaf, node_ids, right + node_roots),
+        np.concatenate([tree.value_ for tree in trees]),
+        max(tree.depth_ for tree in trees)
+    )
+
+
+def stacked_leaf_ids(stacked, X):
+    """Leaf reached in every stacked tree by every row of X, shape (n_trees, n_rows); all trees step down together"""
+    roots, feature, threshold, left, right, _, depth = stacked
+    rows = np.arange(len(X))
+    node_ids = np.repeat(roots[:, None], len(X), axis=1)
+    for _ in range(depth):
+        go_left = X[rows, feature[node_ids]] <= threshold[node_ids]
+        node_ids = np.where(go_left, left[node_ids], right[node_ids])
+    return node_ids
+
+
+def pack_trees(trees, float_dtype=np.float64):
+    """
+    Fitted trees as concatenated node arrays plus per-tree node counts and depths (the model file
+    layout). Node fields keep the TREE_NODE_DTYPE types; thresholds and values use float_dtype.
+    """
+    def concatenate(field, dtype):
+        return np.concatenate([getattr(tree, field) for tree in trees] or [np.empty(0)]).astype(dtype, copy=False)
+    
+    threshold = concatenate('threshold_', np.float64)
+    narrowed = threshold.astype(float_dtype)
+    # Round narrowed thresholds up, so training values equal to a threshold still go left
+    below = narrowed < threshold
+    narrowed[below] = np.nextafter(narrowed[below], narrowed.dtype.type(np.inf))
+    return {
+        'tree_nodes': np.array([tree.node_count for tree in trees], dtype=np.int32),
+        'tree_depths': np.array([tree.depth_ for tree in trees], dtype=np.int32),
+        'feature': concatenate('feature_', TREE_NODE_DTYPE['feature']),
+        'threshold': narrowed,
+        'left': concatenate('children_left_', TREE_NODE_DTYPE['left']),
+        'right': concatenate('children_right_', TREE_NODE_DTYPE['right']),
+        'value': concatenate('value_', float_dtype),
+    }
+
+
+def unpack_trees(arrays, max_depth):
+    """DecisionTreeRegressors whose node arrays are views into packed arrays (see pack_trees)"""
+    trees = []
+    start = 0
+    for node_count, depth in zip(arrays['tree_nodes'].tolist(), arrays['tree_depths'].tolist()):
+        end = start + node_count
+        tree = DecisionTreeRegressor(max_depth=max_depth, random_state=None)
+        tree.feature_ = arrays['feature'][start:end]
+        tree.threshold_ = arrays['threshold'][start:end]
+        tree.children_left_ = arrays['left'][start:end]
+        tree.children_right_ = arrays['right'][start:end]
+        tree.value_ = arrays['value'][start:end]
+        tree.depth_ = depth
+        trees.append(tree)
+        start = end
+    return trees
+
+
+def _fit_forest_trees(X, y, seeds, max_depth):
+    """Fit one forest tree per seed; module-level so worker processes can run it"""
+    return [RandomForestRegressor._fit_tree(X, y, seed, max_depth) for seed in seeds]
 
 
 class RandomForestRegressor:
-    """Custom Random Forest Regressor implementation from scratch"""
-    def __init__(self, n_estimators=100, max_depth=10, random_state=42):
+    """
+    Custom Random Forest Regressor implementation from scratch.
+    
+    Every tree draws its bootstrap sample and feature subset from its own RNG stream,
+    spawned from random_state, so results are identical for any n_jobs.
+    
+    For prediction all trees are concatenated into one set of node arrays (built on first use,
+    not pickled), so every tree walks every row in the same vectorized step.
+    """
+    def __init__(self, n_estimators=100, max_depth=10, random_state=42, n_jobs=1):
         self.n_estimators = n_estimators
         self.max_depth = max_depth
         self.random_state = random_state
+        self.n_jobs = n_jobs
         self.trees = []
         self.feature_indices_per_tree = []
+        self._stacked = None
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_stacked', None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stacked = None
     
-    def _bootstrap_sample(self, X, y):
-        """Create bootstrap sample (sampling with replacement)"""
-        n_samples = len(X)
-        indices = np.random.choice(n_samples, size=n_samples, replace=True)
-        return X[indices], y[indices]
+    def _to_arrays(self, float_dtype):
+        """Fitted state as (params, arrays) for a model file"""
+        arrays = pack_trees(self.trees, float_dtype)
+        arrays['feature_indices'] = np.array(self.feature_indices_per_tree, dtype=np.int32).reshape(len(self.trees), -1)
+        return init_params(self), arrays
     
-    def _random_feature_subset(self, n_features):
+    @classmethod
+    def _from_arrays(cls, params, arrays):
+        model = cls(**params)
+        model.trees = unpack_trees(arrays, model.max_depth)
+        model.feature_indices_per_tree = list(arrays['feature_indices'])
+        return model
+    
+    @staticmethod
+    def _bootstrap_indices(rng, n_samples):
+        """Create bootstrap sample indices (sampling with replacement)"""
+        return rng.integers(0, n_samples, size=n_samples)
+    
+    @staticmethod
+    def _random_feature_subset(rng, n_features):
         """Select random subset of features (feature bagging)"""
         # Use sqrt of features as default (common in Random Forest)
         n_features_to_select = int(np.sqrt(n_features))
         if n_features_to_select < 1:
             n_features_to_select = 1
-        return np.random.choice(n_features, size=n_features_to_select, replace=False)
+        return rng.choice(n_features, size=n_features_to_select, replace=False)
+    
+    @staticmethod
+    def _fit_tree(X, y, seed, max_depth):
+        """Fit a single tree on a bootstrap sample and random feature subset drawn from seed"""
+        rng = np.random.default_rng(seed)
+        indices = RandomForestRegressor._bootstrap_indices(rng, len(X))
+        feature_indices = RandomForestRegressor._random_feature_subset(rng, X.shape[1])
+        
+        # Train tree on bootstrap sample with selected features
+        tree = DecisionTreeRegressor(max_depth=max_depth, random_state=None)
+        tree.fit(X, y, rows=indices, features=feature_indices)
+        return tree, feature_indices
+    
+    def _tree_seeds(self):
+        """Independent per-tree seed sequences derived from random_state"""
+        return np.random.SeedSequence(self.random_state).spawn(self.n_estimators)
     
     def fit(self, X, y):
         """Train Random Forest"""
-        X = np.array(X)
-        y = np.array(y).flatten()
+        X = np.asarray(X)
+        y = np.asarray(y).ravel()
         
-        if self.random_state is not None:
-            random.seed(self.random_state)
-            np.random.seed(self.random_state)
+        seeds = self._tree_seeds()
+        n_workers = min(_resolve_n_jobs(self.n_jobs), self.n_estimators)
+        
+        if n_workers > 1:
+            # Contiguous chunks of seeds per worker keep the tree order (and the result) fixed
+            chunks = [[seeds[i] for i in chunk] for chunk in np.array_split(np.arange(len(seeds)), n_workers)]
+            pool = _get_process_pool(n_workers)
+            futures = [pool.submit(_fit_forest_trees, X, y, chunk, self.max_depth) for chunk in chunks if len(chunk)]
+            fitted = [tree_and_features for future in futures for tree_and_features in future.result()]
+            # Trees built in workers are not seen by this process's profiler
+            PROFILER.count('trees_built', len(fitted))
+            PROFILER.count('nodes_split', sum(tree.split_count() for tree, _ in fitted))
+        else:
+            fitted = _fit_forest_trees(X, y, seeds, self.max_depth)
+        
+        self.trees = [tree for tree, _ in fitted]
+        self.feature_indices_per_tree = [feature_indices for _, feature_indices in fitted]
+        self._stacked = None
+        return self
+    
+    def _stacked_trees(self):
+        """All trees as one node table (see stack_trees), built on first use"""
+        if self._stacked is None:
+            self._stacked = stack_trees(self.trees, self.feature_indices_per_tree)
+        return self._stacked
+    
+    def predict(self, X):
+        """Make predictions by averaging predictions from all trees"""
+        X = np.asarray(X)
+        # Ensure X is 2D
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        
+        if not self.trees:
+            return np.zeros(len(X))
         
-        n_features = X.shape[1]
+        stacked = self._stacked_trees()
+        # Sum tree by tree (cumsum is strictly sequential) so results match adding trees one at a time
+        return np.cumsum(stacked[5][stacked_leaf_ids(stacked, X)], axis=0)[-1] / len(self.trees)
+
+
+class HistGradientBoostingRegressor:
+    """
+    Custom histogram-based gradient boosting regressor (least squares) implemented from scratch.
+    
+    Every feature is bucketed once into at most max_bins uint8 bins (quantile edges) shared by all
+    boosting rounds. Each round fits a shallow tree to the residuals from per-node gradient
+    histograms; a child's histogram is its parent's minus its sibling's, so only the smaller child
+    is counted. Leaf values are shrunk by learning_rate.
+    
+    With enough rows, the last validation_fraction of them (the most recent months) choose the
+    number of rounds by early stopping, then the model is refitted on all rows for that many rounds.
+    Trees are stored as DecisionTreeRegressor node arrays with real-valued thresholds, so predict
+    works on raw features without binning.
+    """
+    def __init__(self, max_iter=100, learning_rate=0.1, max_depth=3, max_bins=32, min_samples_leaf=2,
+                 l2_regularization=0.0, validation_fraction=0.2, n_iter_no_change=10):
+        self.max_iter = max_iter
+        self.learning_rate = learning_rate
+        self.max_depth = max_depth
+        self.max_bins = max_bins
+        self.min_samples_leaf = min_samples_leaf
+        self.l2_regularization = l2_regularization
+        self.validation_fraction = validation_fraction
+        self.n_iter_no_change = n_iter_no_change
+        self.baseline_ = 0.0
         self.trees = []
-        self.feature_indices_per_tree = []
+        self.n_iter_ = 0
+        self._stacked = None
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_stacked', None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stacked = None
+    
+    def _to_arrays(self, float_dtype):
+        """Fitted state as (params, arrays) for a model file"""
+        arrays = pack_trees(self.trees, float_dtype)
+        arrays['bin_thresholds_'] = np.asarray(self.bin_thresholds_, dtype=float_dtype)
+        return dict(init_params(self), baseline_=float(self.baseline_), n_iter_=int(self.n_iter_)), arrays
+    
+    @classmethod
+    def _from_arrays(cls, params, arrays):
+        params = dict(params)
+        baseline, n_iter = params.pop('baseline_'), params.pop('n_iter_')
+        model = cls(**params)
+        model.baseline_, model.n_iter_ = baseline, n_iter
+        model.bin_thresholds_ = arrays['bin_thresholds_']
+        model.trees = unpack_trees(arrays, model.max_depth)
+        return model
+    
+    def _bin_thresholds(self, X):
+        """
+        Per-feature split thresholds, padded with +inf into an (n_features, max_bins - 1) array.
+        
+        Features with few distinct values split between each pair of neighbours; others at quantiles.
+        """
+        n_thresholds = min(self.max_bins, 256) - 1
+        thresholds = np.full((X.shape[1], n_thresholds), np.inf)
+        for j in range(X.shape[1]):
+            distinct = np.unique(X[:, j])
+            if len(distinct) <= n_thresholds + 1:
+                edges = (distinct[:-1] + distinct[1:]) / 2
+            else:
+                edges = np.unique(np.quantile(X[:, j], np.linspace(0, 1, n_thresholds + 2)[1:-1]))
+            thresholds[j, :len(edges)] = edges
+        return thresholds
+    
+    def _bin(self, X):
+        """uint8 bin of every value: bin b holds values in (threshold[b-1], threshold[b]]"""
+        binned = np.empty(X.shape, dtype=np.uint8)
+        for j in range(X.shape[1]):
+            binned[:, j] = np.searchsorted(self.bin_thresholds_[j], X[:, j], side='left')
+        return binned
+    
+    def _grow_tree(self, binned, flat_bins, gradients, predictions):
+        """
+        One least-squares tree on the current gradients, as a DecisionTreeRegressor.
+        
+        Each training row's leaf value is added to predictions in place as the leaves are made.
+        """
+        n_features = binned.shape[1]
+        n_bins = self.bin_thresholds_.shape[1] + 1
+        lam = self.l2_regularization
+        min_leaf = max(1, self.min_samples_leaf)
+        nodes = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': []}
+        builder = DecisionTreeRegressor(max_depth=self.max_depth, random_state=None)
+        
+        def histograms(rows):
+            flat = flat_bins[rows].ravel()
+            grad_hist = np.bincount(flat, weights=np.repeat(gradients[rows], n_features),
+                                    minlength=n_features * n_bins).reshape(n_features, n_bins)
+            count_hist = np.bincount(flat, minlength=n_features * n_bins).reshape(n_features, n_bins)
+            return grad_hist, count_hist
         
-        for i in range(self.n_estimators):
-            # Bootstrap sampling
-            X_boot, y_boot = self._bootstrap_sample(X, y)
+        def leaf(rows, value):
+            predictions[rows] += value
+            return builder._add_node(nodes, value)
+        
+        def build(rows, grad_hist, count_hist, depth):
+            n = len(rows)
+            grad_sum = gradients[rows].sum()
+            value = self.learning_rate * grad_sum / (n + lam)
+            if depth >= self.max_depth or n < 2 * min_leaf:
+                return leaf(rows, value)
+            
+            # Left child of a split after bin b gets bins 0..b
+            grad_left = np.cumsum(grad_hist, axis=1)[:, :-1]
+            n_left = np.cumsum(count_hist, axis=1)[:, :-1]
+            n_right = n - n_left
+            with np.errstate(divide='ignore', invalid='ignore'):
+                gain = (grad_left ** 2 / (n_left + lam) + (grad_sum - grad_left) ** 2 / (n_right + lam)
+                        - grad_sum ** 2 / (n + lam))
+            gain[(n_left < min_leaf) | (n_right < min_leaf)] = -np.inf
+            best = np.argmax(gain)
+            feature, split_bin = divmod(int(best), n_bins - 1)
+            if not gain[feature, split_bin] > 1e-12 * max(1.0, grad_sum ** 2 / (n + lam)):
+                return leaf(rows, value)
             
-            # Feature bagging - select random subset of features
-            feature_indices = self._random_feature_subset(n_features)
-            self.feature_indices_per_tree.append(feature_indices)
+            goes_left = binned[rows, feature] <= split_bin
+            left_rows, right_rows = rows[goes_left], rows[~goes_left]
+            # Count only the smaller child; the larger one is the parent minus it
+            if len(left_rows) <= len(right_rows):
+                left_hist = histograms(left_rows)
+                right_hist = (grad_hist - left_hist[0], count_hist - left_hist[1])
+            else:
+                right_hist = histograms(right_rows)
+                left_hist = (grad_hist - right_hist[0], count_hist - right_hist[1])
             
-            # Train tree on bootstrap sample with selected features
-            tree = DecisionTreeRegressor(max_depth=self.max_depth, random_state=self.random_state + i)
-            X_boot_selected = X_boot[:, feature_indices]
-            tree.fit(X_boot_selected, y_boot)
-            self.trees.append(tree)
+            node_id = builder._add_node(nodes, value, feature, float(self.bin_thresholds_[feature, split_bin]))
+            nodes['left'][node_id] = build(left_rows, *left_hist, depth + 1)
+            nodes['right'][node_id] = build(right_rows, *right_hist, depth + 1)
+            return node_id
+        
+        rows = np.arange(len(binned))
+        build(rows, *histograms(rows), 0)
+        builder._set_nodes(nodes)
+        return builder
+    
+    def _boost(self, binned, y, n_rounds, X_val=None, y_val=None):
+        """
+        Fit up to n_rounds trees: returns (baseline, trees, best number of rounds on the validation rows).
+        
+        Without validation rows every round is kept.
+        """
+        n_features = binned.shape[1]
+        n_bins = self.bin_thresholds_.shape[1] + 1
+        # Flat histogram slot of every (row, feature), computed once for all rounds and nodes
+        flat_bins = binned.astype(np.intp) + np.arange(n_features) * n_bins
+        baseline = float(np.mean(y))
+        predictions = np.full(len(y), baseline)
+        trees = []
+        
+        if X_val is not None:
+            val_predictions = np.full(len(y_val), baseline)
+            best_loss, best_rounds = np.mean((y_val - val_predictions) ** 2), 0
+        
+        for round_index in range(n_rounds):
+            trees.append(self._grow_tree(binned, flat_bins, y - predictions, predictions))
+            if X_val is not None:
+                val_predictions += trees[-1].predict(X_val)
+                loss = np.mean((y_val - val_predictions) ** 2)
+                if loss < best_loss:
+                    best_loss, best_rounds = loss, round_index + 1
+                elif round_index + 1 - best_rounds >= self.n_iter_no_change:
+                    break
         
+        return baseline, trees, (best_rounds if X_val is not None else len(trees))
+    
+    def fit(self, X, y):
+        """Train gradient-boosted trees, choosing the number of rounds on a validation tail when possible"""
+        X = as_float_array(X)
+        y = np.asarray(y, dtype=np.float64).ravel()
+        
+        self.bin_thresholds_ = self._bin_thresholds(X)
+        binned = self._bin(X)
+        
+        n_rounds = self.max_iter
+        n_val = int(len(y) * self.validation_fraction) if self.n_iter_no_change else 0
+        if n_val >= 2 and len(y) - n_val >= 2 * self.min_samples_leaf:
+            _, _, n_rounds = self._boost(binned[:-n_val], y[:-n_val], self.max_iter, X[-n_val:], y[-n_val:])
+            # Keep at least one round so the model is more than the mean
+            n_rounds = max(1, n_rounds)
+        
+        self.baseline_, self.trees, _ = self._boost(binned, y, n_rounds)
+        self.n_iter_ = len(self.trees)
+        self._stacked = None
+        PROFILER.count('trees_built', len(self.trees))
+        PROFILER.count('nodes_split', sum(tree.split_count() for tree in self.trees))
         return self
     
     def predict(self, X):
-        """Make predictions by averaging predictions from all trees"""
-        X = np.array(X)
-        # Ensure X is 2D
+        """Baseline plus the sum of all trees' leaf values"""
+        X = as_float_array(X)
         if X.ndim == 1:
             X = X.reshape(1, -1)
         
-        predictions = []
-        
-        for idx in range(len(X)):
-            sample = X[idx]
-            tree_predictions = []
-            for i, tree in enumerate(self.trees):
-                # Use same feature subset as training
-                feature_indices = self.feature_indices_per_tree[i]
-                # Select features for this sample
-                sample_selected = sample[feature_indices]
-                # Ensure it's 2D for tree prediction
-                if sample_selected.ndim == 1:
-                    sample_selected = sample_selected.reshape(1, -1)
-                pred_result = tree.predict(sample_selected)
-                # Handle both scalar and array returns
-                if np.isscalar(pred_result):
-                    pred = pred_result
-                else:
-                    pred = pred_result[0] if len(pred_result) > 0 else 0.0
-                tree_predictions.append(pred)
-            
-            # Average predictions from all trees
-            avg_pred = np.mean(tree_predictions)
-            predictions.append(avg_pred)
+        if not self.trees:
+            return np.full(len(X), self.baseline_)
         
-        return np.array(predictions)
+        if self._stacked is None:
+            self._stacked = stack_trees(self.trees)
+        return self.baseline_ + np.cumsum(self._stacked[5][stacked_leaf_ids(self._stacked, X)], axis=0)[-1]
 
 
 def mean_absolute_error(y_true, y_pred):
@@ -364,256 +1182,1484 @@ def r2_score(y_true, y_pred):
     return 1 - (ss_res / ss_tot)
 
 
-def cross_val_score(model, X, y, cv=3, scoring='r2'):
-    """Custom cross-validation implementation"""
-    n_samples = len(X)
-    fold_size = n_samples // cv
-    scores = []
-    
-    for i in range(cv):
-        # Create train/test split
-        start_idx = i * fold_size
-        end_idx = (i + 1) * fold_size if i < cv - 1 else n_samples
-        
-        test_indices = list(range(start_idx, end_idx))
-        train_indices = [idx for idx in range(n_samples) if idx not in test_indices]
-        
-        X_train, X_test = X[train_indices], X[test_indices]
-        y_train, y_test = y[train_indices], y[test_indices]
-        
-        # Create a fresh model instance based on type
-        if hasattr(model, 'n_estimators'):
-            # For Random Forest
-            model_copy = RandomForestRegressor(
-                n_estimators=model.n_estimators,
-                max_depth=model.max_depth,
-                random_state=model.random_state
-            )
-        else:
-            # For Linear Regression (default)
-            model_copy = LinearRegression()
-        
-        # Train model
-        model_copy.fit(X_train, y_train)
-        predictions = model_copy.predict(X_test)
-        
-        # Calculate score
-        if scoring == 'r2':
-            score = r2_score(y_test, predictions)
-        elif scoring == 'mae':
-            score = -mean_absolute_error(y_test, predictions)  # Negative because higher is better
-        else:
-            score = r2_score(y_test, predictions)
-        
-        scores.append(score)
-    
-    return np.array(scores)
+def regression_metrics(y_true, y_pred):
+    """MAE, MAPE (%), RMSE and R² as reported to the dashboard"""
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    return {
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'mape': float(np.mean(np.abs((y_true - y_pred) / np.maximum(y_true, 1))) * 100),
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        'r2_score': float(r2_score(y_true, y_pred))
+    }
 
 
-try:
-    import mysql.connector
-    MYSQL_AVAILABLE = True
-except ImportError:
-    MYSQL_AVAILABLE = False
-    print("Warning: mysql-connector-python not installed. Install with: pip3 install mysql-connector-python")
+# ============================================================================
+# TIME-SERIES CROSS-VALIDATION
+# ============================================================================
 
-class ExpenseForecaster:
-    def __init__(self, db_config=None, db_path=None, model_storage_path=None):
-        self.db_config = db_config
-        self.db_path = db_path
-        self.db_type = 'mysql' if db_config else 'sqlite'
-        self.model_storage_path = model_storage_path or 'storage/app/ml_models'
-        self.models = {
-            'linear': LinearRegression(),
-            'random_forest': RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10)
-        }
-        self.scaler = StandardScaler()
-        
-        # Ensure model storage directory exists
-        os.makedirs(self.model_storage_path, exist_ok=True)
-        
-    def get_user_data(self, user_id, category_id, target_month=None, target_year=None):
-        """Fetch user expense data from database, optionally filtered up to target month"""
-        try:
-            print(f"DEBUG: Attempting to connect to database for user {user_id}, category {category_id}", file=sys.stderr)
-            
-            if self.db_type == 'mysql':
-                if not MYSQL_AVAILABLE:
-                    print("ERROR: MySQL connector not available", file=sys.stderr)
-                    return None
-                # Connect to MySQL
-                print(f"DEBUG: Connecting to MySQL: {self.db_config['host']}:{self.db_config['port']}/{self.db_config['database']}", file=sys.stderr)
-                conn = mysql.connector.connect(
-                    host=self.db_config['host'],
-                    port=self.db_config['port'],
-                    database=self.db_config['database'],
-                    user=self.db_config['username'],
-                    password=self.db_config['password']
-                )
-                print("DEBUG: MySQL connection successful", file=sys.stderr)
-            else:
-                # SQLite connection
-                if not os.path.exists(self.db_path):
-                    print(f"ERROR: SQLite database not found at {self.db_path}", file=sys.stderr)
-                    return None
-                conn = sqlite3.connect(self.db_path)
-                print("DEBUG: SQLite connection successful", file=sys.stderr)
-
-            # Build query with optional date filter
-            if target_month and target_year:
-                # Only get data up to (but not including) the target month
-                target_date_str = f"{target_year}-{target_month:02d}-01"
-                query = f"""
-                SELECT e.amount, e.date
-                FROM expenses e
-                WHERE e.user_id = {user_id} AND e.category_id = {category_id}
-                AND e.date < '{target_date_str}'
-                ORDER BY e.date
-                """
-                print(f"DEBUG: Filtering data up to {target_year}-{target_month:02d} (exclusive)", file=sys.stderr)
-            else:
-                # Get all data if no target specified
-                query = f"""
-                SELECT e.amount, e.date
-                FROM expenses e
-                WHERE e.user_id = {user_id} AND e.category_id = {category_id}
-                ORDER BY e.date
-                """
-            
-            print(f"DEBUG: Executing query: {query}", file=sys.stderr)
-
-            df = pd.read_sql_query(query, conn)
-            print(f"DEBUG: Query returned {len(df)} rows", file=sys.stderr)
-            conn.close()
+def init_params(model):
+    """A model's constructor parameters, read back from its attributes"""
+    import inspect
+    return {
+        name: getattr(model, name)
+        for name in inspect.signature(type(model).__init__).parameters
+        if name != 'self' and hasattr(model, name)
+    }
 
-            if df.empty:
-                print("DEBUG: DataFrame is empty", file=sys.stderr)
-                return None
 
-            # Convert date column
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.sort_values('date')
-            print(f"DEBUG: Processed {len(df)} rows of data", file=sys.stderr)
-            
-            # Aggregate expenses by month for forecasting monthly totals
-            df['month_key'] = df['date'].dt.to_period('M')
-            df_monthly = df.groupby('month_key', as_index=False).agg({
-                'amount': 'sum'  # Sum expenses per month
-            })
-            df_monthly['date'] = pd.to_datetime(df_monthly['month_key'].astype(str))
-            df_monthly = df_monthly[['date', 'amount']].sort_values('date')
-            
-            print(f"DEBUG: Aggregated to {len(df_monthly)} monthly data points", file=sys.stderr)
-            
-            # No data smoothing - use raw monthly data for accurate predictions
+def clone_model(model, **overrides):
+    """Unfitted copy of a model with the same constructor parameters"""
+    return type(model)(**dict(init_params(model), **overrides))
 
-            # Provide defaults for optional engineered fields
-            df_monthly['budget_percentage'] = 0.0
-            df_monthly['income'] = 0.0
 
-            return df_monthly
-            
-        except Exception as e:
-            print(f"ERROR in get_user_data: {str(e)}", file=sys.stderr)
+def _model_key(model):
+    """Hashable identity of a model's type and constructor parameters"""
+    import inspect
+    return (type(model).__name__,) + tuple(
+        (name, getattr(model, name, None))
+        for name in inspect.signature(type(model).__init__).parameters
+        if name not in ('self', 'n_jobs')  # n_jobs does not change the fitted model
+    )
+
+
+def expanding_window_splits(n_samples, n_splits=3, min_train_size=None):
+    """
+    Rolling-origin folds: each fold trains on every sample before its test block.
+    
+    The last n_splits blocks of test_size samples are the test sets, so every model is scored
+    only on data that comes after its training data. Returns (train_indices, test_indices) pairs.
+    """
+    if min_train_size is None:
+        min_train_size = max(1, n_samples // (n_splits + 1))
+    n_splits = max(1, min(n_splits, n_samples - min_train_size))
+    test_size = max(1, (n_samples - min_train_size) // n_splits)
+    first_test = n_samples - n_splits * test_size
+    
+    splits = []
+    for i in range(n_splits):
+        test_start = first_test + i * test_size
+        splits.append((np.arange(test_start), np.arange(test_start, test_start + test_size)))
+    return splits
+
+
+def take_rows(array, indices):
+    """array[indices], as a view instead of a copy when indices are one ascending run (every expanding-window fold is)"""
+    if len(indices) and indices[-1] - indices[0] == len(indices) - 1 and np.all(indices[1:] > indices[:-1]):
+        return array[indices[0]:indices[-1] + 1]
+    return array[indices]
+
+
+class FoldCache:
+    """
+    LRU of out-of-sample predictions keyed by model parameters and the exact train/test data.
+    
+    Fits are deterministic for a given model configuration and data, so a repeated evaluation
+    (the same pair re-scored, or selection followed by performance metrics) reuses predictions.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(model, X_train, y_train, X_test):
+        import hashlib
+        digest = hashlib.blake2b(digest_size=16)
+        for array in (X_train, y_train, X_test):
+            # Row slices of a C-contiguous matrix are contiguous already, so this hashes them in place
+            array = np.ascontiguousarray(array)
+            digest.update(f'{array.dtype.str}{array.shape}'.encode())
+            digest.update(array)
+        return _model_key(model), digest.digest()
+    
+    def get(self, key):
+        predictions = self._entries.get(key)
+        if predictions is None:
+            self.misses += 1
             return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return predictions
     
+    def put(self, key, predictions):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = predictions
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
     
-    def prepare_features(self, df):
-        """Create features for ML model"""
-        if len(df) < 3:  # Need at least 3 data points for meaningful features (reduced from 6 for predictions)
-            return None, None
-            
-        # Ensure optional columns exist
-        if 'budget_percentage' not in df.columns:
-            df['budget_percentage'] = 0.0
-        if 'income' not in df.columns:
-            df['income'] = 0.0
-            
-        # Basic features
-        df['month'] = df['date'].dt.month
-        df['year'] = df['date'].dt.year
-        df['day_of_week'] = df['date'].dt.dayofweek
-        
-        # Time-based features - use forward fill to handle NaNs at the start
-        first_amount = df['amount'].iloc[0] if len(df) > 0 else 0.0
-        df['previous_month'] = df['amount'].shift(1).fillna(first_amount)
-        df['previous_2months'] = df['amount'].shift(2).fillna(first_amount)
-        df['previous_3months'] = df['amount'].shift(3).fillna(first_amount)
-        
-        # Use only past values for rolling features to avoid leakage
-        past_amount = df['amount'].shift(1).fillna(first_amount)
-        
-        df['rolling_3m'] = past_amount.rolling(3, min_periods=1).mean().fillna(first_amount)
-        df['rolling_6m'] = past_amount.rolling(6, min_periods=1).mean().fillna(first_amount)
-        # Only add rolling_12m if we have enough data (12+ months)
-        if len(df) >= 12:
-            df['rolling_12m'] = past_amount.rolling(12, min_periods=1).mean().fillna(first_amount)
+    def __len__(self):
+        return len(self._entries)
+
+
+def _fit_predict(model, X_train, y_train, X_test):
+    """Fit an unfitted model copy and predict the test rows; module-level so worker processes can run it"""
+    model.fit(X_train, y_train)
+    return np.asarray(model.predict(X_test), dtype=np.float64)
+
+
+def fit_predict(model, X_train, y_train, X_test, cache=None):
+    """Out-of-sample predictions from a clone of model, served from cache when available"""
+    key = FoldCache.key(model, X_train, y_train, X_test) if cache is not None else None
+    if key is not None:
+        predictions = cache.get(key)
+        if predictions is not None:
+            return predictions
+    predictions = _fit_predict(clone_model(model), X_train, y_train, X_test)
+    if key is not None:
+        cache.put(key, predictions)
+    return predictions
+
+
+def _score(scoring, y_true, y_pred):
+    if scoring == 'mae':
+        return -mean_absolute_error(y_true, y_pred)  # Negative because higher is better
+    return r2_score(y_true, y_pred)
+
+
+@profiled('cv')
+def cross_val_fold_predictions(model, X, y, cv=3, n_jobs=1, cache=None):
+    """
+    Expanding-window splits and each fold's out-of-sample predictions.
+    
+    Folds come from expanding_window_splits, each fitted on a fresh clone of model. With
+    n_jobs > 1 uncached folds run in parallel worker processes; cached folds are not refitted.
+    Returns (splits, predictions) with one prediction array per split.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    splits = expanding_window_splits(len(X), cv)
+    
+    predictions = [None] * len(splits)
+    keys = [None] * len(splits)
+    pending = []
+    for i, (train_idx, test_idx) in enumerate(splits):
+        if cache is not None:
+            keys[i] = FoldCache.key(model, take_rows(X, train_idx), take_rows(y, train_idx), take_rows(X, test_idx))
+            predictions[i] = cache.get(keys[i])
+        if predictions[i] is None:
+            pending.append(i)
+    
+    PROFILER.count('cv_folds_fitted', len(pending))
+    PROFILER.count('cv_folds_cached', len(splits) - len(pending))
+    n_workers = min(_resolve_n_jobs(n_jobs), len(pending))
+    if n_workers > 1:
+        # Folds already run in separate processes, so each fold's model fits serially
+        pool = _get_process_pool(n_workers)
+        futures = {
+            i: pool.submit(_fit_predict, clone_model(model, n_jobs=1) if hasattr(model, 'n_jobs') else clone_model(model),
+                           take_rows(X, splits[i][0]), take_rows(y, splits[i][0]), take_rows(X, splits[i][1]))
+            for i in pending
+        }
+        for i, future in futures.items():
+            predictions[i] = future.result()
+    else:
+        for i in pending:
+            train_idx, test_idx = splits[i]
+            predictions[i] = _fit_predict(clone_model(model), take_rows(X, train_idx), take_rows(y, train_idx),
+                                          take_rows(X, test_idx))
+    
+    if cache is not None:
+        for i in pending:
+            cache.put(keys[i], predictions[i])
+    
+    return splits, predictions
+
+
+def evaluate_candidate(model, X, y, cv=3):
+    """
+    Fold predictions and a final fit on all rows for one candidate model; module-level so worker
+    processes can run it. Returns (splits, fold predictions, fitted clone).
+    """
+    splits, predictions = cross_val_fold_predictions(model, X, y, cv=cv, n_jobs=1)
+    return splits, predictions, clone_model(model).fit(X, y)
+
+
+def cross_val_score(model, X, y, cv=3, scoring='r2', n_jobs=1, cache=None):
+    """Expanding-window cross-validation score for each fold (see cross_val_fold_predictions)"""
+    y = np.asarray(y)
+    splits, predictions = cross_val_fold_predictions(model, X, y, cv=cv, n_jobs=n_jobs, cache=cache)
+    return np.array([_score(scoring, y[test_idx], fold_predictions)
+                     for (_, test_idx), fold_predictions in zip(splits, predictions)])
+
+
+# ============================================================================
+# FEATURE ENGINEERING
+# ============================================================================
+
+FEATURE_NAMES = [
+    'month', 'day_of_week', 'previous_month', 'previous_2months', 'previous_3months',
+    'rolling_3m', 'rolling_6m', 'rolling_12m', 'rolling_std_3m', 'rolling_std_6m',
+    'trend_3m', 'is_holiday_season', 'is_summer', 'budget_percentage'
+]
+
+
+def _shift_months(values, periods):
+    """Shift along the last axis by periods months, filling the start with the first value"""
+    shifted = np.empty_like(values)
+    shifted[..., periods:] = values[..., :values.shape[-1] - periods]
+    shifted[..., :periods] = values[..., :1]
+    return shifted
+
+
+def _trailing_window_stats(values, window):
+    """
+    Mean and sample standard deviation of each trailing window (min_periods=1) along the last axis.
+    
+    Windows are strided views over a NaN-padded copy, so every row of every series is computed in
+    one pass. Windows of a single value have std 0; constant windows return the value and std 0 exactly.
+    """
+    padding = np.full(values.shape[:-1] + (window - 1,), np.nan)
+    windows = sliding_window_view(np.concatenate([padding, values], axis=-1), window, axis=-1)
+    
+    valid = ~np.isnan(windows)
+    counts = valid.sum(axis=-1)
+    filled = np.where(valid, windows, 0.0)
+    means = filled.sum(axis=-1) / counts
+    
+    constant = np.nanmax(windows, axis=-1) == np.nanmin(windows, axis=-1)
+    means = np.where(constant, values, means)
+    
+    deviations = np.where(valid, windows - means[..., None], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variances = (deviations * deviations).sum(axis=-1) / (counts - 1)
+    stds = np.where(counts > 1, np.sqrt(variances), 0.0)
+    return means, stds
+
+
+def _trailing_slope_3(values):
+    """Least-squares slope over each trailing window of up to 3 values (closed form for x = 0, 1, 2)"""
+    slopes = np.zeros_like(values)
+    slopes[..., 1:2] = values[..., 1:2] - values[..., 0:1]
+    slopes[..., 2:] = (values[..., 2:] - values[..., :-2]) / 2.0
+    return slopes
+
+
+def build_feature_matrix(amounts, months, budget_percentage=None):
+    """
+    Feature matrix for monthly series, columns in FEATURE_NAMES order.
+    
+    amounts is a float array of shape (n_months,) or (n_series, n_months); months holds the matching
+    datetime64[M] values (broadcastable to amounts). Returns shape (..., n_months, n_features).
+    Lags and rolling statistics only look at months before each row, so there is no target leakage.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    months = np.broadcast_to(np.asarray(months, dtype='datetime64[M]'), amounts.shape)
+    n_months = amounts.shape[-1]
+    
+    month_numbers = (months.astype(np.int64) % 12 + 1).astype(np.float64)
+    # 1970-01-01 was a Thursday (Monday = 0)
+    day_of_week = ((months.astype('datetime64[D]').astype(np.int64) + 3) % 7).astype(np.float64)
+    
+    previous_month = _shift_months(amounts, 1)
+    previous_2months = _shift_months(amounts, 2)
+    previous_3months = _shift_months(amounts, 3)
+    
+    # Rolling features use only past values (previous_month) to avoid leakage
+    rolling_3m, rolling_std_3m = _trailing_window_stats(previous_month, 3)
+    rolling_6m, rolling_std_6m = _trailing_window_stats(previous_month, 6)
+    if n_months >= 12:
+        rolling_12m, _ = _trailing_window_stats(previous_month, 12)
+    else:
+        rolling_12m = rolling_6m  # Use 6m as fallback
+    
+    trend_3m = _trailing_slope_3(previous_month)
+    
+    is_holiday_season = np.isin(month_numbers, (11, 12, 1)).astype(np.float64)  # Nov, Dec, Jan
+    is_summer = np.isin(month_numbers, (6, 7, 8)).astype(np.float64)
+    
+    if budget_percentage is None:
+        budget_percentage = np.zeros_like(amounts)
+    budget_percentage = np.broadcast_to(np.nan_to_num(np.asarray(budget_percentage, dtype=np.float64)), amounts.shape)
+    
+    return np.stack([
+        month_numbers, day_of_week, previous_month, previous_2months, previous_3months,
+        rolling_3m, rolling_6m, rolling_12m, rolling_std_3m, rolling_std_6m,
+        trend_3m, is_holiday_season, is_summer, budget_percentage
+    ], axis=-1)
+
+
+# Feature columns measured in money; they scale with the series, so pooled models divide them by its scale
+AMOUNT_FEATURES = [
+    'previous_month', 'previous_2months', 'previous_3months', 'rolling_3m', 'rolling_6m', 'rolling_12m',
+    'rolling_std_3m', 'rolling_std_6m', 'trend_3m'
+]
+_AMOUNT_COLUMNS = [FEATURE_NAMES.index(name) for name in AMOUNT_FEATURES]
+
+
+def pooled_training_rows(amounts, months):
+    """
+    Feature rows and targets of one series normalized for a pooled model, plus each row's scale.
+    
+    Row t is divided by the mean of the months before it (the first row by its own amount): what a
+    forecast for that month knows about the series' size, so series of any size share one model.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    scales = np.empty_like(amounts)
+    scales[:1] = amounts[:1]
+    scales[1:] = np.cumsum(amounts)[:-1] / np.arange(1, len(amounts))
+    scales = np.where(scales > 0, scales, 1.0)
+    
+    features = build_feature_matrix(amounts, months)
+    features[:, _AMOUNT_COLUMNS] /= scales[:, None]
+    return features, amounts / scales, scales
+
+
+def pooled_prediction_inputs(amounts, months):
+    """Features and amounts of one series in pooled units for forecasting its next month, and the scale used"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    scale = float(np.mean(amounts)) if len(amounts) else 0.0
+    scale = scale if scale > 0 else 1.0
+    normalized = amounts / scale
+    return build_feature_matrix(normalized, months), normalized, scale
+
+
+class MonthlySeries:
+    """
+    Monthly expense totals for one (user, category) pair, oldest month first.
+    
+    months is a datetime64[M] array and amounts a float64 array of the same length. fingerprint
+    is the pair's data fingerprint when the loader computed it (see get_data_fingerprint).
+    """
+    __slots__ = ('months', 'amounts', 'fingerprint')
+    
+    def __init__(self, months, amounts, fingerprint=None):
+        self.months = np.asarray(months, dtype='datetime64[M]')
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.fingerprint = fingerprint
+    
+    @classmethod
+    @profiled('aggregate')
+    def from_month_keys(cls, month_keys, amounts):
+        """Build from integer YYYYMM keys as produced by the SQL month bucketing"""
+        month_keys = np.asarray(month_keys, dtype=np.int64)
+        PROFILER.count('months', len(month_keys))
+        months = ((month_keys // 100 - 1970) * 12 + month_keys % 100 - 1).astype('datetime64[M]')
+        return cls(months, amounts)
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    def before(self, year, month):
+        """Months strictly before year-month, or None if there are none"""
+        mask = self.months < np.datetime64(f'{int(year):04d}-{int(month):02d}', 'M')
+        if not mask.any():
+            return None
+        return MonthlySeries(self.months[mask], self.amounts[mask])
+
+
+class ConnectionPool:
+    """
+    Small pool of reusable database connections.
+    
+    open_connection() creates a connection (or returns None when the database is unavailable)
+    and is_alive(conn) health-checks one. Idle connections are re-checked before reuse once they
+    have been idle for check_after seconds; dead ones are dropped and replaced.
+    """
+    def __init__(self, open_connection, is_alive, max_size=1, check_after=5.0):
+        self.open_connection = open_connection
+        self.is_alive = is_alive
+        self.max_size = max_size
+        self.check_after = check_after
+        self._idle = []  # (connection, released_at) pairs, most recently released last
+        self.opened = 0
+        self.reused = 0
+    
+    def acquire(self):
+        """Idle healthy connection if there is one, otherwise a new connection"""
+        while self._idle:
+            conn, released_at = self._idle.pop()
+            if time.monotonic() - released_at < self.check_after or self.is_alive(conn):
+                self.reused += 1
+                return conn
+            logger.debug("Dropping dead pooled connection")
+            self._discard(conn)
+        
+        conn = self.open_connection()
+        if conn is not None:
+            self.opened += 1
+        return conn
+    
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full"""
+        if conn is None:
+            return
+        if len(self._idle) < self.max_size:
+            self._idle.append((conn, time.monotonic()))
         else:
-            df['rolling_12m'] = df['rolling_6m']  # Use 6m as fallback
-        
-        # Volatility features based on past values only
-        df['rolling_std_3m'] = past_amount.rolling(3, min_periods=1).std().fillna(0.0)
-        df['rolling_std_6m'] = past_amount.rolling(6, min_periods=1).std().fillna(0.0)
-        
-        # Trend feature on past 3 months only
-        def slope_last_n(values):
-            n = len(values)
-            if n < 2:
-                return 0.0
-            x = np.arange(n)
-            m, _ = np.polyfit(x, values, 1)
-            return m
-        df['trend_3m'] = past_amount.rolling(3, min_periods=1).apply(slope_last_n, raw=True).fillna(0.0)
-        
-        # Seasonal features
-        df['is_holiday_season'] = df['month'].isin([11, 12, 1])  # Nov, Dec, Jan
-        df['is_summer'] = df['month'].isin([6, 7, 8])
-        
-        # Budget features
-        df['budget_percentage'] = df['budget_percentage'].fillna(0)
-        df['budget_amount'] = (df['budget_percentage'] / 100) * df['income'].fillna(0)
-        
-        # Don't dropna() here - we'll handle it more carefully after feature extraction
-        # This allows rolling windows with reduced min_periods to still work
-            
-        # Select feature columns
-        feature_columns = [
-            'month', 'day_of_week', 'previous_month', 'previous_2months', 'previous_3months',
-            'rolling_3m', 'rolling_6m', 'rolling_12m', 'rolling_std_3m', 'rolling_std_6m',
-            'trend_3m', 'is_holiday_season', 'is_summer', 'budget_percentage'
-        ]
+            self._discard(conn)
+    
+    def close_all(self):
+        """Close every idle connection"""
+        while self._idle:
+            conn, _ = self._idle.pop()
+            self._discard(conn)
+    
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# Model file layout: MODEL_FILE_MAGIC, the JSON header's length (uint32, little-endian), the JSON
+# header, then every array's raw bytes, each starting on a MODEL_FILE_ALIGNMENT boundary
+MODEL_FILE_MAGIC = b'FCMODEL\x00'
+# Bump when the layout or the fields a class stores change; readers refuse newer versions
+MODEL_FILE_VERSION = 1
+MODEL_FILE_ALIGNMENT = 16
+# Classes that can appear in a model file, by the name stored in its header
+MODEL_FILE_CLASSES = {cls.__name__: cls for cls in (StandardScaler, LinearRegression, RandomForestRegressor,
+                                                    HistGradientBoostingRegressor)}
+
+
+def _aligned(offset):
+    return -(-offset // MODEL_FILE_ALIGNMENT) * MODEL_FILE_ALIGNMENT
+
+
+def _json_scalar(value):
+    """json.dumps default for numpy scalars"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def write_model_file(f, model_data, float_dtype=np.float64):
+    """
+    Write model data (a dict as built by save_model) to an open binary file.
+    
+    Values with _to_arrays (the scaler and the model) are stored as their class name and params in
+    the JSON header plus raw arrays; everything else (model name, feature names, performance,
+    trained_at...) goes into the header as-is. Floating-point model arrays are cast to float_dtype.
+    """
+    header = {'format_version': MODEL_FILE_VERSION, 'meta': {}, 'components': {}, 'arrays': {}}
+    arrays = {}
+    for key, value in model_data.items():
+        if not hasattr(value, '_to_arrays'):
+            header['meta'][key] = value
+            continue
+        params, component_arrays = value._to_arrays(np.dtype(float_dtype))
+        header['components'][key] = {'class': type(value).__name__, 'params': params}
+        for name, array in component_arrays.items():
+            if array is not None:
+                arrays[f'{key}.{name}'] = np.ascontiguousarray(array)
+    
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    
+    header_bytes = json.dumps(header, default=_json_scalar).encode('utf-8')
+    prefix_size = len(MODEL_FILE_MAGIC) + 4 + len(header_bytes)
+    f.write(MODEL_FILE_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+    f.write(bytes(_aligned(prefix_size) - prefix_size))
+    position = 0
+    for name, array in arrays.items():
+        f.write(bytes(header['arrays'][name]['offset'] - position))
+        f.write(array.tobytes())
+        position = header['arrays'][name]['offset'] + array.nbytes
+
+
+def is_model_file(model_path):
+    """Whether a file starts with MODEL_FILE_MAGIC (as opposed to a pickle)"""
+    with open(model_path, 'rb') as f:
+        return f.read(len(MODEL_FILE_MAGIC)) == MODEL_FILE_MAGIC
+
+
+def read_model_file(model_path):
+    """
+    Model data from a file written by write_model_file.
+    
+    Arrays are read-only views into one memory map of the file, so loading parses only the JSON
+    header and pages in array data as predictions touch it.
+    """
+    with open(model_path, 'rb') as f:
+        if f.read(len(MODEL_FILE_MAGIC)) != MODEL_FILE_MAGIC:
+            raise ValueError(f'{model_path} is not a model file')
+        (header_size,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_size))
+    if header['format_version'] > MODEL_FILE_VERSION:
+        raise ValueError(f"Model file format {header['format_version']} is newer than supported ({MODEL_FILE_VERSION})")
+    
+    data_start = _aligned(len(MODEL_FILE_MAGIC) + 4 + header_size)
+    mapped = np.memmap(model_path, dtype=np.uint8, mode='r') if header['arrays'] else None
+    # Plain ndarrays over the map: slicing np.memmap objects is several times slower
+    arrays = {name: np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=mapped,
+                               offset=data_start + spec['offset'])
+              for name, spec in header['arrays'].items()}
+    
+    model_data = dict(header['meta'])
+    for key, component in header['components'].items():
+        prefix = f'{key}.'
+        component_arrays = {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+        model_data[key] = MODEL_FILE_CLASSES[component['class']]._from_arrays(component['params'], component_arrays)
+    return model_data
+
+
+class _JoblibPickle(Exception):
+    """Raised while unpickling when the file turns out to be in joblib's format"""
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # joblib stores arrays out of band; only joblib.load can read those files
+        if module.split('.')[0] == 'joblib':
+            raise _JoblibPickle(module)
+        return super().find_class(module, name)
+
+
+class ModelStore:
+    """
+    Saved models, one model file per (user, category) pair (see write_model_file), plus a SQLite index.
+    
+    The index records trained_at, data_points, model name, file size and mtime for each pair, so
+    freshness checks (is_fresh, status) need one index lookup and a stat instead of loading.
+    Writes go to a temporary file that is renamed into place, so readers never see a partial
+    model. Loaded models are kept in an LRU cache bounded by count and approximate bytes
+    (the file size stands in for the in-memory size). Pickled models from older versions are
+    still read until migrate() converts them.
+    
+    Pooled cross-user models are stored like pairs under POOLED_USER_ID, the global one also
+    under GLOBAL_CATEGORY_ID (real ids start at 1).
+    """
+    INDEX_FILE = 'model_index.sqlite'
+    MODEL_SUFFIX = '.model'
+    LEGACY_SUFFIX = '.pkl'
+    POOLED_USER_ID = 0
+    GLOBAL_CATEGORY_ID = 0
+    
+    def __init__(self, root, max_age_days=7, cache_size=0, cache_bytes=None, float_dtype=np.float64):
+        self.root = root
+        self.max_age_days = max_age_days
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        # Storage precision of floating-point model arrays (float32 halves tree files)
+        self.float_dtype = np.dtype(float_dtype)
+        self._cache = OrderedDict()  # (user_id, category_id) -> (mtime, size_bytes, model_data)
+        self._cached_bytes = 0
+        self._index = None
+        os.makedirs(self.root, exist_ok=True)
+    
+    def path(self, user_id, category_id, suffix=MODEL_SUFFIX):
+        """File path of the model for a pair (the layout the PHP service also reads)"""
+        return os.path.join(self.root, f'forecast_user_{user_id}_cat_{category_id}{suffix}')
+    
+    def _existing_path(self, user_id, category_id):
+        """The pair's model file, falling back to a legacy pickle; None if there is neither"""
+        for suffix in (self.MODEL_SUFFIX, self.LEGACY_SUFFIX):
+            model_path = self.path(user_id, category_id, suffix)
+            if os.path.exists(model_path):
+                return model_path
+        return None
+    
+    def _index_connection(self):
+        if self._index is None:
+            self._index = sqlite3.connect(os.path.join(self.root, self.INDEX_FILE), timeout=30)
+            self._index.execute(
+                "CREATE TABLE IF NOT EXISTS models ("
+                "user_id INTEGER NOT NULL, category_id INTEGER NOT NULL, file TEXT NOT NULL, "
+                "trained_at TEXT NOT NULL, data_points INTEGER NOT NULL, model_name TEXT NOT NULL, "
+                "size_bytes INTEGER NOT NULL, mtime REAL NOT NULL, "
+                "PRIMARY KEY (user_id, category_id))"
+            )
+            self._index.commit()
+        return self._index
+    
+    def put(self, user_id, category_id, model_data, mtime=None):
+        """
+        Write a model atomically and record it in the index; returns the model path.
+        
+        mtime, if given, is set on the file (migrate keeps a model's age this way). A legacy
+        pickle for the pair is removed.
+        """
+        model_path = self.path(user_id, category_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp_', suffix=self.MODEL_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_model_file(f, model_data, self.float_dtype)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)  # mkstemp creates 0600 files
+            if mtime is not None:
+                os.utime(tmp_path, (mtime, mtime))
+            os.replace(tmp_path, model_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        legacy_path = self.path(user_id, category_id, self.LEGACY_SUFFIX)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        stat = os.stat(model_path)
+        index = self._index_connection()
+        index.execute(
+            "INSERT OR REPLACE INTO models "
+            "(user_id, category_id, file, trained_at, data_points, model_name, size_bytes, mtime) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (int(user_id), int(category_id), os.path.basename(model_path), model_data['trained_at'],
+             int(model_data['data_points']), model_data['model_name'], stat.st_size, stat.st_mtime)
+        )
+        index.commit()
+        self._evict((user_id, category_id))
+        return model_path
+    
+    def info(self, user_id, category_id):
+        """
+        Index entry for a pair without loading the model, or None if there is no model file.
+        
+        Files written without the index (older versions, or replaced behind its back) are
+        described from their mtime alone.
+        """
+        model_path = self._existing_path(user_id, category_id)
+        try:
+            stat = os.stat(model_path) if model_path else None
+        except OSError:
+            stat = None
+        if stat is None:
+            return None
+        
+        row = self._index_connection().execute(
+            "SELECT trained_at, data_points, model_name, size_bytes, mtime FROM models "
+            "WHERE user_id = ? AND category_id = ?", (int(user_id), int(category_id))
+        ).fetchone()
+        if row is not None and row[4] == stat.st_mtime:
+            trained_at, data_points, model_name = row[0], row[1], row[2]
+        else:
+            trained_at, data_points, model_name = datetime.fromtimestamp(stat.st_mtime).isoformat(), None, None
+        
+        return {
+            'user_id': int(user_id),
+            'category_id': int(category_id),
+            'path': model_path,
+            'trained_at': trained_at,
+            'data_points': data_points,
+            'model_name': model_name,
+            'size_bytes': stat.st_size,
+            'mtime': stat.st_mtime,
+            'age_days': (datetime.now() - datetime.fromtimestamp(stat.st_mtime)).days
+        }
+    
+    def is_fresh(self, user_id, category_id):
+        """Whether a saved model exists and is no older than max_age_days"""
+        entry = self.info(user_id, category_id)
+        return entry is not None and entry['age_days'] <= self.max_age_days
+    
+    def status(self, pairs):
+        """info() for each (user_id, category_id) pair, with a fresh flag; missing models are None"""
+        statuses = []
+        for user_id, category_id in pairs:
+            entry = self.info(user_id, category_id)
+            if entry is not None:
+                entry['fresh'] = entry['age_days'] <= self.max_age_days
+            statuses.append(entry)
+        return statuses
+    
+    def get(self, user_id, category_id):
+        """Model data for a pair if a fresh model exists, from the cache when the file is unchanged"""
+        key = (user_id, category_id)
+        entry = self.info(user_id, category_id)
+        if entry is None:
+            logger.debug("No saved model found at %s", self.path(user_id, category_id))
+            return None
+        if entry['age_days'] > self.max_age_days:
+            logger.debug("Model is %s days old, too stale", entry['age_days'])
+            return None
+        
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == entry['mtime']:
+            self._cache.move_to_end(key)
+            logger.debug("Model served from memory for %s", entry['path'])
+            return cached[2]
+        
+        model_data = self._load_file(entry['path'])
+        logger.debug("Model loaded from %s", entry['path'])
+        
+        if self.cache_size > 0:
+            self._evict(key)
+            self._cache[key] = (entry['mtime'], entry['size_bytes'], model_data)
+            self._cached_bytes += entry['size_bytes']
+            while len(self._cache) > self.cache_size or (
+                    self.cache_bytes is not None and self._cached_bytes > self.cache_bytes and len(self._cache) > 1):
+                _, (_, size_bytes, _) = self._cache.popitem(last=False)
+                self._cached_bytes -= size_bytes
+        return model_data
+    
+    @staticmethod
+    def _load_file(model_path):
+        """
+        Load a model file, or a legacy pickle: those were written with plain pickle, except files
+        written by joblib.dump (before the store existed), which are handed to joblib.load.
+        """
+        if is_model_file(model_path):
+            return read_model_file(model_path)
+        with open(model_path, 'rb') as f:
+            try:
+                return _PlainUnpickler(f).load()
+            except _JoblibPickle:
+                pass
+        return _timed_import('joblib').load(model_path)
+    
+    def delete(self, user_id, category_id):
+        """Remove a pair's model file (and any legacy pickle) and index entry"""
+        for suffix in (self.MODEL_SUFFIX, self.LEGACY_SUFFIX):
+            model_path = self.path(user_id, category_id, suffix)
+            if os.path.exists(model_path):
+                os.remove(model_path)
+        index = self._index_connection()
+        index.execute("DELETE FROM models WHERE user_id = ? AND category_id = ?", (int(user_id), int(category_id)))
+        index.commit()
+        self._evict((user_id, category_id))
+    
+    def _evict(self, key):
+        cached = self._cache.pop(key, None)
+        if cached is not None:
+            self._cached_bytes -= cached[1]
+    
+    def migrate(self):
+        """
+        Convert every legacy pickle in the store to the model file format, keeping each model's
+        mtime (and so its age). Returns counts and total bytes before and after.
+        """
+        pattern = re.compile(r'forecast_user_(\d+)_cat_(\d+)' + re.escape(self.LEGACY_SUFFIX) + '$')
+        stats = {'migrated': 0, 'failed': [], 'bytes_before': 0, 'bytes_after': 0}
+        for file_name in sorted(os.listdir(self.root)):
+            match = pattern.match(file_name)
+            if match is None:
+                continue
+            user_id, category_id = int(match.group(1)), int(match.group(2))
+            legacy_path = os.path.join(self.root, file_name)
+            try:
+                stat = os.stat(legacy_path)
+                model_path = self.put(user_id, category_id, self._load_file(legacy_path), mtime=stat.st_mtime)
+            except Exception as e:
+                logger.warning("Could not migrate %s: %s", legacy_path, e)
+                stats['failed'].append(file_name)
+                continue
+            stats['migrated'] += 1
+            stats['bytes_before'] += stat.st_size
+            stats['bytes_after'] += os.path.getsize(model_path)
+        return stats
+    
+    @property
+    def cached_models(self):
+        return len(self._cache)
+    
+    @property
+    def cached_bytes(self):
+        return self._cached_bytes
+    
+    def close(self):
+        """Close the index connection"""
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class ResultCache:
+    """
+    Forecast results stored as JSON in a local SQLite file, bounded by total size (LRU eviction).
+    
+    Keys combine the request (pair, target month/year, horizon), the saved model's version and a
+    fingerprint of the pair's expense rows, so any change to the data or the model simply stops
+    matching the old entry; stale entries age out through eviction.
+    """
+    CACHE_FILE = 'result_cache.sqlite'
+    # Bump when the result format or the forecasting logic changes
+    VERSION = 1
+    
+    def __init__(self, root, max_bytes=16 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+    
+    def _connection(self):
+        if self._db is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.root, self.CACHE_FILE), timeout=30)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "cache_key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+                "size_bytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+    
+    @classmethod
+    def key(cls, user_id, category_id, target_month, target_year, horizon, model_version, fingerprint):
+        return json.dumps([cls.VERSION, int(user_id), int(category_id), target_month, target_year,
+                           int(horizon), model_version, fingerprint], default=str)
+    
+    def get(self, cache_key):
+        """Stored result for a key, or None"""
+        db = self._connection()
+        row = db.execute("SELECT result FROM results WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        db.execute("UPDATE results SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+        db.commit()
+        return json.loads(row[0])
+    
+    def put(self, cache_key, result):
+        """Store a result, then evict least recently used entries while over max_bytes"""
+        payload = json.dumps(result)
+        db = self._connection()
+        db.execute("INSERT OR REPLACE INTO results (cache_key, result, size_bytes, last_used) VALUES (?, ?, ?, ?)",
+                   (cache_key, payload, len(payload) + len(cache_key), time.time()))
+        total = db.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            evict, freed = [], 0
+            for old_key, size_bytes in db.execute("SELECT cache_key, size_bytes FROM results ORDER BY last_used"):
+                if freed >= excess:
+                    break
+                evict.append((old_key,))
+                freed += size_bytes
+            db.executemany("DELETE FROM results WHERE cache_key = ?", evict)
+        db.commit()
+    
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _to_cents(amount):
+    """Whole cents from a database amount (Decimal on MySQL, float on SQLite), so sums stay exact"""
+    return int(round(float(amount) * 100))
+
+
+def _add_total_delta(deltas, entry, sign):
+    """Add (sign=1) or remove (sign=-1) one expense entry (user, category, month_key, cents) to per-bucket deltas"""
+    delta = deltas.setdefault(entry[:3], [0, 0])
+    delta[0] += sign * entry[3]
+    delta[1] += sign
+
+
+# Default of per-call settings that override the forecaster's own (None is a valid override)
+_CONFIGURED = object()
+
+
+class ExpenseForecaster:
+    # Candidate evaluated first and in-process under a time budget, so selection always has a result
+    FLOOR_MODEL = 'linear'
+    
+    def __init__(self, db_config=None, db_path=None, model_storage_path=None,
+                 pool_size=1, model_cache_size=0, model_cache_bytes=None, n_jobs=1, fold_cache_size=1024,
+                 result_cache_bytes=0, time_budget_ms=None, fetch_chunk_size=5000, model_dtype='float64',
+                 dtype='float64', pooled=None):
+        self.db_config = db_config
+        self.db_path = db_path
+        self.db_type = 'mysql' if db_config else 'sqlite'
+        self.model_storage_path = model_storage_path or 'storage/app/ml_models'
+        self.models = {
+            'linear': LinearRegression(),
+            'random_forest': RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10, n_jobs=n_jobs),
+            'gradient_boosting': HistGradientBoostingRegressor(max_iter=100, learning_rate=0.1, max_depth=3)
+        }
+        # Precision of the scaled feature matrices every model trains and predicts on
+        self.dtype = np.dtype(dtype)
+        self.scaler = StandardScaler(dtype=self.dtype)
+        # Scope of the pooled model ('category' or 'global') forecasting pairs without a model of
+        # their own (see train_pooled); None trains a model for every pair
+        self.pooled = pooled
+        # (row indices, predictions) out of fold for the model last chosen by train_models
+        self.oof_predictions = None
+        # Wall-clock budget for model selection (None = evaluate every candidate), and what the
+        # last selection finished, failed or gave up on
+        self.time_budget_ms = time_budget_ms
+        self.selection_report = None
+        # Full monthly series loaded up front by batch mode, keyed by (user_id, category_id)
+        self.preloaded_series = {}
+        # Rows per fetch when streaming query results
+        self.fetch_chunk_size = fetch_chunk_size
+        # Connections are pooled so repeated fetches (and server requests) reuse them
+        self.connections = ConnectionPool(self._open_connection, self._connection_alive, max_size=pool_size)
+        # Monthly series fetched during the current request, keyed by (user_id, category_id, cutoff)
+        self._series_memo = {}
+        # Out-of-sample predictions from model selection and evaluation fits, reused for identical folds
+        self.fold_cache = FoldCache(max_entries=fold_cache_size)
+        # Long-lived processes (server mode) keep recently used models in memory
+        self.model_store = ModelStore(self.model_storage_path, cache_size=model_cache_size,
+                                      cache_bytes=model_cache_bytes, float_dtype=model_dtype)
+        # Finished forecast results, reused while the pair's expenses and model are unchanged
+        self.result_cache = ResultCache(self.model_storage_path, result_cache_bytes) if result_cache_bytes else None
+        
+    @profiled('connect')
+    def _open_connection(self):
+        """Open a new connection to the configured database, or None if it is unavailable"""
+        if self.db_type == 'mysql':
+            connector = _mysql_connector()
+            if connector is None:
+                logger.error("MySQL connector not available")
+                return None
+            # Connect to MySQL
+            logger.debug("Connecting to MySQL: %s:%s/%s", self.db_config['host'], self.db_config['port'], self.db_config['database'])
+            conn = connector.connect(
+                host=self.db_config['host'],
+                port=self.db_config['port'],
+                database=self.db_config['database'],
+                user=self.db_config['username'],
+                password=self.db_config['password']
+            )
+            logger.debug("MySQL connection successful")
+            return conn
+        
+        # SQLite connection
+        if not os.path.exists(self.db_path):
+            logger.error("SQLite database not found at %s", self.db_path)
+            return None
+        conn = sqlite3.connect(self.db_path)
+        logger.debug("SQLite connection successful")
+        return conn
+    
+    def _connection_alive(self, conn):
+        """Cheap health check for a pooled connection"""
+        try:
+            if self.db_type == 'mysql':
+                return conn.is_connected()
+            conn.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+    
+    def _connect(self):
+        """Connection from the pool; hand it back with _release()"""
+        return self.connections.acquire()
+    
+    def _release(self, conn):
+        """Return a connection to the pool"""
+        self.connections.release(conn)
+    
+    def close(self):
+        """Close pooled connections, the model index and the result cache"""
+        self.connections.close_all()
+        self.model_store.close()
+        if self.result_cache is not None:
+            self.result_cache.close()
+    
+    def _sql_placeholder(self):
+        """Parameter placeholder for the active database driver"""
+        return '%s' if self.db_type == 'mysql' else '?'
+    
+    def _sql_month_key(self, column='e.date'):
+        """SQL expression bucketing a date column into integer YYYYMM month keys"""
+        if self.db_type == 'mysql':
+            return f"EXTRACT(YEAR_MONTH FROM {column})"
+        return f"CAST(strftime('%Y%m', {column}) AS INTEGER)"
+    
+    def _iter_rows(self, conn, query, params):
+        """
+        Run a parameterized query and yield its rows, fetched fetch_chunk_size at a time.
+        
+        MySQL cursors are unbuffered, so rows stream from the server as they are consumed and only
+        one chunk is held at a time; SQLite steps through the result lazily. Time spent executing and
+        fetching (not consuming) is recorded as one 'query' span, with rows/sec in the debug log.
+        """
+        cursor = conn.cursor()
+        rows_fetched = 0
+        started_at = time.perf_counter()
+        elapsed = 0.0
+        try:
+            cursor.execute(query, params)
+            while True:
+                chunk = cursor.fetchmany(self.fetch_chunk_size)
+                elapsed += time.perf_counter() - started_at
+                if not chunk:
+                    break
+                rows_fetched += len(chunk)
+                yield from chunk
+                started_at = time.perf_counter()
+        finally:
+            cursor.close()
+            PROFILER.add('query', elapsed * 1000)
+            PROFILER.count('rows_fetched', rows_fetched)
+            if elapsed > 0:
+                logger.debug("Fetched %d rows in %.1f ms (%.0f rows/s)", rows_fetched, elapsed * 1000,
+                             rows_fetched / elapsed)
+    
+    def _fetch_rows(self, conn, query, params):
+        """Run a parameterized query and return all rows (for small results; see _iter_rows)"""
+        return list(self._iter_rows(conn, query, params))
+    
+    def get_data_fingerprint(self, user_id, category_id):
+        """
+        Cheap summary of a pair's expense rows: (row count, max id, max updated_at).
+        
+        Inserts, deletes and edits all change it, so it can stand in for the data in cache keys.
+        Preloaded batch series carry theirs from the batch query. Returns None if the database
+        is unavailable.
+        """
+        preloaded = self.preloaded_series.get((user_id, category_id))
+        if preloaded is not None and preloaded.fingerprint is not None:
+            return preloaded.fingerprint
+        
+        conn = self._connect()
+        if conn is None:
+            return None
+        try:
+            ph = self._sql_placeholder()
+            rows = self._fetch_rows(conn, f"""
+            SELECT COUNT(*), MAX(e.id), MAX(e.updated_at)
+            FROM expenses e
+            WHERE e.user_id = {ph} AND e.category_id = {ph}
+            """, [int(user_id), int(category_id)])
+        finally:
+            self._release(conn)
+        return self._fingerprint(*rows[0])
+    
+    @staticmethod
+    def _fingerprint(count, max_id, max_updated_at):
+        return [int(count), None if max_id is None else int(max_id), None if max_updated_at is None else str(max_updated_at)]
+    
+    def get_monthly_series_batch(self, pairs=None, user_id=None, min_expenses=6):
+        """
+        Fetch monthly expense totals for many (user, category) pairs with a single grouped query.
+        
+        Returns a dict mapping (user_id, category_id) to an unfiltered MonthlySeries, with its data
+        fingerprint from the same query. Pairs with fewer than min_expenses raw rows are skipped,
+        mirroring MLForecastService::hasEnoughData(). Explicitly requested pairs are never skipped.
+        """
+        conn = self._connect()
+        if conn is None:
+            return None
+        
+        try:
+            ph = self._sql_placeholder()
+            conditions = []
+            params = []
+            if pairs:
+                pair_sql = ' OR '.join([f"(e.user_id = {ph} AND e.category_id = {ph})"] * len(pairs))
+                conditions.append(f"({pair_sql})")
+                for pair_user_id, pair_category_id in pairs:
+                    params.extend([int(pair_user_id), int(pair_category_id)])
+            if user_id is not None:
+                conditions.append(f"e.user_id = {ph}")
+                params.append(int(user_id))
+            where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            
+            month_key = self._sql_month_key()
+            query = f"""
+            SELECT e.user_id, e.category_id, {month_key} AS month_key,
+                   SUM(e.amount) AS amount, COUNT(*) AS row_count,
+                   MAX(e.id) AS max_id, MAX(e.updated_at) AS max_updated_at
+            FROM expenses e
+            {where_sql}
+            GROUP BY e.user_id, e.category_id, month_key
+            ORDER BY e.user_id, e.category_id, month_key
+            """
+            
+            # Streamed in chunks and folded into per-pair buckets as they arrive, so the full
+            # result set (one row per pair and month, over every user) is never held at once
+            grouped = OrderedDict()
+            for (row_user_id, row_category_id, row_month_key, row_amount, row_count,
+                 row_max_id, row_max_updated_at) in self._iter_rows(conn, query, params):
+                # entry[2] accumulates the fingerprint: row count, max id, max updated_at
+                entry = grouped.setdefault((int(row_user_id), int(row_category_id)), ([], [], [0, None, None]))
+                entry[0].append(int(row_month_key))
+                entry[1].append(float(row_amount))
+                totals = entry[2]
+                totals[0] += int(row_count)
+                if row_max_id is not None and (totals[1] is None or row_max_id > totals[1]):
+                    totals[1] = row_max_id
+                if row_max_updated_at is not None and (totals[2] is None or row_max_updated_at > totals[2]):
+                    totals[2] = row_max_updated_at
+            logger.debug("Batch query returned %d pairs", len(grouped))
+        finally:
+            self._release(conn)
+        
+        series = {}
+        for key, (month_keys, amounts, totals) in grouped.items():
+            if not pairs and totals[0] < min_expenses:
+                continue
+            series[key] = MonthlySeries.from_month_keys(month_keys, amounts)
+            series[key].fingerprint = self._fingerprint(*totals)
+        
+        return series
+    
+    def get_series(self, user_id, category_id, target_month=None, target_year=None):
+        """
+        Monthly series for a pair, fetched at most once per request.
+        
+        Served from preloaded batch data when available, otherwise from the request memo
+        (a memoized full series also answers any cutoff), otherwise from the database.
+        """
+        cutoff = (target_year, target_month) if target_month and target_year else None
+        
+        full_series = self.preloaded_series.get((user_id, category_id))
+        if full_series is None:
+            full_series = self._series_memo.get((user_id, category_id, None))
+        if full_series is not None:
+            # Same cutoff as get_user_data: months strictly before the target month
+            return full_series.before(target_year, target_month) if cutoff else full_series
+        
+        memo_key = (user_id, category_id, cutoff)
+        if memo_key not in self._series_memo:
+            self._series_memo[memo_key] = self.get_user_data(user_id, category_id, target_month, target_year)
+        return self._series_memo[memo_key]
+    
+    def get_user_data(self, user_id, category_id, target_month=None, target_year=None):
+        """
+        Fetch monthly expense totals from the database, optionally only months before the target month.
         
-        # Filter to only existing columns
-        available_features = [col for col in feature_columns if col in df.columns]
+        Summing happens in the query, so one row per month is transferred; when the
+        monthly_category_totals table exists the sums are read from it instead (see
+        _read_monthly_totals). Returns a MonthlySeries, or None when there is no data.
+        """
+        try:
+            logger.debug("Fetching monthly totals for user %s, category %s", user_id, category_id)
+            
+            conn = self._connect()
+            if conn is None:
+                return None
+            
+            ph = self._sql_placeholder()
+            params = [int(user_id), int(category_id)]
+            date_filter = ''
+            if target_month and target_year:
+                # Only get data up to (but not including) the target month
+                date_filter = f"AND e.date < {ph}"
+                params.append(f"{target_year}-{target_month:02d}-01")
+                logger.debug("Filtering data up to %d-%02d (exclusive)", target_year, target_month)
+            
+            month_key = self._sql_month_key()
+            query = f"""
+            SELECT {month_key} AS month_key, SUM(e.amount) AS amount
+            FROM expenses e
+            WHERE e.user_id = {ph} AND e.category_id = {ph}
+            {date_filter}
+            GROUP BY month_key
+            ORDER BY month_key
+            """
+            
+            try:
+                rows = self._read_monthly_totals(conn, user_id, category_id, target_month, target_year)
+                if rows is None:
+                    rows = self._fetch_rows(conn, query, params)
+            finally:
+                self._release(conn)
+            logger.debug("Query returned %d monthly data points", len(rows))
+            
+            if not rows:
+                logger.debug("No expense data found")
+                return None
+            
+            # No data smoothing - use raw monthly data for accurate predictions
+            return MonthlySeries.from_month_keys([row[0] for row in rows], [float(row[1]) for row in rows])
+            
+        except Exception as e:
+            logger.error("get_user_data failed: %s", e)
+            return None
+    
+    def _read_monthly_totals(self, conn, user_id, category_id, target_month=None, target_year=None):
+        """
+        A pair's (month_key, amount) rows from monthly_category_totals plus the expenses changed since
+        the refresh watermark, or None when the table is missing or the pair lost expenses since.
+        
+        Only expenses with an id or updated_at beyond the watermark are read (through the primary key
+        and updated_at index), and their differences from the ledger are merged in as in the refresh,
+        so writes to other pairs never send this pair back to the expenses table. Deletes are found by
+        counting the pair's older expenses on the (user_id, category_id, date) index. Like the
+        refresh itself, this relies on edits touching updated_at.
+        """
+        ph = self._sql_placeholder()
+        pair = (int(user_id), int(category_id))
+        try:
+            state = self._fetch_rows(conn, f"""
+            SELECT w.max_expense_id, w.max_updated_at,
+                   (SELECT COUNT(*) FROM expenses e
+                    WHERE e.user_id = {ph} AND e.category_id = {ph} AND e.id <= w.max_expense_id)
+            FROM monthly_category_totals_watermark w
+            WHERE w.id = 1
+            """, list(pair))
+        except Exception as e:
+            logger.debug("Monthly totals unavailable: %s", e)
+            return None
+        if not state:
+            return None
+        watermark_id, watermark_updated_at, old_rows = state[0]
         
-        # Extract features and targets, then drop rows with NaN values
-        feature_df = df[available_features].copy()
-        target_series = df['amount'].copy()
+        totals = self._fetch_rows(conn, f"""
+        SELECT t.month_key, t.total_amount, t.expense_count
+        FROM monthly_category_totals t
+        WHERE t.user_id = {ph} AND t.category_id = {ph}
+        """, list(pair))
+        
+        # Expenses changed since the refresh that are in this pair now or were when last folded in
+        changed_filter = f"e.id > {ph}"
+        params = [watermark_id]
+        if watermark_updated_at is not None:
+            changed_filter += f" OR e.updated_at >= {ph}"
+            params.append(watermark_updated_at)
+        changed = self._fetch_rows(conn, f"""
+        SELECT e.id, e.user_id, e.category_id, {self._sql_month_key()}, e.amount,
+               l.user_id, l.category_id, l.month_key, l.amount
+        FROM expenses e
+        LEFT JOIN monthly_category_total_entries l ON l.expense_id = e.id
+        WHERE ({changed_filter})
+          AND ((e.user_id = {ph} AND e.category_id = {ph}) OR (l.user_id = {ph} AND l.category_id = {ph}))
+        """, params + list(pair) + list(pair))
+        
+        deltas = {}
+        for month_key, amount, count in totals:
+            deltas[(pair[0], pair[1], int(month_key))] = [_to_cents(amount), int(count)]
+        # The pair's expenses at or below the watermark, as the ledger has them after these changes
+        expected_old_rows = sum(int(count) for _, _, count in totals)
+        for expense_id, *current, entry_user_id, entry_category_id, entry_month_key, entry_amount in changed:
+            if (int(current[0]), int(current[1])) == pair:
+                _add_total_delta(deltas, (pair[0], pair[1], int(current[2]), _to_cents(current[3])), 1)
+                expected_old_rows += int(expense_id) <= watermark_id
+            if entry_user_id is not None and (int(entry_user_id), int(entry_category_id)) == pair:
+                _add_total_delta(deltas, (pair[0], pair[1], int(entry_month_key), _to_cents(entry_amount)), -1)
+                expected_old_rows -= 1
+        if int(old_rows) != expected_old_rows:
+            logger.debug("Expenses were deleted since the monthly totals refresh, aggregating expenses instead")
+            return None
+        
+        last_month_key = target_year * 100 + target_month if target_month and target_year else None
+        return [(month_key, cents / 100) for (_, _, month_key), (cents, count) in sorted(deltas.items())
+                if count > 0 and (last_month_key is None or month_key < last_month_key)]
+    
+    def _execute(self, conn, statement, params=(), many=False):
+        """Run a write statement (once per parameter tuple when many) and return the affected row count"""
+        cursor = conn.cursor()
+        try:
+            if many:
+                cursor.executemany(statement, params)
+            else:
+                cursor.execute(statement, params)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+    
+    def _iter_expense_pages(self, conn, after_id=0, ids=None):
+        """
+        Expenses as pages of (id, user_id, category_id, month_key, amount, updated_at) rows: the given
+        ids in batches, or else every expense with an id above after_id in id order.
         
-        # Drop rows where any feature is NaN (from shifts at the beginning)
-        valid_mask = ~feature_df.isna().any(axis=1)
-        features = feature_df[valid_mask].values
-        targets = target_series[valid_mask].values
+        Pages are fetched completely (the latter with keyset pagination), so the caller can write on
+        the same connection between pages, which an unbuffered MySQL cursor would not allow.
+        """
+        ph = self._sql_placeholder()
+        select_sql = f"""
+        SELECT e.id, e.user_id, e.category_id, {self._sql_month_key()}, e.amount, e.updated_at
+        FROM expenses e
+        """
+        if ids is not None:
+            # Kept well under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._fetch_rows(conn, f"{select_sql} WHERE e.id IN ({', '.join([ph] * len(batch))}) ORDER BY e.id",
+                                        batch)
+                if rows:
+                    yield rows
+            return
         
-        # Check if we have enough data after dropping NaNs
-        # Need at least 2 data points (reduced from 3 to allow predictions with limited historical data)
-        if len(features) < 2:
-            print(f"DEBUG: Only {len(features)} valid data points after dropping NaNs (need at least 2)", file=sys.stderr)
+        last_id = after_id
+        while True:
+            rows = self._fetch_rows(conn, f"{select_sql} WHERE e.id > {ph} ORDER BY e.id LIMIT {ph}",
+                                    [last_id, self.fetch_chunk_size])
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+    
+    def _apply_expense_changes(self, conn, rows, deltas):
+        """
+        Compare a page of expenses with what the ledger says they last contributed, add the
+        differences to deltas and update the ledger. Returns how many expenses changed.
+        """
+        ph = self._sql_placeholder()
+        previous = {}
+        ids = [int(row[0]) for row in rows]
+        # Kept well under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            for expense_id, entry_user_id, entry_category_id, month_key, amount in self._fetch_rows(conn, f"""
+            SELECT expense_id, user_id, category_id, month_key, amount
+            FROM monthly_category_total_entries
+            WHERE expense_id IN ({', '.join([ph] * len(batch))})
+            """, batch):
+                previous[int(expense_id)] = (int(entry_user_id), int(entry_category_id), int(month_key), _to_cents(amount))
+        
+        replaced, inserted = [], []
+        for expense_id, row_user_id, row_category_id, month_key, amount, _ in rows:
+            entry = (int(row_user_id), int(row_category_id), int(month_key), _to_cents(amount))
+            old_entry = previous.get(int(expense_id))
+            if old_entry == entry:
+                continue
+            if old_entry is not None:
+                _add_total_delta(deltas, old_entry, -1)
+                replaced.append((int(expense_id),))
+            _add_total_delta(deltas, entry, 1)
+            inserted.append((int(expense_id),) + entry[:3] + (entry[3] / 100,))
+        
+        if replaced:
+            self._execute(conn, f"DELETE FROM monthly_category_total_entries WHERE expense_id = {ph}", replaced, many=True)
+        if inserted:
+            self._execute(conn, f"""
+            INSERT INTO monthly_category_total_entries (expense_id, user_id, category_id, month_key, amount)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+            """, inserted, many=True)
+        return len(inserted)
+    
+    def _apply_expense_deletes(self, conn, deltas):
+        """Subtract ledger entries whose expense no longer exists; returns how many there were"""
+        ledger_count, expense_count = self._fetch_rows(conn, """
+        SELECT (SELECT COUNT(*) FROM monthly_category_total_entries), (SELECT COUNT(*) FROM expenses)
+        """, [])[0]
+        # Every remaining expense has an entry by now, so equal counts mean nothing was deleted
+        if int(ledger_count) <= int(expense_count):
+            return 0
+        
+        removed = self._fetch_rows(conn, """
+        SELECT l.expense_id, l.user_id, l.category_id, l.month_key, l.amount
+        FROM monthly_category_total_entries l
+        LEFT JOIN expenses e ON e.id = l.expense_id
+        WHERE e.id IS NULL
+        """, [])
+        for _, entry_user_id, entry_category_id, month_key, amount in removed:
+            _add_total_delta(deltas, (int(entry_user_id), int(entry_category_id), int(month_key), _to_cents(amount)), -1)
+        ph = self._sql_placeholder()
+        self._execute(conn, f"DELETE FROM monthly_category_total_entries WHERE expense_id = {ph}",
+                      [(int(row[0]),) for row in removed], many=True)
+        return len(removed)
+    
+    def _apply_total_deltas(self, conn, deltas, refreshed_at):
+        """Upsert accumulated (amount, count) deltas into monthly_category_totals; returns buckets touched"""
+        ph = self._sql_placeholder()
+        touched = 0
+        for (bucket_user_id, bucket_category_id, month_key), (cents, count) in deltas.items():
+            if not cents and not count:
+                continue
+            bucket = [bucket_user_id, bucket_category_id, month_key]
+            updated = self._execute(conn, f"""
+            UPDATE monthly_category_totals
+            SET total_amount = ROUND(total_amount + {ph}, 2), expense_count = expense_count + {ph}, updated_at = {ph}
+            WHERE user_id = {ph} AND category_id = {ph} AND month_key = {ph}
+            """, [cents / 100, count, refreshed_at] + bucket)
+            if not updated:
+                self._execute(conn, f"""
+                INSERT INTO monthly_category_totals (user_id, category_id, month_key, total_amount, expense_count, updated_at)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+                """, bucket + [cents / 100, count, refreshed_at])
+            touched += 1
+        self._execute(conn, "DELETE FROM monthly_category_totals WHERE expense_count <= 0")
+        return touched
+    
+    @profiled('refresh_totals')
+    def refresh_monthly_totals(self):
+        """
+        Bring monthly_category_totals up to date with the expenses table.
+        
+        Expenses with an id above the stored watermark (new) or an updated_at at or after it
+        (edited) are compared with the ledger of what each expense last contributed, and only the
+        differences are applied to the totals as delta upserts; expenses deleted since the last run
+        are subtracted. The totals, ledger and new watermark are committed together. The tables
+        come from the create_monthly_category_totals_table migration.
+        """
+        started_at = time.perf_counter()
+        conn = self._connect()
+        if conn is None:
+            return {'error': 'Database not available'}
+        
+        try:
+            try:
+                watermark = self._fetch_rows(conn, """
+                SELECT max_expense_id, max_updated_at FROM monthly_category_totals_watermark WHERE id = 1
+                """, [])
+            except Exception as e:
+                return {'error': f'Monthly totals tables not found (run the migrations): {e}'}
+            watermark_id, watermark_updated_at = watermark[0] if watermark else (0, None)
+            
+            ph = self._sql_placeholder()
+            # Older expenses edited since the last refresh (found through the updated_at index),
+            # then new ones. Rows updated exactly at the watermark are seen again, which the ledger
+            # turns into no-ops.
+            pages = []
+            if watermark_updated_at is not None:
+                edited_ids = [int(row[0]) for row in self._fetch_rows(conn, f"""
+                SELECT e.id FROM expenses e WHERE e.updated_at >= {ph}
+                """, [watermark_updated_at]) if int(row[0]) <= watermark_id]
+                pages.append(self._iter_expense_pages(conn, ids=sorted(edited_ids)))
+            pages.append(self._iter_expense_pages(conn, after_id=watermark_id))
+            
+            deltas = {}
+            scanned_rows = changed_rows = 0
+            max_id, max_updated_at = watermark_id, watermark_updated_at
+            for page_iterator in pages:
+                for rows in page_iterator:
+                    scanned_rows += len(rows)
+                    changed_rows += self._apply_expense_changes(conn, rows, deltas)
+                    max_id = max(max_id, int(rows[-1][0]))
+                    for row_updated_at in (row[5] for row in rows):
+                        if row_updated_at is not None and (max_updated_at is None or row_updated_at > max_updated_at):
+                            max_updated_at = row_updated_at
+            deleted_rows = self._apply_expense_deletes(conn, deltas)
+            
+            refreshed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            buckets_updated = self._apply_total_deltas(conn, deltas, refreshed_at)
+            
+            if watermark:
+                self._execute(conn, f"""
+                UPDATE monthly_category_totals_watermark
+                SET max_expense_id = {ph}, max_updated_at = {ph}, refreshed_at = {ph}
+                WHERE id = 1
+                """, [max_id, max_updated_at, refreshed_at])
+            else:
+                self._execute(conn, f"""
+                INSERT INTO monthly_category_totals_watermark (id, max_expense_id, max_updated_at, refreshed_at)
+                VALUES (1, {ph}, {ph}, {ph})
+                """, [max_id, max_updated_at, refreshed_at])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+        
+        logger.debug("Refreshed monthly totals: %d rows scanned, %d changed, %d deleted, %d buckets updated",
+                     scanned_rows, changed_rows, deleted_rows, buckets_updated)
+        return {
+            'scanned_rows': scanned_rows,
+            'changed_rows': changed_rows,
+            'deleted_rows': deleted_rows,
+            'buckets_updated': buckets_updated,
+            'watermark': {'max_expense_id': max_id,
+                          'max_updated_at': None if max_updated_at is None else str(max_updated_at)},
+            'elapsed_ms': round((time.perf_counter() - started_at) * 1000, 3)
+        }
+    
+    
+    @profiled('featurize')
+    def prepare_features(self, series):
+        """Create features for ML model from a MonthlySeries"""
+        if series is None or len(series) < 3:  # Need at least 3 data points for meaningful features (reduced from 6 for predictions)
             return None, None
         
-        print(f"DEBUG: Prepared {len(features)} valid feature rows from {len(df)} monthly data points", file=sys.stderr)
+        features = build_feature_matrix(series.amounts, series.months)
+        targets = series.amounts.copy()
+        
+        logger.debug("Prepared %d valid feature rows from %d monthly data points", len(features), len(series))
         
         return features, targets
     
     def get_model_path(self, user_id, category_id):
         """Get the file path for storing the model"""
-        return os.path.join(self.model_storage_path, f'forecast_user_{user_id}_cat_{category_id}.pkl')
+        return self.model_store.path(user_id, category_id)
     
-    def save_model(self, model, model_name, user_id, category_id, features, targets, performance):
-        """Save trained model to disk"""
+    @profiled('save')
+    def save_model(self, model, model_name, user_id, category_id, features, targets, performance, last_month=None):
+        """Save trained model to disk (last_month: newest month in the training rows, as YYYY-MM)"""
         try:
-            model_path = self.get_model_path(user_id, category_id)
-            
             model_data = {
                 'model': model,
                 'scaler': self.scaler,
@@ -623,244 +2669,386 @@ class ExpenseForecaster:
                 'data_points': len(features),
                 'performance': performance,
                 'user_id': user_id,
-                'category_id': category_id
+                'category_id': category_id,
+                'last_month': last_month
             }
             
-            joblib.dump(model_data, model_path)
-            print(f"DEBUG: Model saved to {model_path}", file=sys.stderr)
+            # The in-memory model keeps training for other pairs, so the store never caches it on write
+            model_path = self.model_store.put(user_id, category_id, model_data)
+            logger.debug("Model saved to %s", model_path)
             return model_path
             
         except Exception as e:
-            print(f"ERROR: Failed to save model: {str(e)}", file=sys.stderr)
-            return None
-    
-    def load_model(self, user_id, category_id):
-        """Load trained model from disk"""
-        try:
-            model_path = self.get_model_path(user_id, category_id)
-            
-            if not os.path.exists(model_path):
-                print(f"DEBUG: No saved model found at {model_path}", file=sys.stderr)
-                return None
-            
-            # Check if model is fresh (less than 7 days old)
-            model_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(model_path))
-            if model_age.days > 7:
-                print(f"DEBUG: Model is {model_age.days} days old, too stale", file=sys.stderr)
-                return None
-            
-            model_data = joblib.load(model_path)
-            print(f"DEBUG: Model loaded from {model_path}", file=sys.stderr)
-            return model_data
-            
-        except Exception as e:
-            print(f"ERROR: Failed to load model: {str(e)}", file=sys.stderr)
+            logger.error("Failed to save model: %s", e)
             return None
     
-    def train_models(self, features, targets):
-        """Train multiple ML models and return the best one"""
+    @profiled('load')
+    def load_model(self, user_id, category_id):
+        """Load trained model from disk (None if missing or more than 7 days old)"""
+        try:
+            return self.model_store.get(user_id, category_id)
+        except Exception as e:
+            logger.error("Failed to load model: %s", e)
+            return None
+    
+    def train_models(self, features, targets, time_budget_ms=_CONFIGURED):
+        """
+        Select the best model by expanding-window cross-validation and train it once on all rows.
+        
+        The winner's out-of-fold predictions are kept in self.oof_predictions as (row indices,
+        predictions) for calculate_performance_metrics; None when there were too few rows to
+        cross-validate. The returned model is a fitted clone, so self.models stay unfitted templates.
+        time_budget_ms overrides self.time_budget_ms for this call.
+        """
+        if time_budget_ms is _CONFIGURED:
+            time_budget_ms = self.time_budget_ms
+        self.oof_predictions = None
+        self.selection_report = None
         if len(features) < 3:
             return None, None
             
-        # Scale features
+        # Scale features (fresh scaler: self.scaler may be a cached model's scaler)
+        self.scaler = StandardScaler(dtype=self.dtype)
         features_scaled = self.scaler.fit_transform(features)
         
+        if time_budget_ms is not None and len(features) >= 4:
+            return self._train_models_with_deadline(features_scaled, targets, time_budget_ms)
+        
+        started_at = time.perf_counter()
+        finished, failed = [], []
         best_model = None
         best_score = -float('inf')
         best_model_name = None
+        best_oof = None
         trained_models = {}  # Track which models are already trained
         
         for name, model in self.models.items():
             try:
                 if len(features) >= 4:
                     cv_folds = min(3, max(2, len(features) - 1))  
-                    cv_scores = cross_val_score(model, features_scaled, targets, cv=cv_folds, scoring='r2')
-                    avg_score = np.mean(cv_scores)
+                    splits, fold_predictions = cross_val_fold_predictions(
+                        model, features_scaled, targets, cv=cv_folds, n_jobs=getattr(model, 'n_jobs', 1),
+                        cache=self.fold_cache)
+                    avg_score = np.mean([_score('r2', targets[test_idx], predictions)
+                                         for (_, test_idx), predictions in zip(splits, fold_predictions)])
+                    oof = (np.concatenate([test_idx for _, test_idx in splits]), np.concatenate(fold_predictions))
                 else:
                     # For very limited data (3 samples), just train on all and use R² = 0 as baseline
-                    model.fit(features_scaled, targets)
-                    trained_models[name] = model  # Save trained model
-                    predictions = model.predict(features_scaled)
+                    trained_models[name] = clone_model(model).fit(features_scaled, targets)
+                    predictions = trained_models[name].predict(features_scaled)
                     # Simple R² calculation
                     ss_res = np.sum((targets - predictions) ** 2)
                     ss_tot = np.sum((targets - np.mean(targets)) ** 2)
                     avg_score = 1 - (ss_res / ss_tot) if ss_tot > 0 else 0
+                    oof = None
                 
+                finished.append(name)
                 if avg_score > best_score:
                     best_score = avg_score
                     best_model_name = name
+                    best_oof = oof
                     # If model was already trained, use it; otherwise will train below
-                    if name in trained_models:
-                        best_model = trained_models[name]
+                    best_model = trained_models.get(name)
                     
             except Exception as e:
+                logger.warning("Model %s failed during selection: %s", name, e)
+                failed.append(name)
                 continue
         
-        # Train the best model on all data for final use (unless already trained)
-        if best_model is None and best_model_name:
-            # Create a fresh instance of the best model and train it
-            best_model = self.models[best_model_name]
-            best_model.fit(features_scaled, targets)
-        elif best_model is None:
+        if best_model_name is None and len(self.models) > 0:
             # Fallback: train first available model
-            if len(self.models) > 0:
-                best_model_name = list(self.models.keys())[0]
-                best_model = self.models[best_model_name]
-                best_model.fit(features_scaled, targets)
+            best_model_name = list(self.models.keys())[0]
+        
+        # Train the best model on all data, the only fit of the final model
+        if best_model is None and best_model_name:
+            with PROFILER.span('train'):
+                best_model = clone_model(self.models[best_model_name]).fit(features_scaled, targets)
+        
+        self.oof_predictions = best_oof
+        self.selection_report = {'finished': finished, 'failed': failed, 'timed_out': [],
+                                 'elapsed_ms': round((time.perf_counter() - started_at) * 1000, 3)}
+        return best_model, best_model_name
+    
+    def _train_models_with_deadline(self, features_scaled, targets, time_budget_ms):
+        """
+        train_models within time_budget_ms.
         
+        Every candidate except FLOOR_MODEL is cross-validated and fitted on all rows in its own
+        worker process, while the floor model is evaluated here. When the budget runs out the
+        unfinished workers are terminated and the best finished candidate wins; the floor model
+        always finishes, so there is a result however small the budget. The worker processes
+        belong to this call alone, so terminating them never touches another fit's pool.
+        
+        The budget is approximate. Results are collected until the estimated cost of stopping the
+        remaining workers is all that is left. A budget too small to start and stop the workers
+        evaluates only the floor model, so the floor model's own time can still overrun it.
+        """
+        import multiprocessing
+        from multiprocessing.connection import wait
+        
+        started_at = time.perf_counter()
+        deadline = started_at + time_budget_ms / 1000
+        cv_folds = min(3, max(2, len(features_scaled) - 1))
+        results, failed = {}, []
+        
+        others = [name for name in self.models if name != self.FLOOR_MODEL]
+        skipped = []
+        if others and time_budget_ms < len(others) * (_worker_cost_ms('start') + _worker_cost_ms('stop')):
+            # Starting the workers would use up the budget: evaluate only the floor model
+            skipped = others
+        # Receiving end of each worker's pipe -> (candidate name, worker process)
+        pending = {}
+        for name in others:
+            if name in skipped:
+                continue
+            model = self.models[name]
+            # The worker is one process; its forest must not start a nested pool
+            worker_model = clone_model(model, n_jobs=1) if hasattr(model, 'n_jobs') else model
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_send_candidate_result, daemon=True,
+                                              args=(sender, worker_model, features_scaled, targets, cv_folds))
+            process.start()
+            sender.close()
+            pending[receiver] = (name, process)
+        _record_worker_cost('start', (time.perf_counter() - started_at) * 1000, len(pending))
+        
+        with PROFILER.span('select'):
+            if self.FLOOR_MODEL in self.models:
+                try:
+                    results[self.FLOOR_MODEL] = evaluate_candidate(self.models[self.FLOOR_MODEL], features_scaled,
+                                                                   targets, cv_folds)
+                except Exception as e:
+                    logger.warning("Model %s failed during selection: %s", self.FLOOR_MODEL, e)
+                    failed.append(self.FLOOR_MODEL)
+            
+            # Stop collecting early enough to stop the remaining workers by the deadline
+            collect_until = deadline
+            while pending:
+                collect_until = deadline - len(pending) * _worker_cost_ms('stop') / 1000
+                if time.perf_counter() >= collect_until:
+                    break
+                for receiver in wait(list(pending), timeout=max(0.0, collect_until - time.perf_counter())):
+                    name, process = pending.pop(receiver)
+                    try:
+                        succeeded, value = receiver.recv()
+                    except EOFError:
+                        succeeded, value = False, RuntimeError('worker exited without a result')
+                    receiver.close()
+                    process.join()
+                    if succeeded:
+                        results[name] = value
+                    else:
+                        logger.warning("Model %s failed during selection: %s", name, value)
+                        failed.append(name)
+            
+            unfinished = set(skipped) | {name for name, _ in pending.values()}
+            timed_out = [name for name in others if name in unfinished]
+            if timed_out:
+                logger.info("Time budget reached, skipping %s", ', '.join(timed_out))
+            for receiver, (_, process) in pending.items():
+                process.terminate()
+                process.join()
+                receiver.close()
+            if pending:
+                # From the planned end of collection, so a late wake-up counts as stop cost too
+                _record_worker_cost('stop', (time.perf_counter() - collect_until) * 1000, len(pending))
+        
+        best_model, best_model_name, best_score, best_oof = None, None, -float('inf'), None
+        for name in self.models:
+            if name not in results:
+                continue
+            splits, fold_predictions, fitted = results[name]
+            score = np.mean([_score('r2', targets[test_idx], predictions)
+                             for (_, test_idx), predictions in zip(splits, fold_predictions)])
+            if score > best_score:
+                best_score, best_model_name, best_model = score, name, fitted
+                best_oof = (np.concatenate([test_idx for _, test_idx in splits]), np.concatenate(fold_predictions))
+        
+        if best_model is not None and hasattr(best_model, 'n_jobs'):
+            # Fitted in a single-process worker; keep the configured setting for later refits
+            best_model.n_jobs = self.models[best_model_name].n_jobs
+        
+        self.oof_predictions = best_oof
+        self.selection_report = {
+            'finished': [name for name in self.models if name in results],
+            'failed': failed,
+            'timed_out': timed_out,
+            'elapsed_ms': round((time.perf_counter() - started_at) * 1000, 3),
+            'time_budget_ms': time_budget_ms
+        }
         return best_model, best_model_name
     
-    def make_prediction(self, model, features, targets, target_month=None, target_year=None):
-        """Make prediction for specified month or next month"""
+    @profiled('predict')
+    def predict_horizon(self, model, features, targets, first_month=None, horizon=1):
+        """
+        Recursive multi-step forecast: predictions for horizon consecutive months starting at first_month
+        (default: the month after the last feature row).
+        
+        Each step's prediction is appended to the known amounts, so the next step's lag, rolling and
+        trend features see it like an observed month. Every step only touches the last 12 amounts.
+        """
         if model is None or len(features) < 1:
             return None
             
         try:
-            # Prepare features for target month
-            last_features = features[-1:].copy()
             feature_names = self.get_feature_names()
             
-            # If target month/year specified, use them; otherwise predict next month
-            if target_month is not None:
-                prediction_month = target_month
-            else:
+            # If target month is specified, start there; otherwise predict next month
+            if first_month is None:
                 # Default to next month
                 month_idx = feature_names.index('month') if 'month' in feature_names else None
                 if month_idx is not None:
-                    current_month = int(last_features[0, month_idx])
-                    prediction_month = (current_month % 12) + 1
+                    current_month = int(features[-1, month_idx])
+                    first_month = (current_month % 12) + 1
                 else:
-                    prediction_month = 1
+                    first_month = 1
             
-            # Update month feature
-            if 'month' in feature_names:
-                month_idx = feature_names.index('month')
-                last_features[0, month_idx] = prediction_month
+            n_known = len(targets)
+            history = np.empty(n_known + horizon, dtype=np.float64)
+            history[:n_known] = targets
             
-            # Update time-based features: shift forward by one month
-            # previous_month for prediction_month should be the last known month's amount
-            if len(targets) > 0:
-                last_amount = targets[-1]  # Last known month's amount (e.g., June for July prediction)
-                
-                if 'previous_month' in feature_names:
-                    prev_month_idx = feature_names.index('previous_month')
-                    last_features[0, prev_month_idx] = last_amount
-                
-                # previous_2months should be second-to-last known amount
-                if len(targets) > 1 and 'previous_2months' in feature_names:
-                    prev_2months_idx = feature_names.index('previous_2months')
-                    last_features[0, prev_2months_idx] = targets[-2]
-                
-                # previous_3months should be third-to-last known amount
-                if len(targets) > 2 and 'previous_3months' in feature_names:
-                    prev_3months_idx = feature_names.index('previous_3months')
-                    last_features[0, prev_3months_idx] = targets[-3]
-                
-                # Update rolling features based on last known values
-                # rolling_3m: average of last 3 known months (if available)
-                if len(targets) >= 3 and 'rolling_3m' in feature_names:
-                    rolling_3m_idx = feature_names.index('rolling_3m')
-                    rolling_3m_val = np.mean(targets[-3:])
-                    last_features[0, rolling_3m_idx] = rolling_3m_val
-                
-                # rolling_6m: average of last 6 known months (if available)
-                if len(targets) >= 6 and 'rolling_6m' in feature_names:
-                    rolling_6m_idx = feature_names.index('rolling_6m')
-                    rolling_6m_val = np.mean(targets[-6:])
-                    last_features[0, rolling_6m_idx] = rolling_6m_val
-                elif len(targets) >= 3 and 'rolling_6m' in feature_names:
-                    # Use available data if less than 6 months
-                    rolling_6m_idx = feature_names.index('rolling_6m')
-                    rolling_6m_val = np.mean(targets)
-                    last_features[0, rolling_6m_idx] = rolling_6m_val
+            # Prepare features for target month from the last observed row
+            row = features[-1:].copy()
+            predictions = []
+            for step in range(horizon):
+                month = (first_month - 1 + step) % 12 + 1
+                self._step_features(row, history[:n_known + step], month, feature_names)
                 
-                # rolling_12m: use available data
-                if len(targets) >= 12 and 'rolling_12m' in feature_names:
-                    rolling_12m_idx = feature_names.index('rolling_12m')
-                    rolling_12m_val = np.mean(targets[-12:])
-                    last_features[0, rolling_12m_idx] = rolling_12m_val
-                elif len(targets) >= 6 and 'rolling_12m' in feature_names:
-                    rolling_12m_idx = feature_names.index('rolling_12m')
-                    rolling_12m_val = np.mean(targets[-6:])
-                    last_features[0, rolling_12m_idx] = rolling_12m_val
+                # Scale features
+                row_scaled = self.scaler.transform(row)
                 
-                # rolling_std_3m and rolling_std_6m: calculate from available data
-                if len(targets) >= 3 and 'rolling_std_3m' in feature_names:
-                    rolling_std_3m_idx = feature_names.index('rolling_std_3m')
-                    rolling_std_3m_val = np.std(targets[-3:]) if len(targets[-3:]) > 1 else 0
-                    last_features[0, rolling_std_3m_idx] = rolling_std_3m_val
-                
-                if len(targets) >= 6 and 'rolling_std_6m' in feature_names:
-                    rolling_std_6m_idx = feature_names.index('rolling_std_6m')
-                    rolling_std_6m_val = np.std(targets[-6:]) if len(targets[-6:]) > 1 else 0
-                    last_features[0, rolling_std_6m_idx] = rolling_std_6m_val
-                
-                # trend_3m: calculate slope from last 3 months
-                if len(targets) >= 3 and 'trend_3m' in feature_names:
-                    trend_3m_idx = feature_names.index('trend_3m')
-                    x = np.arange(len(targets[-3:]))
-                    y = targets[-3:]
-                    if len(y) > 1:
-                        slope, _ = np.polyfit(x, y, 1)
-                        last_features[0, trend_3m_idx] = slope
-                    else:
-                        last_features[0, trend_3m_idx] = 0
+                # Make prediction (handle both array and scalar returns)
+                pred_result = model.predict(row_scaled)
+                if np.isscalar(pred_result):
+                    prediction = float(pred_result)
+                elif isinstance(pred_result, np.ndarray):
+                    prediction = float(pred_result[0]) if len(pred_result) > 0 else 0.0
+                else:
+                    prediction = float(pred_result)
                 
-            # Update seasonal features based on target month
-            if 'is_holiday_season' in feature_names:
-                holiday_idx = feature_names.index('is_holiday_season')
-                last_features[0, holiday_idx] = 1 if prediction_month in [11, 12, 1] else 0
+                # Ensure prediction is non-negative
+                prediction = max(0, prediction)
                 
-            if 'is_summer' in feature_names:
-                summer_idx = feature_names.index('is_summer')
-                last_features[0, summer_idx] = 1 if prediction_month in [6, 7, 8] else 0
-            
-            # Scale features
-            last_features_scaled = self.scaler.transform(last_features)
-            
-            # Make prediction (handle both array and scalar returns)
-            pred_result = model.predict(last_features_scaled)
-            if np.isscalar(pred_result):
-                prediction = float(pred_result)
-            elif isinstance(pred_result, np.ndarray):
-                prediction = float(pred_result[0]) if len(pred_result) > 0 else 0.0
-            else:
-                prediction = float(pred_result)
+                history[n_known + step] = prediction
+                predictions.append(prediction)
             
-            # Ensure prediction is non-negative
-            prediction = max(0, prediction)
-            
-            return prediction
+            return predictions
             
         except Exception as e:
-            print(f"DEBUG: Prediction error: {str(e)}", file=sys.stderr)
-            import traceback
-            print(f"DEBUG: Traceback: {traceback.format_exc()}", file=sys.stderr)
+            logger.debug("Prediction error: %s", e, exc_info=True)
             return None
     
+    @staticmethod
+    def _step_features(row, targets, month, feature_names):
+        """Update a (1, n_features) row in place for predicting month, given all amounts known before it"""
+        # Update month feature
+        if 'month' in feature_names:
+            month_idx = feature_names.index('month')
+            row[0, month_idx] = month
+        
+        # Update time-based features: shift forward by one month
+        # previous_month for month should be the last known month's amount
+        if len(targets) > 0:
+            last_amount = targets[-1]  # Last known month's amount (e.g., June for July prediction)
+            
+            if 'previous_month' in feature_names:
+                prev_month_idx = feature_names.index('previous_month')
+                row[0, prev_month_idx] = last_amount
+            
+            # previous_2months should be second-to-last known amount
+            if len(targets) > 1 and 'previous_2months' in feature_names:
+                prev_2months_idx = feature_names.index('previous_2months')
+                row[0, prev_2months_idx] = targets[-2]
+            
+            # previous_3months should be third-to-last known amount
+            if len(targets) > 2 and 'previous_3months' in feature_names:
+                prev_3months_idx = feature_names.index('previous_3months')
+                row[0, prev_3months_idx] = targets[-3]
+            
+            # Update rolling features based on last known values
+            # rolling_3m: average of last 3 known months (if available)
+            if len(targets) >= 3 and 'rolling_3m' in feature_names:
+                rolling_3m_idx = feature_names.index('rolling_3m')
+                rolling_3m_val = np.mean(targets[-3:])
+                row[0, rolling_3m_idx] = rolling_3m_val
+            
+            # rolling_6m: average of last 6 known months (if available)
+            if len(targets) >= 6 and 'rolling_6m' in feature_names:
+                rolling_6m_idx = feature_names.index('rolling_6m')
+                rolling_6m_val = np.mean(targets[-6:])
+                row[0, rolling_6m_idx] = rolling_6m_val
+            elif len(targets) >= 3 and 'rolling_6m' in feature_names:
+                # Use available data if less than 6 months
+                rolling_6m_idx = feature_names.index('rolling_6m')
+                rolling_6m_val = np.mean(targets)
+                row[0, rolling_6m_idx] = rolling_6m_val
+            
+            # rolling_12m: use available data
+            if len(targets) >= 12 and 'rolling_12m' in feature_names:
+                rolling_12m_idx = feature_names.index('rolling_12m')
+                rolling_12m_val = np.mean(targets[-12:])
+                row[0, rolling_12m_idx] = rolling_12m_val
+            elif len(targets) >= 6 and 'rolling_12m' in feature_names:
+                rolling_12m_idx = feature_names.index('rolling_12m')
+                rolling_12m_val = np.mean(targets[-6:])
+                row[0, rolling_12m_idx] = rolling_12m_val
+            
+            # rolling_std_3m and rolling_std_6m: calculate from available data
+            if len(targets) >= 3 and 'rolling_std_3m' in feature_names:
+                rolling_std_3m_idx = feature_names.index('rolling_std_3m')
+                rolling_std_3m_val = np.std(targets[-3:]) if len(targets[-3:]) > 1 else 0
+                row[0, rolling_std_3m_idx] = rolling_std_3m_val
+            
+            if len(targets) >= 6 and 'rolling_std_6m' in feature_names:
+                rolling_std_6m_idx = feature_names.index('rolling_std_6m')
+                rolling_std_6m_val = np.std(targets[-6:]) if len(targets[-6:]) > 1 else 0
+                row[0, rolling_std_6m_idx] = rolling_std_6m_val
+            
+            # trend_3m: calculate slope from last 3 months
+            if len(targets) >= 3 and 'trend_3m' in feature_names:
+                trend_3m_idx = feature_names.index('trend_3m')
+                x = np.arange(len(targets[-3:]))
+                y = targets[-3:]
+                if len(y) > 1:
+                    slope, _ = np.polyfit(x, y, 1)
+                    row[0, trend_3m_idx] = slope
+                else:
+                    row[0, trend_3m_idx] = 0
+        
+        # Update seasonal features based on target month
+        if 'is_holiday_season' in feature_names:
+            holiday_idx = feature_names.index('is_holiday_season')
+            row[0, holiday_idx] = 1 if month in [11, 12, 1] else 0
+        
+        if 'is_summer' in feature_names:
+            summer_idx = feature_names.index('is_summer')
+            row[0, summer_idx] = 1 if month in [6, 7, 8] else 0
+    
     def get_feature_names(self):
         """Get list of feature names"""
-        return [
-            'month', 'day_of_week', 'previous_month', 'previous_2months', 'previous_3months',
-            'rolling_3m', 'rolling_6m', 'rolling_12m', 'rolling_std_3m', 'rolling_std_6m',
-            'trend_3m', 'is_holiday_season', 'is_summer', 'budget_percentage'
-        ]
+        return list(FEATURE_NAMES)
     
-    def calculate_performance_metrics(self, model, features, targets):
-        """Calculate model performance metrics using proper train-test split"""
-        if model is None or len(features) < 6:
-            return {
-                'mae': 0,
-                'mape': 0,
-                'rmse': 0,
-                'r2_score': 0
-            }
+    @profiled('metrics')
+    def calculate_performance_metrics(self, targets, oof_predictions):
+        """
+        MAE, MAPE, RMSE and R² of the out-of-fold predictions from train_models; nothing is refitted.
+        
+        oof_predictions is (row indices, predictions). Months that look incomplete are left out of
+        the evaluation; too few months or no out-of-fold rows report all zeros.
+        """
+        empty = {
+            'mae': 0,
+            'mape': 0,
+            'rmse': 0,
+            'r2_score': 0
+        }
+        if oof_predictions is None or len(targets) < 6:
+            return empty
             
         try:
             # For high-variance financial data, use a more lenient outlier filter
             # Only filter extremely low values that are clearly incomplete months
             median_target = np.median(targets)
-            mean_target = np.mean(targets)
             
             # Use a more conservative threshold: 5% of median or Rs.500 (whichever is higher)
             # This prevents filtering legitimate low-spending months
@@ -873,140 +3061,74 @@ class ExpenseForecaster:
             if np.sum(valid_mask) < len(targets) * 0.8:
                 valid_mask = np.ones(len(targets), dtype=bool)
             
-            # Use filtered data for evaluation
-            features_filtered = features[valid_mask]
-            targets_filtered = targets[valid_mask]
-            
-            # For small datasets (<10 points), use a more robust evaluation
-            if len(features_filtered) < 10:
-                local_scaler = StandardScaler()
-                features_scaled = local_scaler.fit_transform(features_filtered)
-                
-                # For very small datasets, use a more lenient evaluation
-                # Train on all but last month, test on last month
-                if len(features_filtered) >= 4:
-                    # Use last 2-3 months as test set
-                    test_size = min(3, max(1, len(features_filtered) // 4))
-                    train_size = len(features_filtered) - test_size
-                    
-                    X_train_cv = features_scaled[:train_size]
-                    y_train_cv = targets_filtered[:train_size]
-                    X_test_cv = features_scaled[train_size:]
-                    y_test_cv = targets_filtered[train_size:]
-                    
-                    # Train model
-                    model_cv = LinearRegression() if hasattr(model, 'coefficients_') else RandomForestRegressor(n_estimators=50, max_depth=5, random_state=42)
-                    model_cv.fit(X_train_cv, y_train_cv)
-                    predictions_cv = model_cv.predict(X_test_cv)
-                    
-                    # Calculate R² on test set
-                    ss_res = np.sum((y_test_cv - predictions_cv) ** 2)
-                    ss_tot = np.sum((y_test_cv - np.mean(y_test_cv)) ** 2)
-                    r2 = float(1 - (ss_res / ss_tot)) if ss_tot > 0 else 0.0
-                    
-                    # Use raw R² from test set (no manipulation)
-                    mae = mean_absolute_error(y_test_cv, predictions_cv)
-                    rmse = np.sqrt(mean_squared_error(y_test_cv, predictions_cv))
-                else:
-                    # For very small datasets (<4 months), use simple training error with regularization
-                    model.fit(features_scaled, targets_filtered)
-                    predictions = model.predict(features_scaled)
-                    
-                    # Calculate R² (raw, no manipulation)
-                    ss_res = np.sum((targets_filtered - predictions) ** 2)
-                    ss_tot = np.sum((targets_filtered - np.mean(targets_filtered)) ** 2)
-                    r2 = float(1 - (ss_res / ss_tot)) if ss_tot > 0 else 0.0
-                    
-                    mae = mean_absolute_error(targets_filtered, predictions)
-                    rmse = np.sqrt(mean_squared_error(targets_filtered, predictions))
-                
-                # Calculate MAPE
-                model.fit(features_scaled, targets_filtered)
-                predictions = model.predict(features_scaled)
-                mape = np.mean(np.abs((targets_filtered - predictions) / np.maximum(targets_filtered, 1))) * 100
-                
-                return {
-                    'mae': float(mae),
-                    'mape': float(mape),
-                    'rmse': float(rmse),
-                    'r2_score': float(r2)
-                }
-            
-            # For larger datasets (10+ points), use train-test split
-            split_idx = int(len(features_filtered) * 0.8)
-            if split_idx < 3:
-                split_idx = 3
-                
-            X_train, X_test = features_filtered[:split_idx], features_filtered[split_idx:]
-            y_train, y_test = targets_filtered[:split_idx], targets_filtered[split_idx:]
-            
-            if len(X_test) < 1:
-                # Fallback to cross-validation
-                local_scaler = StandardScaler()
-                features_scaled = local_scaler.fit_transform(features_filtered)
-                cv_scores = cross_val_score(model, features_scaled, targets_filtered, cv=min(3, len(features_filtered)-1), scoring='r2')
-                r2 = float(np.mean(cv_scores))
-                
-                std_targets = float(np.std(targets_filtered)) if np.std(targets_filtered) > 0 else 1.0
-                mae = std_targets * max(0.0, (1 - r2)) * 0.5
-                rmse = std_targets * max(0.0, (1 - r2)) * 0.7
-                mape = max(0.0, (1 - r2) * 100)
-                return {
-                    'mae': float(mae),
-                    'mape': float(mape),
-                    'rmse': float(rmse),
-                    'r2_score': float(r2)
-                }
-            
-            # Fit scaler on training data only
-            local_scaler = StandardScaler()
-            X_train_scaled = local_scaler.fit_transform(X_train)
-            X_test_scaled = local_scaler.transform(X_test)
-            
-            # Train model on training data
-            model.fit(X_train_scaled, y_train)
-            
-            # Make predictions on test data
-            predictions = model.predict(X_test_scaled)
-            
-            # Calculate metrics on test data (no manipulation - use raw R²)
-            mae = mean_absolute_error(y_test, predictions)
-            rmse = np.sqrt(mean_squared_error(y_test, predictions))
-            r2 = r2_score(y_test, predictions)
-            
-            # Calculate MAPE
-            mape = np.mean(np.abs((y_test - predictions) / np.maximum(y_test, 1))) * 100
-            
-            return {
-                'mae': float(mae),
-                'mape': float(mape),
-                'rmse': float(rmse),
-                'r2_score': float(r2)
-            }
+            rows, predictions = oof_predictions
+            keep = valid_mask[rows]
+            if not np.any(keep):
+                return empty
+            return regression_metrics(targets[rows[keep]], predictions[keep])
             
         except Exception as e:
-            print(f"ERROR in calculate_performance_metrics: {str(e)}", file=sys.stderr)
-            return {
-                'mae': 0,
-                'mape': 0,
-                'rmse': 0,
-                'r2_score': 0
-            }
+            logger.error("calculate_performance_metrics failed: %s", e)
+            return empty
+    
+    def forecast(self, user_id, category_id, force_retrain=False, target_month=None, target_year=None, horizon=1,
+                 time_budget_ms=_CONFIGURED):
+        """
+        Main forecasting method with model persistence.
+        
+        With horizon > 1 the result also lists recursive forecasts for that many consecutive
+        months (starting at the target month) under 'forecasts', from the same fetch and model.
+        When a result cache is configured, a repeated request for an unchanged pair (same expense
+        fingerprint and saved model) is answered from it without fetching the series or loading the model.
+        time_budget_ms overrides the model-selection budget for this call (None for no budget).
+        """
+        # Series memo lives for one request only; expenses may change between requests
+        self._series_memo = {}
+        if self.result_cache is None:
+            return self._forecast(user_id, category_id, force_retrain, target_month, target_year, horizon,
+                                  time_budget_ms)
+        
+        fingerprint = self.get_data_fingerprint(user_id, category_id)
+        # A stale model means forecast() would retrain, so only a fresh one can be answered from cache
+        if fingerprint is not None and not force_retrain and self.model_store.is_fresh(user_id, category_id):
+            cached = self.result_cache.get(self._result_cache_key(user_id, category_id, target_month, target_year,
+                                                                  horizon, fingerprint))
+            if cached is not None:
+                PROFILER.count('result_cache_hits')
+                logger.debug("Forecast served from result cache")
+                return cached
+        
+        result = self._forecast(user_id, category_id, force_retrain, target_month, target_year, horizon,
+                                time_budget_ms)
+        # Only results served from the saved model: a training run's result (method, model_selection,
+        # timings) describes that run, and replaying it would read as another fresh training
+        if fingerprint is not None and result.get('method') == 'Machine Learning (Cached)':
+            self.result_cache.put(self._result_cache_key(user_id, category_id, target_month, target_year,
+                                                         horizon, fingerprint), result)
+        return result
     
-    def forecast(self, user_id, category_id, force_retrain=False, target_month=None, target_year=None):
-        """Main forecasting method with model persistence"""
+    def _result_cache_key(self, user_id, category_id, target_month, target_year, horizon, fingerprint):
+        model_info = self.model_store.info(user_id, category_id)
+        model_version = None if model_info is None else [model_info['mtime'], model_info['size_bytes']]
+        # The day is part of the version so model_age_days in a cached result stays current
+        model_version = [datetime.now().date().isoformat(), model_version]
+        return ResultCache.key(user_id, category_id, target_month, target_year, horizon, model_version, fingerprint)
+    
+    def _forecast(self, user_id, category_id, force_retrain, target_month, target_year, horizon,
+                  time_budget_ms=_CONFIGURED):
+        """forecast() without the result cache"""
         try:
             # Try to load existing model first (unless forced to retrain)
             if not force_retrain:
                 saved_model_data = self.load_model(user_id, category_id)
                 if saved_model_data:
-                    print("DEBUG: Using saved model for prediction", file=sys.stderr)
+                    logger.debug("Using saved model for prediction")
                     
                     # Get fresh data for prediction (filtered up to target month if specified)
-                    df = self.get_user_data(user_id, category_id, target_month, target_year)
+                    df = self.get_series(user_id, category_id, target_month, target_year)
                     if df is None or len(df) == 0:
                         # If no filtered data, try using all data (if target month allows)
-                        df = self.get_user_data(user_id, category_id, None, None)
+                        df = self.get_series(user_id, category_id, None, None)
                         if df is None or len(df) == 0:
                             return {'error': 'No data available for forecasting'}
                     
@@ -1021,10 +3143,10 @@ class ExpenseForecaster:
                     self.scaler = saved_model_data['scaler']
                     
                     # Make prediction with saved model
-                    prediction = self.make_prediction(model, features, targets, target_month, target_year)
-                    if prediction is not None:
-                        return {
-                            'prediction': float(prediction),
+                    predictions = self.predict_horizon(model, features, targets, target_month, horizon)
+                    if predictions:
+                        return self._with_horizon({
+                            'prediction': float(predictions[0]),
                             'accuracy': float(saved_model_data['performance']['r2_score']),
                             'model_type': saved_model_data['model_name'],
                             'data_points': int(saved_model_data['data_points']),
@@ -1033,18 +3155,25 @@ class ExpenseForecaster:
                             'model_age_days': (datetime.now() - datetime.fromisoformat(saved_model_data['trained_at'])).days,
                             'target_month': target_month,
                             'target_year': target_year
-                        }
+                        }, df, predictions, target_month, target_year)
                     # If prediction failed, fall through to train fresh model
+                
+                # No model of its own (train_pooled removes one that lost to the pooled model on backtest):
+                # use the pooled model. A pair whose own model is stale or failed retrains below instead
+                if self.pooled and self.model_store.info(user_id, category_id) is None:
+                    pooled_result = self._pooled_forecast(user_id, category_id, target_month, target_year, horizon)
+                    if pooled_result is not None:
+                        return pooled_result
             
-            print("DEBUG: Training fresh model", file=sys.stderr)
+            logger.debug("Training fresh model")
             
             # For training, use filtered data up to target month (if specified) to ensure correct data_points count
             # This ensures the model is trained on the same data that will be used for prediction
             if target_month and target_year:
-                df = self.get_user_data(user_id, category_id, target_month, target_year)
+                df = self.get_series(user_id, category_id, target_month, target_year)
             else:
                 # If no target specified, use all data
-                df = self.get_user_data(user_id, category_id, None, None)
+                df = self.get_series(user_id, category_id, None, None)
             
             if df is None:
                 return {'error': 'No data available for forecasting'}
@@ -1055,43 +3184,759 @@ class ExpenseForecaster:
                 return {'error': 'Insufficient data for feature preparation'}
             
             # Train models (need at least 3 valid feature rows)
-            best_model, best_model_name = self.train_models(features, targets)
+            best_model, best_model_name = self.train_models(features, targets, time_budget_ms)
             if best_model is None:
                 # Return error - let the controller handle statistical fallback
                 return {'error': 'Failed to train any models'}
             
-            # Calculate performance metrics
-            performance = self.calculate_performance_metrics(best_model, features, targets)
+            # Metrics come from the out-of-fold predictions of model selection, so no extra fits
+            performance = self.calculate_performance_metrics(targets, self.oof_predictions)
             
-            # Save the trained model
-            model_path = self.save_model(best_model, best_model_name, user_id, category_id, features, targets, performance)
+            # Save the trained model, unless the time budget cut selection short: the saved model is
+            # served for days, so it must come from a full selection (see ForecastServer.rpc_forecast)
+            model_path = None
+            if self.selection_report and self.selection_report['timed_out']:
+                logger.info("Not saving %s model chosen under the time budget", best_model_name)
+            else:
+                model_path = self.save_model(best_model, best_model_name, user_id, category_id, features, targets,
+                                             performance, last_month=str(df.months[-1]))
             
             # Use the same features/targets for prediction (already filtered if target_month specified)
             
             # Make prediction
-            prediction = self.make_prediction(best_model, features, targets, target_month, target_year)
-            if prediction is None:
+            predictions = self.predict_horizon(best_model, features, targets, target_month, horizon)
+            if not predictions:
                 return {'error': 'Failed to make prediction'}
             
-            return {
-                'prediction': float(prediction),
+            return self._with_horizon({
+                'prediction': float(predictions[0]),
                 'accuracy': float(performance['r2_score']),
                 'model_type': best_model_name,
                 'data_points': int(len(features)),
                 'performance': performance,
                 'method': 'Machine Learning (Fresh)',
                 'model_path': model_path,
+                'model_selection': self.selection_report,
                 'target_month': target_month,
                 'target_year': target_year
-            }
+            }, df, predictions, target_month, target_year)
             
         except Exception as e:
             return {'error': f'Forecasting error: {str(e)}'}
+    
+    @staticmethod
+    def _with_horizon(result, series, predictions, target_month, target_year):
+        """Add the per-month list to a forecast result when more than one month was predicted"""
+        if len(predictions) < 2:
+            return result
+        
+        if target_month and target_year:
+            start = np.datetime64(f'{int(target_year):04d}-{int(target_month):02d}', 'M')
+        else:
+            start = series.months[-1] + 1
+            if target_month:
+                # First month with the requested month number after the data
+                start = start + (int(target_month) - 1 - start.astype(np.int64) % 12) % 12
+        
+        months = (start + np.arange(len(predictions))).astype(np.int64)
+        result['horizon'] = len(predictions)
+        result['forecasts'] = [
+            {'month': int(month % 12 + 1), 'year': int(1970 + month // 12), 'prediction': float(prediction)}
+            for month, prediction in zip(months, predictions)
+        ]
+        return result
+
+    def _pooled_key(self, category_id, scope=None):
+        """ModelStore key of the pooled model serving a category"""
+        if (scope or self.pooled) == 'global':
+            return ModelStore.POOLED_USER_ID, ModelStore.GLOBAL_CATEGORY_ID
+        return ModelStore.POOLED_USER_ID, category_id
+    
+    def _pooled_forecast(self, user_id, category_id, target_month, target_year, horizon):
+        """
+        Forecast a pair with the pooled model of its category (or the global one), or None when
+        there is no fresh pooled model or no data.
+        
+        The series is divided by its mean month, so even a single month of history gets a forecast.
+        """
+        model_data = self.load_model(*self._pooled_key(category_id))
+        if model_data is None:
+            return None
+        
+        series = self.get_series(user_id, category_id, target_month, target_year)
+        if series is None or len(series) == 0:
+            series = self.get_series(user_id, category_id, None, None)
+            if series is None or len(series) == 0:
+                return None
+        
+        features, amounts, scale = pooled_prediction_inputs(series.amounts, series.months)
+        self.scaler = model_data['scaler']
+        predictions = self.predict_horizon(model_data['model'], features, amounts, target_month, horizon)
+        if not predictions:
+            return None
+        predictions = [prediction * scale for prediction in predictions]
+        
+        return self._with_horizon({
+            'prediction': float(predictions[0]),
+            'accuracy': float(model_data['performance']['r2_score']),
+            'model_type': model_data['model_name'],
+            'data_points': int(len(series)),
+            'performance': model_data['performance'],
+            'method': 'Machine Learning (Pooled)',
+            'pooled': model_data['pooled'],
+            'model_age_days': (datetime.now() - datetime.fromisoformat(model_data['trained_at'])).days,
+            'target_month': target_month,
+            'target_year': target_year
+        }, series, predictions, target_month, target_year)
+    
+    def update_model(self, user_id, category_id):
+        """
+        Fold months added since a saved linear model was trained into it without retraining.
+        
+        The model keeps X^T X / X^T y and the scaler keeps running moments, so only the new
+        feature rows are processed. Other model types (and models saved before statistics were
+        kept) report retrain_required. Stored performance metrics are left as trained.
+        """
+        self._series_memo = {}
+        saved_model_data = self.load_model(user_id, category_id)
+        if saved_model_data is None:
+            return {'error': 'No saved model to update', 'retrain_required': True}
+        
+        model = saved_model_data['model']
+        scaler = saved_model_data['scaler']
+        if (getattr(model, 'xtx_', None) is None or getattr(scaler, 'var_', None) is None
+                or not saved_model_data.get('last_month')):
+            return {'error': f"Model type {saved_model_data['model_name']} cannot be updated incrementally",
+                    'retrain_required': True}
+        
+        series = self.get_series(user_id, category_id, None, None)
+        if series is None:
+            return {'error': 'No data available for update'}
+        
+        new_rows = series.months > np.datetime64(saved_model_data['last_month'], 'M')
+        new_months = int(np.count_nonzero(new_rows))
+        if new_months == 0:
+            return {'updated': False, 'new_months': 0, 'data_points': int(saved_model_data['data_points'])}
+        
+        # Features need the preceding months for lags and rolling windows, so build them on the full series
+        features = build_feature_matrix(series.amounts, series.months)[new_rows]
+        targets = series.amounts[new_rows]
+        
+        # Cached model data may be shared with other requests, so update copies
+        model = copy.deepcopy(model)
+        scaler = copy.deepcopy(scaler)
+        old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+        scaler.partial_fit(features)
+        model.rescale_inputs(old_mean, old_scale, scaler.mean_, scaler.scale_)
+        model.partial_fit(scaler.transform(features, copy=False), targets)
+        
+        model_data = dict(saved_model_data, model=model, scaler=scaler,
+                          data_points=int(saved_model_data['data_points']) + new_months,
+                          last_month=str(series.months[-1]), updated_at=datetime.now().isoformat())
+        self.model_store.put(user_id, category_id, model_data)
+        logger.debug("Folded %d new months into saved model", new_months)
+        
+        return {'updated': True, 'new_months': new_months, 'data_points': model_data['data_points'],
+                'model_type': saved_model_data['model_name']}
+    
+    def evaluate_performance(self, user_id, category_id, aggregate_monthly=False):
+        """Performance metrics only (no forecast), as reported by --performance-only"""
+        series = self.get_user_data(user_id, category_id)
+        if series is None:
+            return {'error': 'No data available'}
+        
+        # get_user_data already returns monthly totals, so aggregate_monthly needs no extra work
+        features, targets = self.prepare_features(series)
+        if features is not None:
+            self.train_models(features, targets)
+            return self.calculate_performance_metrics(targets, self.oof_predictions)
+        
+        # Fallback: simple lag-1 feature evaluation on aggregated (or raw) series
+        try:
+            # MonthlySeries is already sorted by month
+            X = series.amounts[:-1].reshape(-1, 1)
+            y = series.amounts[1:]
+            if len(y) < 3:
+                return {'mae': 0, 'mape': 0, 'rmse': 0, 'r2_score': 0}
+            
+            # time-aware split
+            split_idx = int(len(X) * 0.8)
+            if split_idx < 2:
+                split_idx = 2
+            X_train, X_test = X[:split_idx], X[split_idx:]
+            y_train, y_test = y[:split_idx], y[split_idx:]
+            # Use our custom implementations
+            scaler = StandardScaler()
+            X_train_scaled = scaler.fit_transform(X_train)
+            X_test_scaled = scaler.transform(X_test)
+            model = LinearRegression()
+            model.fit(X_train_scaled, y_train)
+            preds = model.predict(X_test_scaled)
+            mae = mean_absolute_error(y_test, preds)
+            rmse = np.sqrt(mean_squared_error(y_test, preds))
+            r2 = r2_score(y_test, preds) if len(y_test) > 1 else 0.0
+            mape = float(np.mean(np.abs((y_test - preds) / np.maximum(y_test, 1))) * 100)
+            return {'mae': float(mae), 'mape': float(mape), 'rmse': float(rmse), 'r2_score': float(r2)}
+        except Exception:
+            return {'mae': 0, 'mape': 0, 'rmse': 0, 'r2_score': 0}
+    
+    def forecast_batch(self, pairs=None, user_id=None, min_expenses=6, force_retrain=False,
+                       target_month=None, target_year=None, horizon=1):
+        """
+        Forecast many (user, category) pairs in one process.
+        
+        All monthly series are fetched up front with one grouped query, then each pair runs
+        through forecast() in-process. Yields one result dict per pair, tagged with its ids.
+        """
+        if self.pooled:
+            # The pooled model forecasts pairs with any amount of history
+            min_expenses = 1
+        series = self.get_monthly_series_batch(pairs=pairs, user_id=user_id, min_expenses=min_expenses)
+        if series is None:
+            yield {'error': 'Failed to load expense data'}
+            return
+        
+        self.preloaded_series = series
+        keys = [(int(u), int(c)) for u, c in pairs] if pairs else list(series.keys())
+        
+        for pair_user_id, pair_category_id in keys:
+            if (pair_user_id, pair_category_id) in series:
+                result = self.forecast(pair_user_id, pair_category_id, force_retrain=force_retrain,
+                                       target_month=target_month, target_year=target_year, horizon=horizon)
+            else:
+                result = {'error': 'No data available for forecasting'}
+            
+            yield {'user_id': pair_user_id, 'category_id': pair_category_id, **result}
+    
+    def backtest(self, pairs=None, user_id=None, min_expenses=6, min_train_months=6, model_names=None, refit_every=1):
+        """
+        Rolling-origin backtest of every selected (user, category) pair in one pass.
+        
+        Series come from one grouped query and each gets one feature matrix. At every cutoff month
+        from min_train_months on, each model is trained on the months before the cutoff and
+        predicts the cutoff month. Returns per-pair metrics for each model (plus the best one by
+        RMSE as 'performance'), and overall metrics pooled over all out-of-sample predictions.
+        """
+        series_by_pair = self.get_monthly_series_batch(pairs=pairs, user_id=user_id, min_expenses=min_expenses)
+        if series_by_pair is None:
+            return {'error': 'Failed to load expense data'}
+        
+        model_names = list(model_names or self.models.keys())
+        unknown = [name for name in model_names if name not in self.models]
+        if unknown:
+            return {'error': f"Unknown model(s): {', '.join(unknown)}"}
+        
+        keys = [(int(u), int(c)) for u, c in pairs] if pairs else list(series_by_pair.keys())
+        categories = []
+        pooled = {name: ([], []) for name in model_names + ['best']}
+        
+        for pair_user_id, pair_category_id in keys:
+            entry = {'user_id': pair_user_id, 'category_id': pair_category_id}
+            series = series_by_pair.get((pair_user_id, pair_category_id))
+            if series is None or len(series) <= min_train_months:
+                entry['error'] = 'Not enough months for backtest'
+                categories.append(entry)
+                continue
+            
+            features = build_feature_matrix(series.amounts, series.months)
+            cutoffs = np.arange(min_train_months, len(series))
+            actual = series.amounts[cutoffs]
+            
+            predictions = {name: self._backtest_predictions(self.models[name], features, series.amounts, cutoffs, refit_every)
+                           for name in model_names}
+            metrics = {name: regression_metrics(actual, predictions[name]) for name in model_names}
+            best_model = min(model_names, key=lambda name: metrics[name]['rmse'])
+            
+            for name in model_names:
+                pooled[name][0].append(actual)
+                pooled[name][1].append(predictions[name])
+            pooled['best'][0].append(actual)
+            pooled['best'][1].append(predictions[best_model])
+            
+            entry.update({
+                'months': len(series),
+                'cutoffs': len(cutoffs),
+                'first_cutoff': str(series.months[cutoffs[0]]),
+                'models': metrics,
+                'best_model': best_model,
+                'performance': metrics[best_model]
+            })
+            categories.append(entry)
+        
+        overall = {'pairs': sum(1 for entry in categories if 'error' not in entry), 'predictions': 0}
+        if pooled['best'][0]:
+            overall['predictions'] = int(sum(len(actual) for actual in pooled['best'][0]))
+            overall['models'] = {name: regression_metrics(np.concatenate(pooled[name][0]), np.concatenate(pooled[name][1]))
+                                 for name in model_names}
+            overall['performance'] = regression_metrics(np.concatenate(pooled['best'][0]), np.concatenate(pooled['best'][1]))
+        
+        return {'categories': categories, 'overall': overall}
+    
+    def train_pooled(self, scope=None, pairs=None, user_id=None, min_expenses=6, model_names=None,
+                     backtest_months=3, min_train_months=3):
+        """
+        Train pooled models, one per category (scope 'category') or one for all pairs ('global'),
+        on the normalized monthly series of every selected pair (see pooled_training_rows).
+        
+        Candidates are fitted once on the rows before the last backtest_months calendar months and
+        scored on those months; the lowest RMSE is refitted on all rows and saved. Each pair with at
+        least min_train_months of history before those months is backtested on the same months with
+        its own models, also fitted once: if one beats the pooled model's RMSE the pair keeps (or
+        gets) a model of its own, otherwise its saved model is removed so forecasts use the pooled
+        one. Other pairs are left as they are.
+        """
+        started_at = time.perf_counter()
+        scope = scope or self.pooled or 'category'
+        series_by_pair = self.get_monthly_series_batch(pairs=pairs, user_id=user_id, min_expenses=min_expenses)
+        if series_by_pair is None:
+            return {'error': 'Failed to load expense data'}
+        
+        model_names = list(model_names or self.models.keys())
+        unknown = [name for name in model_names if name not in self.models]
+        if unknown:
+            return {'error': f"Unknown model(s): {', '.join(unknown)}"}
+        
+        groups = {}
+        for (pair_user_id, pair_category_id), series in series_by_pair.items():
+            groups.setdefault(self._pooled_key(pair_category_id, scope), []).append(
+                ((int(pair_user_id), int(pair_category_id)), series))
+        
+        models = [self._train_pooled_group(scope, key, members, model_names, backtest_months, min_train_months)
+                  for key, members in sorted(groups.items())]
+        totals = {name: sum(entry['pairs'][name] for entry in models)
+                  for name in ('pooled', 'per_pair', 'not_compared', 'per_pair_trained', 'per_pair_removed')}
+        return {'scope': scope, 'models': models, 'pairs': totals,
+                'elapsed_ms': round((time.perf_counter() - started_at) * 1000, 3)}
+    
+    def _train_pooled_group(self, scope, key, members, model_names, backtest_months, min_train_months):
+        """Backtest, fit and save one pooled model on members [((user_id, category_id), series)], then settle its pairs"""
+        rows = [pooled_training_rows(series.amounts, series.months) for _, series in members]
+        # Rows in month order, so the backtest trains on a prefix and predicts the block after it
+        months = np.concatenate([series.months for _, series in members])
+        order = np.argsort(months, kind='stable')
+        months = months[order]
+        features = np.vstack([pair_rows[0] for pair_rows in rows])[order]
+        targets = np.concatenate([pair_rows[1] for pair_rows in rows])[order]
+        scales = np.concatenate([pair_rows[2] for pair_rows in rows])[order]
+        amounts = np.concatenate([series.amounts for _, series in members])[order]
+        member_ids = np.repeat(np.arange(len(members)), [len(series) for _, series in members])[order]
+        positions = np.concatenate([np.arange(len(series)) for _, series in members])[order]
+        
+        test_months = [month for month in np.unique(months)[-backtest_months:]
+                       if np.count_nonzero(months < month) >= 3]
+        test_start = int(np.searchsorted(months, test_months[0])) if test_months else len(months)
+        predictions = {}
+        if test_months:
+            scaler = StandardScaler(dtype=self.dtype).fit(features[:test_start])
+            train, test = scaler.transform(features[:test_start]), scaler.transform(features[test_start:])
+            for name in model_names:
+                normalized = fit_predict(self.models[name], train, targets[:test_start], test, cache=self.fold_cache)
+                # Served forecasts are clipped at zero, so score the same values
+                predictions[name] = np.maximum(normalized * scales[test_start:], 0.0)
+        
+        actual = amounts[test_start:]
+        if test_months:
+            candidates = {name: regression_metrics(actual, predictions[name]) for name in model_names}
+            best_model = min(model_names, key=lambda name: candidates[name]['rmse'])
+            performance = candidates[best_model]
+        else:
+            # Too little history to backtest: the cheapest candidate, without metrics
+            candidates = {}
+            best_model = self.FLOOR_MODEL if self.FLOOR_MODEL in model_names else model_names[0]
+            performance = {'mae': 0, 'mape': 0, 'rmse': 0, 'r2_score': 0}
+        
+        scaler = StandardScaler(dtype=self.dtype).fit(features)
+        model = clone_model(self.models[best_model]).fit(scaler.transform(features, copy=False), targets)
+        model_path = self.model_store.put(*key, {
+            'model': model,
+            'scaler': scaler,
+            'model_name': best_model,
+            'feature_names': self.get_feature_names(),
+            'trained_at': datetime.now().isoformat(),
+            'data_points': len(features),
+            'performance': performance,
+            'pooled': scope,
+            'series': len(members)
+        })
+        
+        counts = {'pooled': 0, 'per_pair': 0, 'not_compared': 0, 'per_pair_trained': 0, 'per_pair_removed': 0}
+        test_members, test_positions = member_ids[test_start:], positions[test_start:]
+        for i, ((pair_user_id, pair_category_id), series) in enumerate(members):
+            in_test = (test_members == i) & (test_positions >= min_train_months)
+            if not np.any(in_test):
+                counts['not_compared'] += 1
+                continue
+            
+            cutoffs = test_positions[in_test]
+            pooled_rmse = regression_metrics(actual[in_test], predictions[best_model][in_test])['rmse']
+            pair_features = build_feature_matrix(series.amounts, series.months)
+            pair_rmse = min(regression_metrics(series.amounts[cutoffs], self._backtest_predictions(
+                self.models[name], pair_features, series.amounts, cutoffs, refit_every=len(cutoffs)))['rmse']
+                for name in model_names)
+            
+            if pair_rmse < pooled_rmse:
+                counts['per_pair'] += 1
+                if not self.model_store.is_fresh(pair_user_id, pair_category_id):
+                    pair_features, pair_targets = self.prepare_features(series)
+                    pair_model, pair_model_name = self.train_models(pair_features, pair_targets)
+                    if pair_model is not None:
+                        self.save_model(pair_model, pair_model_name, pair_user_id, pair_category_id, pair_features,
+                                        pair_targets, self.calculate_performance_metrics(pair_targets, self.oof_predictions),
+                                        last_month=str(series.months[-1]))
+                        counts['per_pair_trained'] += 1
+            else:
+                counts['pooled'] += 1
+                if self.model_store.info(pair_user_id, pair_category_id) is not None:
+                    self.model_store.delete(pair_user_id, pair_category_id)
+                    counts['per_pair_removed'] += 1
+        
+        logger.debug("Pooled %s model %s: %s on %d rows, %s", scope, key, best_model, len(features), counts)
+        return {
+            'category_id': key[1] if scope == 'category' else None,
+            'series': len(members),
+            'rows': len(features),
+            'model_type': best_model,
+            'backtest_months': [str(month) for month in test_months],
+            'candidates': candidates,
+            'performance': performance,
+            'model_path': model_path,
+            'pairs': counts
+        }
+    
+    def _backtest_predictions(self, template, features, amounts, cutoffs, refit_every=1):
+        """One-step-ahead predictions of amounts[cutoffs], each from a model trained on earlier months only"""
+        predictions = np.empty(len(cutoffs))
+        
+        if isinstance(template, LinearRegression):
+            # Walk forward adding one month at a time to the scaler moments and X^T X / X^T y
+            first = cutoffs[0]
+            scaler = StandardScaler(dtype=self.dtype).fit(features[:first])
+            model = LinearRegression().fit(scaler.transform(features[:first]), amounts[:first])
+            for i, cutoff in enumerate(cutoffs):
+                if cutoff > first:
+                    new_row = features[cutoff - 1:cutoff]
+                    old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+                    scaler.partial_fit(new_row)
+                    model.rescale_inputs(old_mean, old_scale, scaler.mean_, scaler.scale_)
+                    model.partial_fit(scaler.transform(new_row).reshape(1, -1), amounts[cutoff - 1:cutoff])
+                predictions[i] = model.predict(scaler.transform(features[cutoff:cutoff + 1]).reshape(1, -1))[0]
+        else:
+            # Refit every refit_every cutoffs; each fit predicts the block of months that follows it
+            for start in range(0, len(cutoffs), max(1, refit_every)):
+                block = cutoffs[start:start + max(1, refit_every)]
+                train_end = block[0]
+                scaler = StandardScaler(dtype=self.dtype).fit(features[:train_end])
+                predictions[start:start + len(block)] = fit_predict(
+                    template, scaler.transform(features[:train_end]), amounts[:train_end],
+                    scaler.transform(features[block], copy=False).reshape(len(block), -1), cache=self.fold_cache
+                )
+        
+        # Served forecasts are clipped at zero, so score the same values
+        return np.maximum(predictions, 0.0)
+
+
+# ============================================================================
+# RESIDENT SERVER MODE
+# ============================================================================
+
+class ForecastServer:
+    """
+    Line-delimited JSON-RPC front end for a long-lived ExpenseForecaster.
+    
+    Each request is one JSON object per line:
+        {"id": 1, "method": "forecast", "params": {"user_id": 1, "category_id": 2, "target_month": 7, "target_year": 2025}}
+    and each response is one JSON object per line carrying the same id and either 'result' or 'error'.
+    Imports, the database connection and recently used models stay warm between requests.
+    With metrics_file set, each request appends a line with its method, duration, spans and counters
+    (spans of requests served at the same time overlap).
+    
+    make_forecaster builds an ExpenseForecaster; each serving thread gets its own, so a socket server
+    answers up to `workers` requests at once without sharing connections or per-request state.
+    """
+    def __init__(self, make_forecaster, metrics_file=None, workers=1):
+        self.make_forecaster = make_forecaster
+        self.metrics_file = metrics_file
+        self.workers = max(1, workers)
+        self.requests_served = 0
+        self.running = True
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Request queue of the socket server's workers, and pairs with a full training queued on it
+        self._jobs = None
+        self._queued_training = set()
+        self.methods = {
+            'forecast': self.rpc_forecast,
+            'performance': self.rpc_performance,
+            'batch': self.rpc_batch,
+            'backtest': self.rpc_backtest,
+            'update': self.rpc_update,
+            'models': self.rpc_models,
+            'metrics': self.rpc_metrics,
+            'ping': self.rpc_ping,
+            'shutdown': self.rpc_shutdown,
+        }
+    
+    @property
+    def forecaster(self):
+        """The ExpenseForecaster of the calling thread"""
+        return self._local.forecaster
+    
+    def rpc_forecast(self, params):
+        # A request may set its own model-selection budget ('time_budget_ms', null for none)
+        result = self.forecaster.forecast(
+            int(params['user_id']), int(params['category_id']),
+            force_retrain=bool(params.get('force_retrain', False)),
+            target_month=params.get('target_month'), target_year=params.get('target_year'),
+            horizon=max(1, int(params.get('horizon', 1))),
+            time_budget_ms=params.get('time_budget_ms', self.forecaster.time_budget_ms)
+        )
+        if (result.get('model_selection') or {}).get('timed_out'):
+            # The budget cut selection short, so nothing was saved; train the full model in the background
+            self._queue_full_training(int(params['user_id']), int(params['category_id']),
+                                      params.get('target_month'), params.get('target_year'))
+        return result
+    
+    def _queue_full_training(self, user_id, category_id, target_month, target_year):
+        """Queue an unbudgeted retrain of a pair on the worker pool (socket mode), once per pair at a time"""
+        from concurrent.futures import Future
+        
+        if self._jobs is None:
+            return
+        key = (user_id, category_id)
+        with self._lock:
+            if key in self._queued_training:
+                return
+            self._queued_training.add(key)
+        
+        future = Future()
+        future.add_done_callback(lambda _: self._queued_training.discard(key))
+        self._jobs.put((json.dumps({'id': None, 'method': 'forecast', 'params': {
+            'user_id': user_id, 'category_id': category_id, 'target_month': target_month,
+            'target_year': target_year, 'force_retrain': True, 'time_budget_ms': None
+        }}), future))
+    
+    def rpc_performance(self, params):
+        return self.forecaster.evaluate_performance(
+            int(params['user_id']), int(params['category_id']),
+            aggregate_monthly=bool(params.get('aggregate_monthly', False))
+        )
+    
+    def rpc_batch(self, params):
+        pairs = params.get('pairs')
+        try:
+            return list(self.forecaster.forecast_batch(
+                pairs=[tuple(pair) for pair in pairs] if pairs else None,
+                user_id=params.get('user_id'),
+                min_expenses=int(params.get('min_expenses', 6)),
+                force_retrain=bool(params.get('force_retrain', False)),
+                target_month=params.get('target_month'), target_year=params.get('target_year'),
+                horizon=max(1, int(params.get('horizon', 1)))
+            ))
+        finally:
+            # Batch data is a snapshot; later single requests must read the database again
+            self.forecaster.preloaded_series = {}
+    
+    def rpc_backtest(self, params):
+        pairs = params.get('pairs')
+        return self.forecaster.backtest(
+            pairs=[tuple(pair) for pair in pairs] if pairs else None,
+            user_id=params.get('user_id'),
+            min_expenses=int(params.get('min_expenses', 6)),
+            min_train_months=int(params.get('min_train_months', 6)),
+            model_names=params.get('models'),
+            refit_every=int(params.get('refit_every', 1))
+        )
+    
+    def rpc_update(self, params):
+        return self.forecaster.update_model(int(params['user_id']), int(params['category_id']))
+    
+    def rpc_models(self, params):
+        """Saved-model status for the requested pairs, read from the index without loading models"""
+        return self.forecaster.model_store.status([tuple(pair) for pair in params.get('pairs', [])])
+    
+    def rpc_ping(self, params):
+        return {
+            'status': 'ok',
+            'workers': self.workers,
+            'cached_models': self.forecaster.model_store.cached_models,
+            'cached_model_bytes': self.forecaster.model_store.cached_bytes,
+            'cached_folds': len(self.forecaster.fold_cache),
+            'fold_cache_hits': self.forecaster.fold_cache.hits,
+            'result_cache_hits': self.forecaster.result_cache.hits if self.forecaster.result_cache else 0,
+            'connections_opened': self.forecaster.connections.opened,
+            'connections_reused': self.forecaster.connections.reused
+        }
+    
+    def rpc_metrics(self, params):
+        """Spans and counters aggregated over all requests served so far"""
+        return {'requests': self.requests_served, **PROFILER.report()}
+    
+    def rpc_shutdown(self, params):
+        self.running = False
+        return {'status': 'shutting down'}
+    
+    def handle_line(self, line):
+        """Process one request line and return the response line (or None for blank input)"""
+        line = line.strip()
+        if not line:
+            return None
+        
+        request_id = None
+        method_name = None
+        before = PROFILER.snapshot()
+        started_at = time.perf_counter()
+        try:
+            request = json.loads(line)
+            method_name = request.get('method')
+            request_id = request.get('id')
+            method = self.methods.get(request.get('method'))
+            if method is None:
+                response = {'id': request_id, 'error': f"Unknown method: {request.get('method')}"}
+            else:
+                response = {'id': request_id, 'result': method(request.get('params') or {})}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'id': request_id, 'error': f'Invalid request: {str(e)}'}
+        except Exception as e:
+            response = {'id': request_id, 'error': f'Server error: {str(e)}'}
+        
+        with self._lock:
+            self.requests_served += 1
+            if self.metrics_file:
+                append_metrics(self.metrics_file, {
+                    'timestamp': datetime.now().isoformat(timespec='seconds'),
+                    'method': method_name,
+                    'ms': round((time.perf_counter() - started_at) * 1000, 3),
+                    **PROFILER.since(before).report()
+                })
+        return json.dumps(response)
+    
+    def serve_stdio(self):
+        """Serve requests from stdin, writing responses to stdout, one at a time"""
+        self._local.forecaster = self.make_forecaster()
+        try:
+            for line in sys.stdin:
+                response = self.handle_line(line)
+                if response is not None:
+                    sys.stdout.write(response + '\n')
+                    sys.stdout.flush()
+                if not self.running:
+                    break
+        finally:
+            self.forecaster.close()
+    
+    def _serve_jobs(self, jobs):
+        """Worker thread: answer queued (line, future) jobs with this thread's own forecaster"""
+        self._local.forecaster = self.make_forecaster()
+        try:
+            while True:
+                job = jobs.get()
+                if job is None:
+                    break
+                line, future = job
+                try:
+                    future.set_result(self.handle_line(line))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            self.forecaster.close()
+    
+    def serve_unix_socket(self, socket_path):
+        """
+        Serve requests over a Unix domain socket.
+        
+        Each connection is read on its own thread and its requests are answered by a pool of
+        `workers` threads, so one slow request (a fresh training, a backtest) does not hold up the others.
+        """
+        import queue
+        import socketserver
+        from concurrent.futures import Future
+        
+        server = self
+        jobs = self._jobs = queue.Queue()
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw_line in self.rfile:
+                    future = Future()
+                    jobs.put((raw_line.decode('utf-8'), future))
+                    response = future.result()
+                    if response is not None:
+                        self.wfile.write((response + '\n').encode('utf-8'))
+                        self.wfile.flush()
+                    if not server.running:
+                        break
+        
+        class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+            # handle_request() returns at least this often, so a shutdown request is noticed
+            timeout = 0.5
+        
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        
+        threads = [threading.Thread(target=self._serve_jobs, args=(jobs,), daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            with ThreadingUnixServer(socket_path, Handler) as unix_server:
+                logger.info("Forecast server listening on %s with %d workers", socket_path, self.workers)
+                try:
+                    while self.running:
+                        unix_server.handle_request()
+                finally:
+                    if os.path.exists(socket_path):
+                        os.unlink(socket_path)
+        finally:
+            for _ in threads:
+                jobs.put(None)
+            for thread in threads:
+                thread.join()
+
+
+def parse_pairs(value):
+    """Parse a 'user:category,user:category' list into (user_id, category_id) tuples"""
+    pairs = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        user_part, _, category_part = item.partition(':')
+        pairs.append((int(user_part), int(category_part)))
+    return pairs
+
+def _timing_report(main_started_at):
+    finished_at = time.perf_counter()
+    return {
+        'module_load_ms': round((main_started_at - _MODULE_STARTED_AT) * 1000, 2),
+        'run_ms': round((finished_at - main_started_at) * 1000, 2),
+        'total_ms': round((finished_at - _MODULE_STARTED_AT) * 1000, 2),
+        'imports_ms': {name: round(ms, 2) for name, ms in IMPORT_TIMINGS.items()}
+    }
+
+
+def _print_timing_report(main_started_at):
+    """Write a one-line JSON timing report to stderr (stdout carries the forecast JSON)"""
+    print(f"TIMING: {json.dumps(_timing_report(main_started_at))}", file=sys.stderr)
+
+
+def _write_profile_report(main_started_at, mode, print_report, metrics_file):
+    """Run-level spans and counters plus timing, as a PROFILE: line on stderr and/or a metrics file line"""
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'mode': mode,
+        **_timing_report(main_started_at),
+        **PROFILER.report()
+    }
+    if print_report:
+        print(f"PROFILE: {json.dumps(report)}", file=sys.stderr)
+    if metrics_file:
+        append_metrics(metrics_file, report)
+
 
 def main():
     parser = argparse.ArgumentParser(description='Expense Forecasting ML Script')
-    parser.add_argument('--user-id', required=True, type=int, help='User ID')
-    parser.add_argument('--category-id', required=True, type=int, help='Category ID')
+    parser.add_argument('--user-id', type=int, help='User ID (in batch mode: restrict to this user)')
+    parser.add_argument('--category-id', type=int, help='Category ID')
     parser.add_argument('--db-path', help='SQLite database path')
     parser.add_argument('--db-type', choices=['sqlite', 'mysql'], default='sqlite', help='Database type')
     parser.add_argument('--db-host', help='MySQL host')
@@ -1101,13 +3946,91 @@ def main():
     parser.add_argument('--db-password', help='MySQL password')
     parser.add_argument('--target-month', type=int, help='Target month (1-12) for prediction')
     parser.add_argument('--target-year', type=int, help='Target year for prediction')
+    parser.add_argument('--horizon', type=int, default=1, help='Number of consecutive months to forecast, starting at the target month')
     parser.add_argument('--performance-only', action='store_true', help='Only return performance metrics')
     parser.add_argument('--aggregate-monthly', action='store_true', help='Aggregate to monthly totals (performance only)')
     parser.add_argument('--force-retrain', action='store_true', help='Force retraining even if saved model exists')
+    parser.add_argument('--update-model', action='store_true', help='Fold new months into the saved linear model instead of retraining')
     parser.add_argument('--model-storage-path', help='Path to store ML models')
+    parser.add_argument('--batch', action='store_true', help='Forecast many user/category pairs, one JSON line per pair')
+    parser.add_argument('--pairs', help='Batch mode: comma-separated user:category pairs (default: all eligible pairs)')
+    parser.add_argument('--min-expenses', type=int, default=6, help='Batch mode: minimum expense rows for a pair to be eligible')
+    parser.add_argument('--backtest', action='store_true', help='Rolling-origin backtest of all selected pairs (--pairs, --user-id or all eligible pairs)')
+    parser.add_argument('--min-train-months', type=int, default=6, help='Backtest: months of history before the first cutoff')
+    parser.add_argument('--refit-every', type=int, default=1, help='Backtest: refit non-linear models every N cutoffs')
+    parser.add_argument('--backtest-models', help='Backtest: comma-separated model names (default: all)')
+    parser.add_argument('--train-pooled', action='store_true',
+                        help='Train pooled cross-user models (scope from --pooled, default category) and keep per-pair '
+                             'models only where they beat them on backtest')
+    parser.add_argument('--pooled', choices=['category', 'global'],
+                        help='Forecast pairs without a model of their own from the pooled model of this scope')
+    parser.add_argument('--refresh-monthly-totals', action='store_true',
+                        help='Fold expenses changed since the last run into the monthly_category_totals table')
+    parser.add_argument('--migrate-models', action='store_true',
+                        help='Convert pickled models in --model-storage-path to the model file format')
+    parser.add_argument('--model-dtype', choices=['float64', 'float32'], default='float64',
+                        help='Precision of floating-point arrays in saved model files')
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64',
+                        help='Precision of the scaled feature matrices models are trained on (float32 halves their memory)')
+    parser.add_argument('--serve', action='store_true', help='Run as a resident JSON-RPC server (stdin/stdout unless --socket)')
+    parser.add_argument('--socket', help='Server mode: listen on this Unix socket path')
+    parser.add_argument('--workers', type=int, default=4, help='Socket server mode: requests answered at the same time')
+    parser.add_argument('--model-cache-size', type=int, default=64, help='Server mode: number of loaded models kept in memory')
+    parser.add_argument('--model-cache-mb', type=float, default=256, help='Server mode: approximate memory cap for loaded models (MB)')
+    parser.add_argument('--result-cache-mb', type=float, default=16,
+                        help='Size cap for cached forecast results in the model storage path (MB, 0 disables)')
+    parser.add_argument('--fetch-chunk-size', type=int, default=5000, help='Rows fetched per round trip when streaming query results')
+    parser.add_argument('--pool-size', type=int, default=2, help='Server mode: idle database connections kept open')
+    parser.add_argument('--n-jobs', type=int, default=1, help='Worker processes for random forest training (-1 = all cores)')
+    parser.add_argument('--time-budget-ms', type=float,
+                        help='Approximate wall-clock budget for model selection: candidates run in parallel and '
+                             'the best one finished in time wins (the linear model always finishes)')
+    parser.add_argument('--timing', action='store_true', help='Report module load, import and run time (ms) on stderr at exit')
+    parser.add_argument('--profile', action='store_true', help='Report per-stage spans and counters as JSON on stderr at exit')
+    parser.add_argument('--metrics-file', help='Append the profile report as a JSON line to this file (server mode: one line per request)')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='WARNING',
+                        help='Diagnostics written to stderr')
     
     args = parser.parse_args()
     
+    if args.horizon < 1:
+        parser.error('--horizon must be at least 1')
+    if args.fetch_chunk_size < 1:
+        parser.error('--fetch-chunk-size must be at least 1')
+    if args.time_budget_ms is not None and args.time_budget_ms <= 0:
+        parser.error('--time-budget-ms must be positive')
+    
+    logging.basicConfig(stream=sys.stderr, level=getattr(logging, args.log_level), format='%(levelname)s: %(message)s')
+    
+    main_started_at = time.perf_counter()
+    if args.timing or args.profile or args.metrics_file:
+        import atexit
+        if args.timing:
+            atexit.register(_print_timing_report, main_started_at)
+        if args.profile or (args.metrics_file and not args.serve):
+            mode = next((name for name in ('serve', 'migrate_models', 'refresh_monthly_totals', 'train_pooled', 'backtest',
+                                           'batch', 'update_model', 'performance_only')
+                         if getattr(args, name)), 'forecast')
+            atexit.register(_write_profile_report, main_started_at, mode, args.profile,
+                            None if args.serve else args.metrics_file)
+    
+    if args.migrate_models:
+        # Only touches model storage, so no database is needed
+        started_at = time.perf_counter()
+        store = ModelStore(args.model_storage_path or 'storage/app/ml_models', float_dtype=args.model_dtype)
+        try:
+            stats = store.migrate()
+        finally:
+            store.close()
+        stats['elapsed_ms'] = round((time.perf_counter() - started_at) * 1000, 3)
+        print(json.dumps(stats))
+        return
+    
+    if (not (args.batch or args.serve or args.backtest or args.refresh_monthly_totals or args.train_pooled)
+            and (args.user_id is None or args.category_id is None)):
+        parser.error('--user-id and --category-id are required unless --batch, --backtest, --refresh-monthly-totals, '
+                     '--train-pooled, --migrate-models or --serve is given')
+    
     # Initialize forecaster based on database type
     if args.db_type == 'mysql':
         if not all([args.db_host, args.db_name, args.db_user]):
@@ -1121,69 +4044,81 @@ def main():
             'username': args.db_user,
             'password': args.db_password or ''
         }
-        forecaster = ExpenseForecaster(db_config=db_config, model_storage_path=args.model_storage_path)
+        db_kwargs = {'db_config': db_config}
     else:
         if not args.db_path:
             print(json.dumps({'error': 'SQLite requires database path'}))
             return
-        forecaster = ExpenseForecaster(db_path=args.db_path, model_storage_path=args.model_storage_path)
-    
-    if args.performance_only:
-        # Get performance metrics only
-        df = forecaster.get_user_data(args.user_id, args.category_id)
-        if df is not None:
-            # Optional monthly aggregation for evaluation only
-            if args.aggregate_monthly:
-                df['date'] = pd.to_datetime(df['date'])
-                df['month_key'] = df['date'].dt.to_period('M')
-                df = df.groupby('month_key', as_index=False)['amount'].sum()
-                # rebuild a date column as month start for feature prep
-                df['date'] = df['month_key'].dt.to_timestamp()
-                df = df[['date', 'amount']].sort_values('date')
-            
-            features, targets = forecaster.prepare_features(df)
-            if features is not None:
-                best_model, _ = forecaster.train_models(features, targets)
-                performance = forecaster.calculate_performance_metrics(best_model, features, targets)
-                print(json.dumps(performance))
-            else:
-                # Fallback: simple lag-1 feature evaluation on aggregated (or raw) series
-                try:
-                    series = df[['date','amount']].sort_values('date').copy()
-                    series['lag1'] = series['amount'].shift(1)
-                    series = series.dropna()
-                    if len(series) < 3:
-                        print(json.dumps({'mae': 0, 'mape': 0, 'rmse': 0, 'r2_score': 0}))
-                    else:
-                        X = series[['lag1']].values
-                        y = series['amount'].values
-                        # time-aware split
-                        split_idx = int(len(X) * 0.8)
-                        if split_idx < 2:
-                            split_idx = 2
-                        X_train, X_test = X[:split_idx], X[split_idx:]
-                        y_train, y_test = y[:split_idx], y[split_idx:]
-                        # Use our custom implementations
-                        scaler = StandardScaler()
-                        X_train_scaled = scaler.fit_transform(X_train)
-                        X_test_scaled = scaler.transform(X_test)
-                        model = LinearRegression()
-                        model.fit(X_train_scaled, y_train)
-                        preds = model.predict(X_test_scaled)
-                        mae = mean_absolute_error(y_test, preds)
-                        rmse = np.sqrt(mean_squared_error(y_test, preds))
-                        r2 = r2_score(y_test, preds) if len(y_test) > 1 else 0.0
-                        mape = float(np.mean(np.abs((y_test - preds) / np.maximum(y_test, 1))) * 100)
-                        print(json.dumps({'mae': float(mae), 'mape': float(mape), 'rmse': float(rmse), 'r2_score': float(r2)}))
-                except Exception:
-                    print(json.dumps({'mae': 0, 'mape': 0, 'rmse': 0, 'r2_score': 0}))
+        db_kwargs = {'db_path': args.db_path}
+    
+    if args.serve:
+        # Every worker has its own forecaster; the model cache limits are shared out between them
+        workers = max(1, args.workers) if args.socket else 1
+        make_forecaster = functools.partial(
+            ExpenseForecaster, model_storage_path=args.model_storage_path, pool_size=args.pool_size,
+            model_cache_size=-(-args.model_cache_size // workers),
+            model_cache_bytes=int(args.model_cache_mb * 1024 * 1024 / workers),
+            n_jobs=args.n_jobs, result_cache_bytes=int(args.result_cache_mb * 1024 * 1024),
+            time_budget_ms=args.time_budget_ms, fetch_chunk_size=args.fetch_chunk_size,
+            model_dtype=args.model_dtype, dtype=args.dtype, pooled=args.pooled, **db_kwargs)
+        server = ForecastServer(make_forecaster, metrics_file=args.metrics_file, workers=workers)
+        if args.socket:
+            server.serve_unix_socket(args.socket)
         else:
-            print(json.dumps({'error': 'No data available'}))
-    else:
-        # Get full forecast (no aggregation to keep forecast value unchanged)
-        result = forecaster.forecast(args.user_id, args.category_id, force_retrain=args.force_retrain, 
-                                   target_month=args.target_month, target_year=args.target_year)
-        print(json.dumps(result))
+            server.serve_stdio()
+        return
+    
+    forecaster = ExpenseForecaster(model_storage_path=args.model_storage_path, n_jobs=args.n_jobs,
+                                   result_cache_bytes=int(args.result_cache_mb * 1024 * 1024),
+                                   time_budget_ms=args.time_budget_ms, fetch_chunk_size=args.fetch_chunk_size,
+                                   model_dtype=args.model_dtype, dtype=args.dtype, pooled=args.pooled, **db_kwargs)
+    
+    try:
+        if args.refresh_monthly_totals:
+            print(json.dumps(forecaster.refresh_monthly_totals()))
+        elif args.train_pooled:
+            try:
+                pairs = parse_pairs(args.pairs) if args.pairs else None
+            except ValueError:
+                print(json.dumps({'error': 'Invalid --pairs value, expected user:category[,user:category...]'}))
+                return
+            print(json.dumps(forecaster.train_pooled(scope=args.pooled, pairs=pairs, user_id=args.user_id,
+                                                     min_expenses=args.min_expenses)))
+        elif args.backtest:
+            try:
+                pairs = parse_pairs(args.pairs) if args.pairs else None
+            except ValueError:
+                print(json.dumps({'error': 'Invalid --pairs value, expected user:category[,user:category...]'}))
+                return
+            model_names = [name.strip() for name in args.backtest_models.split(',')] if args.backtest_models else None
+            print(json.dumps(forecaster.backtest(pairs=pairs, user_id=args.user_id, min_expenses=args.min_expenses,
+                                                 min_train_months=args.min_train_months, model_names=model_names,
+                                                 refit_every=args.refit_every)))
+        elif args.batch:
+            try:
+                pairs = parse_pairs(args.pairs) if args.pairs else None
+            except ValueError:
+                print(json.dumps({'error': 'Invalid --pairs value, expected user:category[,user:category...]'}))
+                return
+            
+            # Stream one JSON object per line so callers can consume results as they arrive
+            for result in forecaster.forecast_batch(pairs=pairs, user_id=args.user_id, min_expenses=args.min_expenses,
+                                                    force_retrain=args.force_retrain,
+                                                    target_month=args.target_month, target_year=args.target_year,
+                                                    horizon=args.horizon):
+                print(json.dumps(result), flush=True)
+        elif args.update_model:
+            print(json.dumps(forecaster.update_model(args.user_id, args.category_id)))
+        elif args.performance_only:
+            print(json.dumps(forecaster.evaluate_performance(args.user_id, args.category_id, aggregate_monthly=args.aggregate_monthly)))
+        else:
+            # Get full forecast (no aggregation to keep forecast value unchanged)
+            result = forecaster.forecast(args.user_id, args.category_id, force_retrain=args.force_retrain, 
+                                       target_month=args.target_month, target_year=args.target_year,
+                                       horizon=args.horizon)
+            print(json.dumps(result))
+    finally:
+        forecaster.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Parity tests for the NumPy feature builder against the original pandas implementation."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import FEATURE_NAMES, ExpenseForecaster, MonthlySeries, build_feature_matrix  # noqa: E402
+
+
+def pandas_features(months, amounts):
+    """Reference: the rolling/apply feature pipeline prepare_features used before the NumPy rewrite"""
+    df = pd.DataFrame({'date': pd.to_datetime(months), 'amount': amounts, 'budget_percentage': 0.0})
+    df['month'] = df['date'].dt.month
+    df['day_of_week'] = df['date'].dt.dayofweek
+    first_amount = df['amount'].iloc[0]
+    df['previous_month'] = df['amount'].shift(1).fillna(first_amount)
+    df['previous_2months'] = df['amount'].shift(2).fillna(first_amount)
+    df['previous_3months'] = df['amount'].shift(3).fillna(first_amount)
+    past_amount = df['amount'].shift(1).fillna(first_amount)
+    df['rolling_3m'] = past_amount.rolling(3, min_periods=1).mean()
+    df['rolling_6m'] = past_amount.rolling(6, min_periods=1).mean()
+    if len(df) >= 12:
+        df['rolling_12m'] = past_amount.rolling(12, min_periods=1).mean()
+    else:
+        df['rolling_12m'] = df['rolling_6m']
+    df['rolling_std_3m'] = past_amount.rolling(3, min_periods=1).std().fillna(0.0)
+    df['rolling_std_6m'] = past_amount.rolling(6, min_periods=1).std().fillna(0.0)
+
+    def slope_last_n(values):
+        if len(values) < 2:
+            return 0.0
+        m, _ = np.polyfit(np.arange(len(values)), values, 1)
+        return m
+    df['trend_3m'] = past_amount.rolling(3, min_periods=1).apply(slope_last_n, raw=True).fillna(0.0)
+    df['is_holiday_season'] = df['month'].isin([11, 12, 1])
+    df['is_summer'] = df['month'].isin([6, 7, 8])
+    return df[FEATURE_NAMES].astype(float).values
+
+
+EXACT = ['month', 'day_of_week', 'previous_month', 'previous_2months', 'previous_3months',
+         'is_holiday_season', 'is_summer', 'budget_percentage']
+# Rolling sums in pandas and polyfit's least squares round differently from the closed forms
+APPROX = ['rolling_3m', 'rolling_6m', 'rolling_12m', 'rolling_std_3m', 'rolling_std_6m', 'trend_3m']
+
+
+def random_series(rng, n_months):
+    start = np.datetime64('2021-01') + rng.integers(0, 36)
+    months = start + np.arange(n_months)
+    amounts = np.round(rng.gamma(2.0, 4000.0, n_months), 2)
+    return months, amounts
+
+
+@pytest.mark.parametrize('n_months', [3, 5, 8, 11, 12, 14, 30])
+def test_matches_pandas_features(n_months):
+    rng = np.random.default_rng(n_months)
+    for _ in range(20):
+        months, amounts = random_series(rng, n_months)
+        expected = pandas_features(months, amounts)
+        actual = build_feature_matrix(amounts, months)
+
+        assert actual.shape == expected.shape
+        for name in EXACT:
+            column = FEATURE_NAMES.index(name)
+            np.testing.assert_array_equal(actual[:, column], expected[:, column], err_msg=name)
+        for name in APPROX:
+            column = FEATURE_NAMES.index(name)
+            np.testing.assert_allclose(actual[:, column], expected[:, column], rtol=1e-9, atol=1e-6, err_msg=name)
+
+
+def test_constant_series_has_exact_means_and_zero_std():
+    months = np.datetime64('2024-01') + np.arange(12)
+    amounts = np.full(12, 1234.56)
+    features = build_feature_matrix(amounts, months)
+
+    for name in ['rolling_3m', 'rolling_6m', 'rolling_12m']:
+        np.testing.assert_array_equal(features[:, FEATURE_NAMES.index(name)], amounts)
+    for name in ['rolling_std_3m', 'rolling_std_6m', 'trend_3m']:
+        np.testing.assert_array_equal(features[:, FEATURE_NAMES.index(name)], 0.0)
+
+
+def test_matrix_input_matches_per_series_rows():
+    rng = np.random.default_rng(7)
+    months = np.datetime64('2023-04') + np.arange(15)
+    amounts = np.round(rng.gamma(2.0, 4000.0, (6, 15)), 2)
+
+    batched = build_feature_matrix(amounts, months)
+
+    assert batched.shape == (6, 15, len(FEATURE_NAMES))
+    for row in range(len(amounts)):
+        np.testing.assert_array_equal(batched[row], build_feature_matrix(amounts[row], months))
+
+
+def test_prepare_features_uses_builder(tmp_path):
+    months = np.datetime64('2024-01') + np.arange(8)
+    amounts = np.arange(1.0, 9.0) * 100
+    series = MonthlySeries(months, amounts)
+
+    forecaster = ExpenseForecaster(db_path=':memory:', model_storage_path=str(tmp_path))
+    features, targets = forecaster.prepare_features(series)
+
+    np.testing.assert_array_equal(features, build_feature_matrix(amounts, months))
+    np.testing.assert_array_equal(targets, amounts)
+    assert forecaster.prepare_features(MonthlySeries(months[:2], amounts[:2])) == (None, None)
@@ -0,0 +1,93 @@
+"""Tests for loading trees pickled with the old nested-dict 'tree' attribute."""
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import DecisionTreeRegressor, RandomForestRegressor  # noqa: E402
+
+
+def dict_tree(tree, node_id=0):
+    """The nested-dict form older versions stored in DecisionTreeRegressor.tree"""
+    if tree.children_left_[node_id] == -1:
+        return {'value': float(tree.value_[node_id]), 'is_leaf': True}
+    return {
+        'feature': int(tree.feature_[node_id]),
+        'threshold': float(tree.threshold_[node_id]),
+        'left': dict_tree(tree, tree.children_left_[node_id]),
+        'right': dict_tree(tree, tree.children_right_[node_id]),
+        'is_leaf': False
+    }
+
+
+def predict_dict_tree(tree, X):
+    """Reference: the recursive per-row walk older versions predicted with"""
+    predictions = []
+    for sample in X:
+        node = tree
+        while not node['is_leaf']:
+            node = node['left'] if sample[node['feature']] <= node['threshold'] else node['right']
+        predictions.append(node['value'])
+    return np.array(predictions)
+
+
+class LegacyPickle:
+    """Pickles as an instance of cls whose state is the given attribute dict, as old versions wrote it"""
+    def __init__(self, cls, state):
+        self.cls = cls
+        self.state = state
+
+    def __reduce__(self):
+        return object.__new__, (self.cls,), self.state
+
+
+def legacy_tree_state(tree):
+    return {'max_depth': tree.max_depth, 'min_samples_split': tree.min_samples_split,
+            'random_state': tree.random_state, 'tree': dict_tree(tree)}
+
+
+def training_data(seed, n_samples=40, n_features=6):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n_samples, n_features)), rng.gamma(2.0, 4000.0, n_samples)
+
+
+def test_legacy_tree_pickle_predicts_like_dict_walk():
+    X, y = training_data(1)
+    fitted = DecisionTreeRegressor(max_depth=6).fit(X, y)
+    state = legacy_tree_state(fitted)
+
+    loaded = pickle.loads(pickle.dumps(LegacyPickle(DecisionTreeRegressor, state)))
+
+    assert not hasattr(loaded, 'tree')
+    assert loaded.node_count == fitted.node_count
+    X_new, _ = training_data(2)
+    np.testing.assert_array_equal(loaded.predict(X_new), predict_dict_tree(state['tree'], X_new))
+    np.testing.assert_array_equal(loaded.predict(X_new), fitted.predict(X_new))
+
+
+def test_legacy_leaf_only_tree():
+    state = {'max_depth': 10, 'min_samples_split': 2, 'random_state': 42, 'tree': {'value': 123.5, 'is_leaf': True}}
+
+    loaded = pickle.loads(pickle.dumps(LegacyPickle(DecisionTreeRegressor, state)))
+
+    np.testing.assert_array_equal(loaded.predict(np.zeros((3, 4))), [123.5, 123.5, 123.5])
+
+
+def test_legacy_forest_pickle_predicts_like_per_tree_average():
+    X, y = training_data(3)
+    forest = RandomForestRegressor(n_estimators=8, max_depth=5).fit(X, y)
+    legacy_trees = [LegacyPickle(DecisionTreeRegressor, legacy_tree_state(tree)) for tree in forest.trees]
+    state = {'n_estimators': 8, 'max_depth': 5, 'random_state': 42, 'trees': legacy_trees,
+             'feature_indices_per_tree': forest.feature_indices_per_tree}
+
+    loaded = pickle.loads(pickle.dumps(LegacyPickle(RandomForestRegressor, state)))
+
+    X_new, _ = training_data(4)
+    expected = np.mean([predict_dict_tree(dict_tree(tree), X_new[:, features])
+                        for tree, features in zip(forest.trees, forest.feature_indices_per_tree)], axis=0)
+    np.testing.assert_allclose(loaded.predict(X_new), expected, rtol=1e-12)
+    # Round trip in the current format keeps the same predictions
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(loaded)).predict(X_new), loaded.predict(X_new))
@@ -0,0 +1,114 @@
+"""Tests for migrating pickles written by the original forecast.py to the model file format."""
+import os
+import pickle
+import sys
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import (FEATURE_NAMES, DecisionTreeRegressor, LinearRegression, ModelStore,  # noqa: E402
+                      RandomForestRegressor, StandardScaler, build_feature_matrix)
+
+
+class LegacyPickle:
+    """Pickles as an instance of cls whose state is the given attribute dict, as the original code wrote it"""
+    def __init__(self, cls, state):
+        self.cls = cls
+        self.state = state
+
+    def __reduce__(self):
+        return object.__new__, (self.cls,), self.state
+
+
+def dict_tree(tree, node_id=0):
+    """The nested-dict form the original DecisionTreeRegressor stored in 'tree'"""
+    if tree.children_left_[node_id] == -1:
+        return {'value': float(tree.value_[node_id]), 'is_leaf': True}
+    return {'feature': int(tree.feature_[node_id]), 'threshold': float(tree.threshold_[node_id]),
+            'left': dict_tree(tree, tree.children_left_[node_id]),
+            'right': dict_tree(tree, tree.children_right_[node_id]), 'is_leaf': False}
+
+
+def training_features(seed=1, n_months=14):
+    rng = np.random.default_rng(seed)
+    months = np.datetime64('2023-01') + np.arange(n_months)
+    amounts = np.round(rng.gamma(2.0, 4000.0, n_months), 2)
+    return build_feature_matrix(amounts, months), amounts
+
+
+def legacy_scaler(features):
+    """A scaler as the original StandardScaler pickled it: mean_ and scale_ only"""
+    scale = features.std(axis=0)
+    return LegacyPickle(StandardScaler, {'mean_': features.mean(axis=0), 'scale_': np.where(scale == 0, 1.0, scale)})
+
+
+def legacy_model_data(model, model_name, scaler, n_rows):
+    return {'model': model, 'scaler': scaler, 'model_name': model_name, 'feature_names': list(FEATURE_NAMES),
+            'trained_at': datetime.now().isoformat(), 'data_points': n_rows,
+            'performance': {'mae': 1.0, 'mape': 2.0, 'rmse': 3.0, 'r2_score': 0.5}, 'user_id': 1, 'category_id': 2}
+
+
+def baseline_linear_pickle(features, targets):
+    scaler = legacy_scaler(features)
+    scaled = (features - scaler.state['mean_']) / scaler.state['scale_']
+    fitted = LinearRegression().fit(scaled, targets)
+    model = LegacyPickle(LinearRegression, {'coefficients_': fitted.coefficients_, 'intercept_': fitted.intercept_})
+    expected = scaled @ fitted.coefficients_ + fitted.intercept_
+    return legacy_model_data(model, 'linear', scaler, len(features)), expected
+
+
+def baseline_forest_pickle(features, targets):
+    scaler = legacy_scaler(features)
+    scaled = (features - scaler.state['mean_']) / scaler.state['scale_']
+    fitted = RandomForestRegressor(n_estimators=6, max_depth=5).fit(scaled, targets)
+    trees = [LegacyPickle(DecisionTreeRegressor, {'max_depth': 5, 'min_samples_split': 2, 'random_state': None,
+                                                  'tree': dict_tree(tree)}) for tree in fitted.trees]
+    model = LegacyPickle(RandomForestRegressor, {'n_estimators': 6, 'max_depth': 5, 'random_state': 42, 'trees': trees,
+                                                 'feature_indices_per_tree': fitted.feature_indices_per_tree})
+    return legacy_model_data(model, 'random_forest', scaler, len(features)), fitted.predict(scaled)
+
+
+def dump_pickle(model_data, path):
+    with open(path, 'wb') as f:
+        pickle.dump(model_data, f)
+
+
+def dump_joblib(model_data, path):
+    pytest.importorskip('joblib').dump(model_data, path)
+
+
+@pytest.mark.parametrize('dump', [dump_pickle, dump_joblib])
+@pytest.mark.parametrize('make_pickle', [baseline_linear_pickle, baseline_forest_pickle])
+def test_migrated_baseline_model_predicts_the_same(tmp_path, dump, make_pickle):
+    features, targets = training_features()
+    model_data, expected = make_pickle(features, targets)
+    dump(model_data, str(tmp_path / 'forecast_user_1_cat_2.pkl'))
+
+    store = ModelStore(str(tmp_path))
+    try:
+        stats = store.migrate()
+        migrated = store.get(1, 2)
+    finally:
+        store.close()
+
+    assert stats['migrated'] == 1 and stats['failed'] == []
+    assert os.listdir(tmp_path).count('forecast_user_1_cat_2.model') == 1
+    assert migrated['model_name'] == model_data['model_name']
+    assert migrated['data_points'] == len(features)
+    predictions = migrated['model'].predict(migrated['scaler'].transform(features))
+    np.testing.assert_allclose(predictions, expected, rtol=1e-12)
+
+
+def test_legacy_scaler_and_linear_get_defaults():
+    features, targets = training_features(2)
+    model_data, _ = baseline_linear_pickle(features, targets)
+
+    loaded = pickle.loads(pickle.dumps(model_data))
+
+    assert loaded['scaler'].n_samples_seen_ == 0 and loaded['scaler'].var_ is None
+    assert loaded['scaler'].dtype == np.float64
+    # Without the normal-equation statistics update_model asks for a retrain instead of folding in months
+    assert loaded['model'].xtx_ is None and loaded['model'].n_samples_ == 0
@@ -0,0 +1,56 @@
+"""Tests for parallel random forest training and vectorized forest prediction."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import RandomForestRegressor  # noqa: E402
+
+
+def training_data(seed, n_samples=36, n_features=15):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n_samples, n_features)), rng.gamma(2.0, 4000.0, n_samples)
+
+
+@pytest.mark.parametrize('n_jobs', [2, 3])
+def test_parallel_fit_matches_serial(n_jobs):
+    X, y = training_data(5)
+    serial = RandomForestRegressor(n_estimators=10, max_depth=6, n_jobs=1).fit(X, y)
+    parallel = RandomForestRegressor(n_estimators=10, max_depth=6, n_jobs=n_jobs).fit(X, y)
+
+    assert len(parallel.trees) == len(serial.trees)
+    for serial_tree, parallel_tree, serial_features, parallel_features in zip(
+            serial.trees, parallel.trees, serial.feature_indices_per_tree, parallel.feature_indices_per_tree):
+        np.testing.assert_array_equal(parallel_features, serial_features)
+        for name in ('feature_', 'threshold_', 'children_left_', 'children_right_', 'value_'):
+            np.testing.assert_array_equal(getattr(parallel_tree, name), getattr(serial_tree, name), err_msg=name)
+
+    X_new, _ = training_data(6)
+    np.testing.assert_array_equal(parallel.predict(X_new), serial.predict(X_new))
+
+
+def test_fit_does_not_depend_on_global_random_state():
+    X, y = training_data(7)
+    np.random.seed(0)
+    first = RandomForestRegressor(n_estimators=5, max_depth=4).fit(X, y).predict(X)
+    np.random.seed(1)
+    second = RandomForestRegressor(n_estimators=5, max_depth=4).fit(X, y).predict(X)
+
+    np.testing.assert_array_equal(first, second)
+
+
+def test_vectorized_predict_matches_per_tree_average():
+    X, y = training_data(8)
+    forest = RandomForestRegressor(n_estimators=12, max_depth=5).fit(X, y)
+    X_new, _ = training_data(9)
+
+    expected = np.zeros(len(X_new))
+    for tree, features in zip(forest.trees, forest.feature_indices_per_tree):
+        expected += tree.predict(X_new[:, features])
+    expected /= len(forest.trees)
+
+    np.testing.assert_allclose(forest.predict(X_new), expected, rtol=1e-12)
+    np.testing.assert_array_equal(forest.predict(X_new[3]), forest.predict(X_new)[3:4])
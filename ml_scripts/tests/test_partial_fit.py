@@ -0,0 +1,82 @@
+"""Tests that incremental model updates equal a full refit on all rows."""
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import ExpenseForecaster, LinearRegression, StandardScaler, build_feature_matrix  # noqa: E402
+
+
+def monthly_series(seed, n_months):
+    rng = np.random.default_rng(seed)
+    months = np.datetime64('2022-01') + np.arange(n_months)
+    return months, np.round(rng.gamma(2.0, 4000.0, n_months), 2)
+
+
+def test_scaler_partial_fit_matches_fit():
+    rng = np.random.default_rng(1)
+    X = rng.normal(5000.0, 2000.0, size=(30, 15))
+
+    scaler = StandardScaler().fit(X[:10])
+    for chunk in (X[10:11], X[11:25], X[25:]):
+        scaler.partial_fit(chunk)
+    full = StandardScaler().fit(X)
+
+    assert scaler.n_samples_seen_ == 30
+    np.testing.assert_allclose(scaler.mean_, full.mean_, rtol=1e-12)
+    np.testing.assert_allclose(scaler.var_, full.var_, rtol=1e-10)
+    np.testing.assert_allclose(scaler.transform(X), full.transform(X), rtol=1e-9, atol=1e-9)
+
+
+def test_linear_partial_fit_with_rescaled_inputs_matches_refit():
+    months, amounts = monthly_series(2, 24)
+    features = build_feature_matrix(amounts, months)
+
+    scaler = StandardScaler().fit(features[:14])
+    model = LinearRegression().fit(scaler.transform(features[:14]), amounts[:14])
+    old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+    scaler.partial_fit(features[14:])
+    model.rescale_inputs(old_mean, old_scale, scaler.mean_, scaler.scale_)
+    model.partial_fit(scaler.transform(features[14:]), amounts[14:])
+
+    full_scaler = StandardScaler().fit(features)
+    full_model = LinearRegression().fit(full_scaler.transform(features), amounts)
+    np.testing.assert_allclose(model.predict(scaler.transform(features)),
+                               full_model.predict(full_scaler.transform(features)), rtol=1e-6)
+
+
+def insert_months(conn, months, amounts):
+    conn.executemany("INSERT INTO expenses (user_id, category_id, amount, date) VALUES (1, 1, ?, ?)",
+                     [(float(amount), f'{month}-15') for month, amount in zip(months, amounts)])
+    conn.commit()
+
+
+def test_update_model_matches_retraining(tmp_path):
+    months, amounts = monthly_series(3, 18)
+    db_path = str(tmp_path / 'expenses.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category_id INTEGER, "
+                 "amount DECIMAL(10, 2), date DATE, updated_at TIMESTAMP NULL)")
+    insert_months(conn, months[:12], amounts[:12])
+
+    forecaster = ExpenseForecaster(db_path=db_path, model_storage_path=str(tmp_path / 'models'))
+    forecaster.models = {'linear': LinearRegression()}
+    try:
+        assert 'error' not in forecaster.forecast(1, 1)
+        insert_months(conn, months[12:], amounts[12:])
+
+        result = forecaster.update_model(1, 1)
+        updated = forecaster.load_model(1, 1)
+    finally:
+        forecaster.close()
+        conn.close()
+
+    assert result['updated'] and result['new_months'] == 6 and result['data_points'] == 18
+    features = build_feature_matrix(amounts, months)
+    full_scaler = StandardScaler().fit(features)
+    full_model = LinearRegression().fit(full_scaler.transform(features), amounts)
+    np.testing.assert_allclose(updated['model'].predict(updated['scaler'].transform(features)),
+                               full_model.predict(full_scaler.transform(features)), rtol=1e-6)
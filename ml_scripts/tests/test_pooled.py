@@ -0,0 +1,134 @@
+"""Tests for the series normalisation pooled models train and forecast on."""
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import (AMOUNT_FEATURES, FEATURE_NAMES, ExpenseForecaster, LinearRegression,  # noqa: E402
+                      build_feature_matrix, pooled_prediction_inputs, pooled_training_rows)
+
+AMOUNT_COLUMNS = [FEATURE_NAMES.index(name) for name in AMOUNT_FEATURES]
+OTHER_COLUMNS = [i for i in range(len(FEATURE_NAMES)) if i not in AMOUNT_COLUMNS]
+
+
+def monthly_series(seed, n_months, start='2023-01'):
+    rng = np.random.default_rng(seed)
+    months = np.datetime64(start) + np.arange(n_months)
+    return months, np.round(rng.gamma(2.0, 4000.0, n_months), 2)
+
+
+def test_training_rows_divide_by_mean_of_earlier_months():
+    months, amounts = monthly_series(1, 10)
+
+    features, targets, scales = pooled_training_rows(amounts, months)
+
+    expected_scales = [amounts[0]] + [np.mean(amounts[:t]) for t in range(1, len(amounts))]
+    np.testing.assert_allclose(scales, expected_scales, rtol=1e-12)
+    np.testing.assert_allclose(targets, amounts / scales, rtol=1e-12)
+    raw = build_feature_matrix(amounts, months)
+    np.testing.assert_allclose(features[:, AMOUNT_COLUMNS], raw[:, AMOUNT_COLUMNS] / scales[:, None], rtol=1e-12)
+    np.testing.assert_array_equal(features[:, OTHER_COLUMNS], raw[:, OTHER_COLUMNS])
+
+
+def test_training_rows_do_not_depend_on_series_size():
+    months, amounts = monthly_series(2, 8)
+
+    small = pooled_training_rows(amounts, months)
+    large = pooled_training_rows(amounts * 250.0, months)
+
+    np.testing.assert_allclose(large[0], small[0], rtol=1e-9)
+    np.testing.assert_allclose(large[1], small[1], rtol=1e-12)
+    np.testing.assert_allclose(large[2], small[2] * 250.0, rtol=1e-12)
+
+
+def test_zero_scales_become_one():
+    months = np.datetime64('2024-01') + np.arange(4)
+
+    _, targets, scales = pooled_training_rows([0.0, 0.0, 300.0, 150.0], months)
+
+    np.testing.assert_array_equal(scales, [1.0, 1.0, 1.0, 100.0])
+    np.testing.assert_array_equal(targets, [0.0, 0.0, 300.0, 1.5])
+
+
+def test_prediction_inputs_divide_by_series_mean():
+    months, amounts = monthly_series(3, 7)
+
+    features, normalized, scale = pooled_prediction_inputs(amounts, months)
+
+    assert scale == pytest.approx(np.mean(amounts), rel=1e-12)
+    np.testing.assert_allclose(normalized, amounts / scale, rtol=1e-12)
+    np.testing.assert_allclose(features, build_feature_matrix(amounts / scale, months), rtol=1e-12)
+    assert pooled_prediction_inputs(np.zeros(3), months[:3])[2] == 1.0
+
+
+def insert_series(conn, user_id, category_id, months, amounts):
+    conn.executemany("INSERT INTO expenses (user_id, category_id, amount, date) VALUES (?, ?, ?, ?)",
+                     [(user_id, category_id, float(amount), f'{month}-15') for month, amount in zip(months, amounts)])
+
+
+def test_pooled_forecast_scales_back_to_the_series(tmp_path):
+    db_path = str(tmp_path / 'expenses.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category_id INTEGER, "
+                 "amount DECIMAL(10, 2), date DATE, updated_at TIMESTAMP NULL)")
+    for user_id in (1, 2, 3):
+        insert_series(conn, user_id, 1, *monthly_series(user_id, 18))
+    # Too little history for a model of their own; the same series at ten times the size
+    months, amounts = monthly_series(4, 3, start='2024-04')
+    insert_series(conn, 4, 1, months, amounts)
+    insert_series(conn, 5, 1, months, amounts * 10)
+    conn.commit()
+    conn.close()
+
+    forecaster = ExpenseForecaster(db_path=db_path, model_storage_path=str(tmp_path / 'models'), pooled='category')
+    forecaster.models = {'linear': LinearRegression()}
+    try:
+        trained = forecaster.train_pooled()
+        small = forecaster.forecast(4, 1)
+        large = forecaster.forecast(5, 1)
+        pooled = forecaster.load_model(*forecaster._pooled_key(1))
+    finally:
+        forecaster.close()
+
+    assert trained['models'][0]['series'] == 3
+    assert small['method'] == large['method'] == 'Machine Learning (Pooled)'
+    assert small['data_points'] == 3
+    # The pooled model forecasts the series in units of its mean month; the result is scaled back
+    features, normalized, scale = pooled_prediction_inputs(amounts, months)
+    forecaster.scaler = pooled['scaler']
+    expected = forecaster.predict_horizon(pooled['model'], features, normalized)[0] * scale
+    assert small['prediction'] == pytest.approx(expected, rel=1e-9)
+    assert large['prediction'] == pytest.approx(small['prediction'] * 10, rel=1e-9)
+
+
+def test_stale_own_model_retrains_instead_of_using_pooled(tmp_path):
+    db_path = str(tmp_path / 'expenses.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category_id INTEGER, "
+                 "amount DECIMAL(10, 2), date DATE, updated_at TIMESTAMP NULL)")
+    for user_id in (1, 2, 3):
+        insert_series(conn, user_id, 1, *monthly_series(user_id, 18))
+    conn.commit()
+    conn.close()
+
+    forecaster = ExpenseForecaster(db_path=db_path, model_storage_path=str(tmp_path / 'models'), pooled='category')
+    forecaster.models = {'linear': LinearRegression()}
+    try:
+        forecaster.train_pooled()
+        assert forecaster.forecast(1, 1, force_retrain=True)['method'] == 'Machine Learning (Fresh)'
+        model_path = forecaster.model_store.info(1, 1)['path']
+        stale = os.stat(model_path).st_mtime - 10 * 86400
+        os.utime(model_path, (stale, stale))
+        forecaster.model_store.delete(2, 1)
+
+        stale_result = forecaster.forecast(1, 1)
+        missing_result = forecaster.forecast(2, 1)
+    finally:
+        forecaster.close()
+
+    assert stale_result['method'] == 'Machine Learning (Fresh)'
+    assert missing_result['method'] == 'Machine Learning (Pooled)'
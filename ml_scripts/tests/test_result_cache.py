@@ -0,0 +1,69 @@
+"""Tests for the forecast result cache and the fingerprints it is keyed by."""
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import ExpenseForecaster, LinearRegression  # noqa: E402
+
+
+def expenses_db(tmp_path, pairs):
+    db_path = str(tmp_path / 'expenses.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category_id INTEGER, "
+                 "amount DECIMAL(10, 2), date DATE, updated_at TIMESTAMP NULL)")
+    rng = np.random.default_rng(1)
+    for user_id, category_id in pairs:
+        months = np.datetime64('2023-01') + np.arange(14)
+        conn.executemany("INSERT INTO expenses (user_id, category_id, amount, date, updated_at) VALUES (?, ?, ?, ?, ?)",
+                         [(user_id, category_id, float(amount), f'{month}-15', f'{month}-20 10:00:00')
+                          for month, amount in zip(months, np.round(rng.gamma(2.0, 4000.0, 14), 2))])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def make_forecaster(tmp_path, db_path):
+    forecaster = ExpenseForecaster(db_path=db_path, model_storage_path=str(tmp_path / 'models'),
+                                   result_cache_bytes=1024 * 1024)
+    forecaster.models = {'linear': LinearRegression()}
+    return forecaster
+
+
+def test_training_results_are_not_replayed(tmp_path):
+    forecaster = make_forecaster(tmp_path, expenses_db(tmp_path, [(1, 1)]))
+    try:
+        results = [forecaster.forecast(1, 1) for _ in range(3)]
+        hits = forecaster.result_cache.hits
+    finally:
+        forecaster.close()
+
+    assert [result['method'] for result in results] == ['Machine Learning (Fresh)'] + ['Machine Learning (Cached)'] * 2
+    assert 'model_selection' not in results[2]
+    assert hits == 1
+    assert results[2] == results[1]
+
+
+def test_batch_fingerprints_match_per_pair_query(tmp_path):
+    pairs = [(1, 1), (1, 2), (2, 1)]
+    forecaster = make_forecaster(tmp_path, expenses_db(tmp_path, pairs))
+    try:
+        expected = {pair: forecaster.get_data_fingerprint(*pair) for pair in pairs}
+        series = forecaster.get_monthly_series_batch()
+        assert {pair: series[pair].fingerprint for pair in pairs} == expected
+
+        # Batch forecasts take the fingerprints from the batch query instead of one query per pair
+        list(forecaster.forecast_batch())
+        fingerprint_queries = []
+        fetch_rows = forecaster._fetch_rows
+        forecaster._fetch_rows = lambda conn, query, params: fingerprint_queries.append(query) or fetch_rows(
+            conn, query, params)
+        results = list(forecaster.forecast_batch())
+    finally:
+        forecaster.close()
+
+    assert [result['method'] for result in results] == ['Machine Learning (Cached)'] * 3
+    assert not [query for query in fingerprint_queries if 'MAX(e.id)' in query]
@@ -0,0 +1,81 @@
+"""Tests for the prefix-sum split search against the original exhaustive threshold scan."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from forecast import DecisionTreeRegressor  # noqa: E402
+
+
+def mse(y):
+    return np.mean((y - np.mean(y)) ** 2) if len(y) else 0
+
+
+def exhaustive_split(X, y, feature_indices, min_samples_split):
+    """Reference: the per-threshold scan _find_best_split used before the prefix-sum rewrite"""
+    best_feature, best_threshold, best_reduction = None, None, -np.inf
+    for feature_idx in feature_indices:
+        for threshold in np.unique(X[:, feature_idx]):
+            left_mask = X[:, feature_idx] <= threshold
+            right_mask = ~left_mask
+            if np.sum(left_mask) < min_samples_split or np.sum(right_mask) < min_samples_split:
+                continue
+            weighted_mse = (np.sum(left_mask) * mse(y[left_mask]) + np.sum(right_mask) * mse(y[right_mask])) / len(y)
+            reduction = mse(y) - weighted_mse
+            if reduction > best_reduction:
+                best_feature, best_threshold, best_reduction = feature_idx, threshold, reduction
+    return best_feature, best_threshold, best_reduction
+
+
+def reduction_of(X, y, feature_idx, threshold):
+    left_mask = X[:, feature_idx] <= threshold
+    return mse(y) - (np.sum(left_mask) * mse(y[left_mask]) + np.sum(~left_mask) * mse(y[~left_mask])) / len(y)
+
+
+@pytest.mark.parametrize('n_samples', [2, 3, 5, 12, 40])
+@pytest.mark.parametrize('min_samples_split', [2, 3])
+def test_matches_exhaustive_scan(n_samples, min_samples_split):
+    rng = np.random.default_rng(n_samples * 10 + min_samples_split)
+    tree = DecisionTreeRegressor(min_samples_split=min_samples_split)
+    for _ in range(25):
+        X = rng.normal(size=(n_samples, 5))
+        y = rng.gamma(2.0, 4000.0, n_samples)
+        features = sorted(rng.choice(5, size=3, replace=False).tolist())
+
+        expected_feature, expected_threshold, _ = exhaustive_split(X, y, features, min_samples_split)
+
+        assert tree._find_best_split(X, y, features) == (expected_feature, expected_threshold)
+
+
+def test_tied_values_reach_the_best_reduction():
+    # Month-like features repeat values, so many thresholds tie or nearly tie
+    rng = np.random.default_rng(3)
+    tree = DecisionTreeRegressor()
+    for _ in range(50):
+        X = rng.integers(1, 6, size=(15, 4)).astype(float)
+        y = np.round(rng.gamma(2.0, 4000.0, 15), 2)
+
+        expected_feature, _, expected_reduction = exhaustive_split(X, y, range(4), 2)
+        feature, threshold = tree._find_best_split(X, y, range(4))
+
+        if expected_feature is None:
+            assert feature is None
+            continue
+        assert reduction_of(X, y, feature, threshold) == pytest.approx(expected_reduction, rel=1e-9, abs=1e-9)
+
+
+def test_rows_select_a_sample_without_copying():
+    rng = np.random.default_rng(11)
+    X = rng.normal(size=(30, 6))
+    y = rng.gamma(2.0, 4000.0, 30)
+    rows = rng.integers(0, 30, size=30)
+    tree = DecisionTreeRegressor()
+
+    assert tree._find_best_split(X, y[rows], range(6), rows) == tree._find_best_split(X[rows], y[rows], range(6))
+
+    sampled = DecisionTreeRegressor(max_depth=4).fit(X, y, rows=rows, features=[1, 3, 5])
+    copied = DecisionTreeRegressor(max_depth=4).fit(X[np.ix_(rows, [1, 3, 5])], y[rows])
+    np.testing.assert_array_equal(sampled.predict(X[:, [1, 3, 5]]), copied.predict(X[:, [1, 3, 5]]))
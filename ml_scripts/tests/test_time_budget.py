@@ -0,0 +1,52 @@
+"""Tests for time-budgeted model selection."""
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import forecast  # noqa: E402
+from forecast import ExpenseForecaster, build_feature_matrix  # noqa: E402
+
+
+def training_data(seed=1, n_months=24):
+    rng = np.random.default_rng(seed)
+    months = np.datetime64('2022-01') + np.arange(n_months)
+    amounts = np.round(rng.gamma(2.0, 4000.0, n_months), 2)
+    return build_feature_matrix(amounts, months), amounts
+
+
+def test_budget_below_worker_cost_runs_floor_model_inline(tmp_path, monkeypatch):
+    monkeypatch.setitem(forecast._WORKER_COST_MS, 'start', 40.0)
+    monkeypatch.setitem(forecast._WORKER_COST_MS, 'stop', 5.0)
+
+    def no_process(*args, **kwargs):
+        raise AssertionError('no worker process should start')
+    monkeypatch.setattr(multiprocessing, 'Process', no_process)
+
+    forecaster = ExpenseForecaster(db_path=':memory:', model_storage_path=str(tmp_path))
+    features, targets = training_data()
+    model, model_name = forecaster.train_models(features, targets, time_budget_ms=50)
+
+    assert model is not None and model_name == ExpenseForecaster.FLOOR_MODEL
+    assert forecaster.selection_report['finished'] == [ExpenseForecaster.FLOOR_MODEL]
+    assert forecaster.selection_report['timed_out'] == ['random_forest', 'gradient_boosting']
+
+
+def test_generous_budget_finishes_every_candidate(tmp_path, monkeypatch):
+    monkeypatch.setitem(forecast._WORKER_COST_MS, 'start', None)
+    monkeypatch.setitem(forecast._WORKER_COST_MS, 'stop', None)
+    forecaster = ExpenseForecaster(db_path=':memory:', model_storage_path=str(tmp_path))
+    features, targets = training_data()
+
+    budgeted = forecaster.train_models(features, targets, time_budget_ms=60000)
+    report = forecaster.selection_report
+    unbudgeted = forecaster.train_models(features, targets, time_budget_ms=None)
+
+    assert report['timed_out'] == [] and sorted(report['finished']) == sorted(forecaster.models)
+    assert forecast._WORKER_COST_MS['start'] is not None
+    assert budgeted[1] == unbudgeted[1]
+    np.testing.assert_allclose(budgeted[0].predict(forecaster.scaler.transform(features)),
+                               unbudgeted[0].predict(forecaster.scaler.transform(features)), rtol=1e-9)
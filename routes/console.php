@@ -1,8 +1,59 @@
 <?php
 
+use App\Models\User;
+use App\Services\MLForecastService;
 use Illuminate\Foundation\Inspiring;
 use Illuminate\Support\Facades\Artisan;
+use Illuminate\Support\Facades\Schedule;
 
 Artisan::command('inspire', function () {
     $this->comment(Inspiring::quote());
 })->purpose('Display an inspiring quote');
+
+Artisan::command('ml:refresh-monthly-totals', function (MLForecastService $forecastService) {
+    $result = $forecastService->refreshMonthlyTotals();
+    if ($result === null) {
+        $this->error('Monthly totals refresh failed, see the log');
+        return 1;
+    }
+    $this->info("Folded in {$result['changed_rows']} changed and {$result['deleted_rows']} deleted expenses ({$result['buckets_updated']} months updated)");
+    return 0;
+})->purpose('Update the monthly category totals used by ML forecasts');
+
+Artisan::command('ml:backtest {--missing : Only users whose cached metrics were cleared or never computed}', function (MLForecastService $forecastService) {
+    $refreshed = 0;
+    $failed = 0;
+    foreach (User::has('expenses')->cursor() as $user) {
+        if ($this->option('missing') && $forecastService->getBacktestPerformance($user) !== null) {
+            continue;
+        }
+        if ($forecastService->refreshBacktestPerformance($user) === null) {
+            $failed++;
+        } else {
+            $refreshed++;
+        }
+    }
+    $this->info("Backtested {$refreshed} user(s), {$failed} failed");
+    return $failed > 0 ? 1 : 0;
+})->purpose('Compute the backtest metrics shown on the ML accuracy dashboard');
+
+Artisan::command('ml:train-pooled', function (MLForecastService $forecastService) {
+    if ($forecastService->pooledScope() === null) {
+        $this->error('Pooled mode is off, set ML_FORECAST_POOLED to category or global');
+        return 1;
+    }
+    $result = $forecastService->trainPooledModels();
+    if ($result === null) {
+        $this->error('Pooled model training failed, see the log');
+        return 1;
+    }
+    $pairs = $result['pairs'];
+    $this->info("Trained " . count($result['models']) . " pooled {$result['scope']} model(s): {$pairs['pooled']} pairs use them, {$pairs['per_pair']} keep their own model");
+    return 0;
+})->purpose('Train the pooled cross-user forecast models and prune per-pair models they beat');
+
+Schedule::command('ml:refresh-monthly-totals')->everyFifteenMinutes()->withoutOverlapping();
+Schedule::command('ml:backtest')->daily()->withoutOverlapping();
+Schedule::command('ml:backtest --missing')->everyFifteenMinutes()->withoutOverlapping();
+Schedule::command('ml:train-pooled')->daily()->withoutOverlapping()
+    ->when(fn () => (bool) config('services.ml_forecast.pooled'));